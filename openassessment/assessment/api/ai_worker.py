@@ -33,6 +33,7 @@ def get_grading_task_params(grading_workflow_uuid):
         dict with keys:
             * essay_text (unicode): The text of the essay submission.
             * classifier_set (dict): Maps criterion names to serialized classifiers.
+            * classifier_set_id (int): Identifies the classifier set, which never changes once created.
             * valid_scores (dict): Maps criterion names to a list of valid scores for that criterion.
             * algorithm_id (unicode): ID of the algorithm used to perform training.
 
@@ -71,6 +72,7 @@ def get_grading_task_params(grading_workflow_uuid):
         return {
             'essay_text': workflow.essay_text,
             'classifier_set': workflow.classifier_set.classifier_data_by_criterion,
+            'classifier_set_id': workflow.classifier_set_id,
             'algorithm_id': workflow.algorithm_id,
             'valid_scores': workflow.classifier_set.valid_scores_by_criterion,
         }
@@ -86,6 +88,102 @@ def get_grading_task_params(grading_workflow_uuid):
         raise AIGradingInternalError(msg)
 
 
+@dog_stats_api.timed('openassessment.assessment.ai.get_grading_task_params_batch')
+def get_grading_task_params_batch(grading_workflow_uuids):
+    """
+    Retrieve the essays, classifier set, and algorithm ID
+    for a batch of grading workflows that share a classifier set.
+
+    Workflows that are already complete are left out of the batch.
+
+    Args:
+        grading_workflow_uuids (list of str): The UUIDs of the grading workflows.
+
+    Returns:
+        dict with keys:
+            * essays (dict): Maps workflow UUIDs to the text of their essay submissions.
+            * classifier_set (dict): Maps criterion names to serialized classifiers.
+            * classifier_set_id (int): Identifies the classifier set, which never changes once created.
+            * valid_scores (dict): Maps criterion names to a list of valid scores for that criterion.
+            * algorithm_id (unicode): ID of the algorithm used to perform training.
+
+        If every workflow is already complete, `essays` is empty
+        and the other values are None.
+
+    Raises:
+        AIGradingRequestError
+        AIGradingInternalError
+
+    """
+    try:
+        workflows = list(
+            AIGradingWorkflow.objects.filter(uuid__in=grading_workflow_uuids).select_related('classifier_set')
+        )
+    except DatabaseError as ex:
+        msg = (
+            u"An unexpected error occurred while retrieving the "
+            u"AI grading workflows with uuids {uuids}: {ex}"
+        ).format(uuids=grading_workflow_uuids, ex=ex)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+
+    missing_uuids = set(grading_workflow_uuids) - set(workflow.uuid for workflow in workflows)
+    if missing_uuids:
+        msg = (
+            u"Could not retrieve the AI grading workflows with uuids {}"
+        ).format(sorted(missing_uuids))
+        raise AIGradingRequestError(msg)
+
+    workflows = [workflow for workflow in workflows if not workflow.is_complete]
+    if not workflows:
+        return {
+            'essays': {},
+            'classifier_set': None,
+            'classifier_set_id': None,
+            'algorithm_id': None,
+            'valid_scores': None,
+        }
+
+    # As for a single workflow, a missing classifier set means the task
+    # was scheduled too early, so we kill the task.
+    if any(workflow.classifier_set_id is None for workflow in workflows):
+        msg = (
+            u"AI grading workflows with UUIDs {} include a workflow "
+            u"with no classifier set, but were scheduled for grading"
+        ).format(grading_workflow_uuids)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+
+    classifier_set_ids = set(workflow.classifier_set_id for workflow in workflows)
+    algorithm_ids = set(workflow.algorithm_id for workflow in workflows)
+    if len(classifier_set_ids) > 1 or len(algorithm_ids) > 1:
+        msg = (
+            u"AI grading workflows with UUIDs {} do not share "
+            u"a classifier set and algorithm, so they cannot be graded together"
+        ).format(grading_workflow_uuids)
+        raise AIGradingRequestError(msg)
+
+    classifier_set = workflows[0].classifier_set
+    try:
+        return {
+            'essays': {workflow.uuid: workflow.essay_text for workflow in workflows},
+            'classifier_set': classifier_set.classifier_data_by_criterion,
+            'classifier_set_id': classifier_set.pk,
+            'algorithm_id': workflows[0].algorithm_id,
+            'valid_scores': classifier_set.valid_scores_by_criterion,
+        }
+    except (
+        DatabaseError, ClassifierSerializeError, IncompleteClassifierSet,
+        ValueError, IOError, HTTPException
+    ) as ex:
+        msg = (
+            u"An unexpected error occurred while retrieving "
+            u"classifiers for the grading workflows with UUIDs {uuids}: {ex}"
+        ).format(uuids=grading_workflow_uuids, ex=ex)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+
+
 @dog_stats_api.timed('openassessment.assessment.ai.create_assessment')
 def create_assessment(grading_workflow_uuid, criterion_scores):
     """
@@ -149,6 +247,124 @@ def create_assessment(grading_workflow_uuid, criterion_scores):
     assessment_complete_signal.send(sender=None, submission_uuid=workflow.submission_uuid)
 
 
+@dog_stats_api.timed('openassessment.assessment.ai.create_assessments_batch')
+def create_assessments_batch(scores_by_workflow_uuid):
+    """
+    Create AI assessments for a batch of grading workflows
+    in a single transaction (complete the AI grading tasks).
+
+    Workflows whose scores don't match their rubric are logged and skipped,
+    so that one invalid workflow doesn't prevent us from completing the others.
+
+    Args:
+        scores_by_workflow_uuid (dict): Maps grading workflow UUIDs to
+            dictionaries mapping criteria names to integer scores.
+
+    Returns:
+        None
+
+    Raises:
+        AIGradingRequestError
+        AIGradingInternalError
+
+    """
+    workflow_uuids = scores_by_workflow_uuid.keys()
+    try:
+        workflows = list(AIGradingWorkflow.objects.filter(uuid__in=workflow_uuids))
+    except DatabaseError as ex:
+        msg = (
+            u"An unexpected error occurred while retrieving the "
+            u"AI grading workflows with uuids {uuids}: {ex}"
+        ).format(uuids=workflow_uuids, ex=ex)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+
+    missing_uuids = set(workflow_uuids) - set(workflow.uuid for workflow in workflows)
+    if missing_uuids:
+        msg = (
+            u"Could not retrieve the AI grading workflows with uuids {}"
+        ).format(sorted(missing_uuids))
+        raise AIGradingRequestError(msg)
+
+    # As for a single workflow, skip workflows that have already
+    # been marked complete (perhaps by another worker).
+    for workflow in workflows:
+        if workflow.is_complete:
+            msg = u"Grading workflow with UUID {} is already marked complete".format(workflow.uuid)
+            logger.info(msg)
+    workflows = [workflow for workflow in workflows if not workflow.is_complete]
+
+    # Check the scores against the rubric before we start the transaction.
+    # Workflows in a batch usually share a rubric, so we share the rubric
+    # (and its index of criteria and options) between them.
+    rubrics = dict()
+    valid_workflows = []
+    try:
+        for workflow in workflows:
+            if workflow.rubric_id not in rubrics:
+                rubrics[workflow.rubric_id] = workflow.rubric
+            workflow.rubric = rubrics[workflow.rubric_id]
+            try:
+                _validate_option_points(workflow.rubric, scores_by_workflow_uuid[workflow.uuid])
+            except InvalidRubricSelection as ex:
+                msg = (
+                    u"The scores for the AI grading workflow with UUID {uuid} "
+                    u"do not match the rubric and will not be saved: {ex}"
+                ).format(uuid=workflow.uuid, ex=ex)
+                logger.exception(msg)
+            else:
+                valid_workflows.append(workflow)
+    except DatabaseError as ex:
+        msg = (
+            u"An unexpected error occurred while retrieving the rubrics "
+            u"for AI grading workflows with uuids {uuids}: {ex}"
+        ).format(uuids=workflow_uuids, ex=ex)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+    workflows = valid_workflows
+
+    try:
+        AIGradingWorkflow.complete_batch(workflows, scores_by_workflow_uuid)
+    except (DatabaseError, InvalidRubricSelection) as ex:
+        msg = (
+            u"An unexpected error occurred while creating the assessments "
+            u"for AI grading workflows with uuids {uuids}: {ex}"
+        ).format(uuids=workflow_uuids, ex=ex)
+        logger.exception(msg)
+        raise AIGradingInternalError(msg)
+
+    # Fire the signals only once the transaction has committed,
+    # so the workflow API sees every assessment in the batch.
+    from openassessment.assessment.signals import assessment_complete_signal
+    for workflow in workflows:
+        logger.info((
+            u"Created assessment for AI grading workflow with UUID {workflow_uuid} "
+            u"(algorithm ID {algorithm_id})"
+        ).format(workflow_uuid=workflow.uuid, algorithm_id=workflow.algorithm_id))
+        assessment_complete_signal.send(sender=None, submission_uuid=workflow.submission_uuid)
+
+
+def _validate_option_points(rubric, criterion_scores):
+    """
+    Check that the rubric has an option with the specified points
+    for each criterion.
+
+    Args:
+        rubric (Rubric): The rubric to check.
+        criterion_scores (dict): Dictionary mapping criteria names to integer scores.
+
+    Returns:
+        None
+
+    Raises:
+        InvalidRubricSelection
+        DatabaseError
+
+    """
+    for criterion_name, option_points in criterion_scores.iteritems():
+        rubric.index.find_option_for_points(criterion_name, option_points)
+
+
 @dog_stats_api.timed('openassessment.assessment.ai.get_training_task_params')
 def get_training_task_params(training_workflow_uuid):
     """
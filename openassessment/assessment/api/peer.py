@@ -7,6 +7,7 @@ the workflow for a given submission.
 import logging
 from django.utils import timezone
 from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count
 from dogapi import dog_stats_api
 
 from openassessment.assessment.models import (
@@ -21,6 +22,7 @@ from openassessment.assessment.serializers import (
 from openassessment.assessment.errors import (
     PeerAssessmentRequestError, PeerAssessmentWorkflowError, PeerAssessmentInternalError
 )
+from openassessment.assessment.signals import assessment_created_signal
 from submissions import api as sub_api
 
 logger = logging.getLogger("openassessment.assessment.api.peer")
@@ -94,6 +96,99 @@ def assessment_is_finished(submission_uuid, requirements):
     return scored_items.count() >= requirements["must_be_graded_by"]
 
 
+def submitter_is_finished_bulk(submission_uuids, requirements):
+    """
+    Check whether each submitter has made the required number of assessments.
+
+    This is equivalent to calling `submitter_is_finished` for each submission,
+    but uses a fixed number of database queries.
+
+    Args:
+        submission_uuids (list of str): The UUIDs of the submissions being tracked.
+        requirements (dict): Dictionary with the key "must_grade" indicating
+            the required number of submissions the student must grade.
+
+    Returns:
+        dict mapping submission UUIDs to bools
+
+    """
+    finished = {submission_uuid: False for submission_uuid in submission_uuids}
+    if requirements is None or not submission_uuids:
+        return finished
+
+    workflows = list(PeerWorkflow.objects.filter(submission_uuid__in=submission_uuids))
+    incomplete_ids = []
+    for workflow in workflows:
+        if workflow.completed_at is not None:
+            finished[workflow.submission_uuid] = True
+        else:
+            incomplete_ids.append(workflow.id)
+
+    if incomplete_ids:
+        num_graded = {
+            row['scorer']: row['num_graded']
+            for row in PeerWorkflowItem.objects.filter(
+                scorer__in=incomplete_ids, assessment__isnull=False
+            ).order_by().values('scorer').annotate(num_graded=Count('id'))
+        }
+        newly_completed_ids = [
+            workflow.id for workflow in workflows
+            if workflow.id in incomplete_ids
+            and num_graded.get(workflow.id, 0) >= requirements["must_grade"]
+        ]
+        if newly_completed_ids:
+            PeerWorkflow.objects.filter(pk__in=newly_completed_ids).update(
+                completed_at=timezone.now()
+            )
+        for workflow in workflows:
+            if workflow.id in newly_completed_ids:
+                finished[workflow.submission_uuid] = True
+
+    return finished
+
+
+def assessment_is_finished_bulk(submission_uuids, requirements):
+    """
+    Check whether each submission has received enough assessments
+    to get a score.
+
+    This is equivalent to calling `assessment_is_finished` for each submission,
+    but uses a fixed number of database queries.
+
+    Args:
+        submission_uuids (list of str): The UUIDs of the submissions being tracked.
+        requirements (dict): Dictionary with the key "must_be_graded_by"
+            indicating the required number of assessments the student
+            must receive to get a score.
+
+    Returns:
+        dict mapping submission UUIDs to bools
+
+    """
+    finished = {submission_uuid: False for submission_uuid in submission_uuids}
+    if requirements is None or not submission_uuids:
+        return finished
+
+    workflow_uuids = PeerWorkflow.objects.filter(
+        submission_uuid__in=submission_uuids
+    ).values_list('submission_uuid', flat=True)
+    num_scored = {submission_uuid: 0 for submission_uuid in workflow_uuids}
+
+    scored_items = PeerWorkflowItem.objects.filter(
+        author__submission_uuid__in=submission_uuids,
+        assessment__score_type=PEER_TYPE
+    ).order_by().values(
+        'author__submission_uuid', 'assessment__submission_uuid'
+    ).annotate(num_items=Count('id'))
+    for row in scored_items:
+        if row['author__submission_uuid'] == row['assessment__submission_uuid']:
+            num_scored[row['author__submission_uuid']] += row['num_items']
+
+    for submission_uuid, count in num_scored.iteritems():
+        finished[submission_uuid] = count >= requirements["must_be_graded_by"]
+    return finished
+
+
 def on_start(submission_uuid):
     """Create a new peer workflow for a student item and submission.
 
@@ -135,6 +230,45 @@ def on_start(submission_uuid):
         raise PeerAssessmentInternalError(error_message)
 
 
+def on_start_bulk(submission_uuids):
+    """Create peer workflows for many submissions at once.
+
+    This is equivalent to calling `on_start` for each submission, but the
+    existing peer workflows are loaded in a single query, so only submissions
+    that do not yet have a peer workflow require additional queries.
+
+    Args:
+        submission_uuids (list of str): The submissions to create workflows for.
+
+    Returns:
+        None
+
+    Raises:
+        SubmissionError: There was an error retrieving a submission.
+        PeerAssessmentInternalError: Raised when there is an internal error
+            creating a Workflow.
+
+    """
+    try:
+        existing_uuids = set(
+            PeerWorkflow.objects.filter(
+                submission_uuid__in=submission_uuids
+            ).values_list('submission_uuid', flat=True)
+        )
+    except DatabaseError:
+        error_message = (
+            u"An internal error occurred while retrieving peer "
+            u"workflows for submissions {}"
+            .format(submission_uuids)
+        )
+        logger.exception(error_message)
+        raise PeerAssessmentInternalError(error_message)
+
+    for submission_uuid in submission_uuids:
+        if submission_uuid not in existing_uuids:
+            on_start(submission_uuid)
+
+
 def get_score(submission_uuid, requirements):
     """
     Retrieve a score for a submission if requirements have been satisfied.
@@ -168,27 +302,30 @@ def get_score(submission_uuid, requirements):
         assessment__score_type=PEER_TYPE
     ).order_by('-assessment')
 
-    submission_finished = items.count() >= requirements["must_be_graded_by"]
+    # Retrieving only the items we need tells us whether there are enough
+    # of them, so we don't need a separate count query.
+    num_required = requirements["must_be_graded_by"]
+    scored_items = list(items.select_related('assessment__rubric')[:num_required])
+    submission_finished = len(scored_items) >= num_required
     if not submission_finished:
         return None
 
-    # Unfortunately, we cannot use update() after taking a slice,
-    # so we need to update the and save the items individually.
-    # One might be tempted to first query for the first n assessments,
-    # then select items that have those assessments.
-    # However, this generates a SQL query with a LIMIT in a subquery,
-    # which is not supported by some versions of MySQL.
-    # Although this approach generates more database queries, the number is likely to
-    # be relatively small (at least 1 and very likely less than 5).
-    for scored_item in items[:requirements["must_be_graded_by"]]:
-        scored_item.scored = True
-        scored_item.save()
+    # We cannot use update() after taking a slice, and a subquery with a LIMIT
+    # is not supported by some versions of MySQL, so we update the items
+    # we already retrieved by primary key.
+    PeerWorkflowItem.objects.filter(
+        pk__in=[item.pk for item in scored_items], scored=False
+    ).update(scored=True)
+
+    # The serialized rubric is usually cached, which saves us
+    # from querying every criterion's options to find the points possible.
+    rubric_dict = RubricSerializer.serialized_from_cache(scored_items[0].assessment.rubric)
 
     return {
         "points_earned": sum(
             get_assessment_median_scores(submission_uuid).values()
         ),
-        "points_possible": items[0].assessment.points_possible,
+        "points_possible": rubric_dict["points_possible"],
     }
 
 
@@ -272,6 +409,11 @@ def create_assessment(
         )
 
         _log_assessment(assessment, scorer_workflow)
+
+        # Both the scorer's and the author's workflows may have changed
+        assessment_created_signal.send(sender=None, submission_uuid=scorer_submission_uuid)
+        assessment_created_signal.send(sender=None, submission_uuid=peer_submission_uuid)
+
         return full_assessment_dict(assessment)
     except PeerWorkflow.DoesNotExist:
         message = (
@@ -425,9 +567,8 @@ def get_assessment_median_scores(submission_uuid):
     """
     try:
         workflow = PeerWorkflow.objects.get(submission_uuid=submission_uuid)
-        items = workflow.graded_by.filter(scored=True)
-        assessments = [item.assessment for item in items]
-        scores = Assessment.scores_by_criterion(assessments)
+        assessment_ids = workflow.graded_by.filter(scored=True).values_list('assessment', flat=True)
+        scores = Assessment.scores_by_criterion_for_ids(assessment_ids)
         return Assessment.get_median_score_dict(scores)
     except DatabaseError:
         error_message = (
@@ -823,7 +964,7 @@ def set_assessment_feedback(feedback_dict):
         # If we receive an integrity error, assume that someone else is trying to create
         # another feedback model for this submission, and raise an exception.
         if submission_uuid:
-            feedback, created = AssessmentFeedback.objects.get_or_create(submission_uuid=submission_uuid)
+            feedback, __ = AssessmentFeedback.objects.get_or_create(submission_uuid=submission_uuid)
         else:
             error_message = u"An error occurred creating assessment feedback: bad or missing submission_uuid."
             logger.error(error_message)
@@ -834,8 +975,9 @@ def set_assessment_feedback(feedback_dict):
             feedback.feedback_text = feedback_text
 
         # Save the feedback model.  We need to do this before setting m2m relations.
-        if created or feedback_text is not None:
-            feedback.save()
+        # We always save, so the modification time reflects changes to the options.
+        feedback.modified = timezone.now()
+        feedback.save()
 
         # Associate the feedback with selected options
         feedback.add_options(selected_options)
@@ -15,6 +15,7 @@ from openassessment.assessment.models import (
 from openassessment.assessment.errors import (
     SelfAssessmentRequestError, SelfAssessmentInternalError
 )
+from openassessment.assessment.signals import assessment_created_signal
 
 
 # Assessments are tagged as "self-evaluation"
@@ -62,6 +63,44 @@ def assessment_is_finished(submission_uuid, requirements):
     return submitter_is_finished(submission_uuid, requirements)
 
 
+def submitter_is_finished_bulk(submission_uuids, requirements):
+    """
+    Check whether self-assessments have been completed for many submissions.
+
+    This is equivalent to calling `submitter_is_finished` for each submission,
+    but uses a single database query.
+
+    Args:
+        submission_uuids (list of str): The unique identifiers of the submissions.
+        requirements (dict): Not used.
+    Returns:
+        dict mapping submission UUIDs to bools
+    """
+    assessed_uuids = set(
+        Assessment.objects.filter(
+            score_type=SELF_TYPE, submission_uuid__in=submission_uuids
+        ).values_list('submission_uuid', flat=True)
+    ) if submission_uuids else set()
+    return {
+        submission_uuid: submission_uuid in assessed_uuids
+        for submission_uuid in submission_uuids
+    }
+
+
+def assessment_is_finished_bulk(submission_uuids, requirements):
+    """
+    Check whether self-assessments have been completed for many submissions.
+    For self-assessment, this function is synonymous with submitter_is_finished_bulk.
+
+    Args:
+        submission_uuids (list of str): The unique identifiers of the submissions.
+        requirements (dict): Not used.
+    Returns:
+        dict mapping submission UUIDs to bools
+    """
+    return submitter_is_finished_bulk(submission_uuids, requirements)
+
+
 def get_score(submission_uuid, requirements):
     """
     Get the score for this particular assessment.
@@ -162,6 +201,7 @@ def create_assessment(
             scored_at
         )
         _log_assessment(assessment, submission)
+        assessment_created_signal.send(sender=None, submission_uuid=submission_uuid)
     except InvalidRubric as ex:
         msg = "Invalid rubric definition: " + str(ex)
         logger.warning(msg, exc_info=True)
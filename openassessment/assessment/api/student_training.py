@@ -19,6 +19,7 @@ from openassessment.assessment.serializers import (
 from openassessment.assessment.errors import (
     StudentTrainingRequestError, StudentTrainingInternalError
 )
+from openassessment.assessment.signals import assessment_created_signal
 
 
 logger = logging.getLogger(__name__)
@@ -440,6 +441,7 @@ def assess_training_example(submission_uuid, options_selected, update_workflow=T
         # matches the instructor's selection
         if update_workflow and len(corrections) == 0:
             item.mark_complete()
+            assessment_created_signal.send(sender=None, submission_uuid=submission_uuid)
         return corrections
     except StudentTrainingWorkflow.DoesNotExist:
         msg = u"Could not find student training workflow for submission UUID {}".format(submission_uuid)
@@ -1,9 +1,17 @@
 """
 Database models for AI assessment.
 """
+from collections import namedtuple
 from uuid import uuid4
+import hashlib
 import json
 import logging
+import struct
+import zlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.cache import cache, get_cache
@@ -91,6 +99,16 @@ class AIClassifierSet(models.Model):
     A set of trained classifiers (immutable).
     """
 
+    # Cache key for the current "generation" of classifier sets.
+    # Lookups of the most recent classifier set are cached under keys that include
+    # the generation, so creating a classifier set invalidates them all at once.
+    MOST_RECENT_GENERATION_CACHE_KEY = u"openassessment.assessment.ai.classifier_set.generation"
+
+    # The generation should outlive the cached lookups.  Django treats a timeout
+    # of `None` as the cache's default timeout (five minutes unless configured),
+    # which would needlessly start a new generation.
+    MOST_RECENT_GENERATION_CACHE_TIMEOUT = 60 * 60 * 24 * 365
+
     class Meta:
         app_label = "assessment"
         ordering = ['-created_at', '-id']
@@ -121,7 +139,7 @@ class AIClassifierSet(models.Model):
 
         Args:
             classifiers_dict (dict): Mapping of criterion names to
-                JSON-serializable classifiers.
+                serializable classifiers (see `AIClassifier.upload_classifier_data()`).
             rubric (Rubric): The rubric model.
             algorithm_id (unicode): The ID of the algorithm used to train the classifiers.
             course_id (unicode): The ID of the course that the classifier is going to be grading
@@ -174,28 +192,91 @@ class AIClassifierSet(models.Model):
             )
 
             # Serialize the classifier data and upload
-            try:
-                contents = ContentFile(json.dumps(classifier_data))
-            except (TypeError, ValueError, UnicodeDecodeError) as ex:
-                msg = (
-                    u"Could not serialize classifier data as JSON: {ex}"
-                ).format(ex=ex)
-                raise ClassifierSerializeError(msg)
-
-            filename = uuid4().hex
-            try:
-                classifier.classifier_data.save(filename, contents)
-            except Exception as ex:
-                full_filename = upload_to_path(classifier, filename)
-                msg = (
-                    u"Could not upload classifier data to {filename}: {ex}"
-                ).format(filename=full_filename, ex=ex)
-                raise ClassifierUploadError(msg)
+            classifier.upload_classifier_data(classifier_data)
 
+        cls.invalidate_most_recent_classifier_sets()
         return classifier_set
 
     @classmethod
     def most_recent_classifier_set(cls, rubric, algorithm_id, course_id, item_id):
+        """
+        Finds the most relevant classifier set (see `_find_most_recent_classifier_set()`),
+        using a cached result if possible.
+
+        Results are cached until a new classifier set is created
+        or the `ORA2_CLASSIFIER_SET_CACHE_TIMEOUT` setting (in seconds) expires.
+
+        Args:
+            rubric (Rubric): The rubric associated with the classifier set.
+            algorithm_id (unicode): The algorithm used to create the classifier set.
+            course_id (unicode): The course identifier for the current problem.
+            item_id (unicode): The item identifier for the current problem.
+
+        Returns:
+            ClassifierSet or None
+
+        Raises:
+            DatabaseError
+
+        """
+        cache_key = cls._most_recent_cache_key(rubric, algorithm_id, course_id, item_id)
+
+        # We cache a tuple so we can distinguish a cached `None` from a cache miss
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached[0]
+
+        classifier_set = cls._find_most_recent_classifier_set(rubric, algorithm_id, course_id, item_id)
+        timeout = getattr(settings, 'ORA2_CLASSIFIER_SET_CACHE_TIMEOUT', 60 * 60)
+        cache.set(cache_key, (classifier_set,), timeout)
+        return classifier_set
+
+    @classmethod
+    def invalidate_most_recent_classifier_sets(cls):
+        """
+        Invalidate every cached lookup of the most recent classifier set.
+
+        Returns:
+            None
+
+        """
+        cache.set(cls.MOST_RECENT_GENERATION_CACHE_KEY, uuid4().hex, cls.MOST_RECENT_GENERATION_CACHE_TIMEOUT)
+
+    @classmethod
+    def _most_recent_cache_key(cls, rubric, algorithm_id, course_id, item_id):
+        """
+        Return the cache key for a lookup of the most recent classifier set.
+
+        Args:
+            rubric (Rubric): The rubric associated with the classifier set.
+            algorithm_id (unicode): The algorithm used to create the classifier set.
+            course_id (unicode): The course identifier for the current problem.
+            item_id (unicode): The item identifier for the current problem.
+
+        Returns:
+            unicode
+
+        """
+        # If the generation has been evicted from the cache, start a new one,
+        # so we never reuse results cached for an earlier generation.
+        generation = cache.get(cls.MOST_RECENT_GENERATION_CACHE_KEY)
+        if generation is None:
+            cache.add(
+                cls.MOST_RECENT_GENERATION_CACHE_KEY, uuid4().hex,
+                cls.MOST_RECENT_GENERATION_CACHE_TIMEOUT
+            )
+            generation = cache.get(cls.MOST_RECENT_GENERATION_CACHE_KEY)
+
+        lookup = json.dumps([
+            rubric.content_hash, rubric.structure_hash,  # pylint: disable=E1101
+            algorithm_id, course_id, item_id
+        ])
+        return u"openassessment.assessment.ai.most_recent_classifier_set.{generation}.{lookup}".format(
+            generation=generation, lookup=hashlib.sha1(lookup).hexdigest()
+        )
+
+    @classmethod
+    def _find_most_recent_classifier_set(cls, rubric, algorithm_id, course_id, item_id):
         """
         Finds the most relevant classifier set based on the following line of succession:
 
@@ -401,6 +482,143 @@ def upload_to_path(instance, filename):    # pylint:disable=W0613
         )
 
 
+# Classifier data is stored in a versioned binary container:
+# a header (magic string, format version, flags, and payload length)
+# followed by the classifier data pickled with protocol 2,
+# optionally compressed using zlib.
+# Classifiers stored before we introduced the container are JSON-encoded.
+CLASSIFIER_DATA_MAGIC = "ORA2CL"
+CLASSIFIER_DATA_VERSION = 1
+CLASSIFIER_DATA_HEADER = struct.Struct("!6sBBQ")
+CLASSIFIER_DATA_COMPRESSED = 0x01
+
+
+def encode_classifier_data(classifier_data, compress=True):
+    """
+    Encode classifier data in the binary container format.
+
+    Args:
+        classifier_data (JSON-serializable): The classifier data.
+            Byte strings (`str`) may contain binary data.
+
+    Kwargs:
+        compress (bool): If True, compress the pickled data.
+
+    Returns:
+        str
+
+    Raises:
+        ClassifierSerializeError
+
+    """
+    classifier_data = _normalize_classifier_data(classifier_data)
+
+    try:
+        payload = pickle.dumps(classifier_data, 2)
+    except (pickle.PicklingError, TypeError) as ex:
+        msg = u"Could not serialize classifier data: {ex}".format(ex=ex)
+        raise ClassifierSerializeError(msg)
+
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= CLASSIFIER_DATA_COMPRESSED
+
+    header = CLASSIFIER_DATA_HEADER.pack(
+        CLASSIFIER_DATA_MAGIC, CLASSIFIER_DATA_VERSION, flags, len(payload)
+    )
+    return header + payload
+
+
+def decode_classifier_data(data):
+    """
+    Decode classifier data stored in either the binary container format
+    or the older JSON format.
+
+    Args:
+        data (str): The stored classifier data.
+
+    Returns:
+        JSON-serializable
+
+    Raises:
+        ValueError
+
+    """
+    if not data:
+        raise ValueError(u"Classifier data is empty")
+
+    header_size = CLASSIFIER_DATA_HEADER.size
+    if data[:len(CLASSIFIER_DATA_MAGIC)] != CLASSIFIER_DATA_MAGIC:
+        return json.loads(data)
+
+    if len(data) < header_size:
+        raise ValueError(u"Classifier data is missing its header")
+
+    _, version, flags, length = CLASSIFIER_DATA_HEADER.unpack_from(data, 0)
+    if version != CLASSIFIER_DATA_VERSION:
+        raise ValueError(u"Unknown classifier data format version {}".format(version))
+
+    payload = data[header_size:header_size + length]
+    if len(payload) != length:
+        raise ValueError(u"Classifier data is truncated")
+
+    try:
+        if flags & CLASSIFIER_DATA_COMPRESSED:
+            payload = zlib.decompress(payload)
+        return pickle.loads(payload)
+    except (zlib.error, pickle.UnpicklingError, EOFError) as ex:
+        raise ValueError(u"Could not decode classifier data: {ex}".format(ex=ex))
+
+
+def is_legacy_classifier_data(data):
+    """
+    Check whether classifier data is stored in the older JSON format.
+
+    Args:
+        data (str): The stored classifier data.
+
+    Returns:
+        bool
+
+    """
+    return data[:len(CLASSIFIER_DATA_MAGIC)] != CLASSIFIER_DATA_MAGIC
+
+
+def _normalize_classifier_data(classifier_data):
+    """
+    Check that the classifier data contains only JSON types or byte strings,
+    converting tuples to lists as JSON would.
+    We pickle the data, but restricting the types keeps stored classifiers
+    independent of the code that created them.
+
+    Args:
+        classifier_data: The classifier data to check.
+
+    Returns:
+        The normalized classifier data.
+
+    Raises:
+        ClassifierSerializeError
+
+    """
+    if isinstance(classifier_data, dict):
+        normalized = {}
+        for key, value in classifier_data.iteritems():
+            if not isinstance(key, basestring):
+                msg = u"Classifier data has a key that is not a string: {key!r}".format(key=key)
+                raise ClassifierSerializeError(msg)
+            normalized[key] = _normalize_classifier_data(value)
+        return normalized
+    elif isinstance(classifier_data, (list, tuple)):
+        return [_normalize_classifier_data(value) for value in classifier_data]
+    elif classifier_data is None or isinstance(classifier_data, (basestring, bool, int, long, float)):
+        return classifier_data
+    else:
+        msg = u"Could not serialize classifier data of type {type}".format(type=type(classifier_data))
+        raise ClassifierSerializeError(msg)
+
+
 class AIClassifier(models.Model):
     """
     A trained classifier (immutable).
@@ -420,6 +638,38 @@ class AIClassifier(models.Model):
     # which allows us to plug in different storage backends (such as S3)
     classifier_data = models.FileField(upload_to=upload_to_path)
 
+    def upload_classifier_data(self, classifier_data):
+        """
+        Serialize the classifier data and upload it to a new file.
+
+        The `ORA2_AI_CLASSIFIER_COMPRESSION` setting controls
+        whether the data is compressed (the default).
+
+        Args:
+            classifier_data (JSON-serializable): The classifier data.
+                Byte strings (`str`) may contain binary data.
+
+        Returns:
+            None
+
+        Raises:
+            ClassifierSerializeError
+            ClassifierUploadError
+
+        """
+        compress = getattr(settings, 'ORA2_AI_CLASSIFIER_COMPRESSION', True)
+        contents = ContentFile(encode_classifier_data(classifier_data, compress=compress))
+
+        filename = uuid4().hex
+        try:
+            self.classifier_data.save(filename, contents)
+        except Exception as ex:
+            full_filename = upload_to_path(self, filename)
+            msg = (
+                u"Could not upload classifier data to {filename}: {ex}"
+            ).format(filename=full_filename, ex=ex)
+            raise ClassifierUploadError(msg)
+
     def download_classifier_data(self):
         """
         Download and deserialize the classifier data.
@@ -428,12 +678,30 @@ class AIClassifier(models.Model):
             JSON-serializable
 
         Raises:
-            ValueError
+            ValueError: The classifier data is empty or could not be decoded.
             IOError
             httplib.HTTPException
 
         """
-        return json.loads(self.classifier_data.read())  # pylint:disable=E1101
+        return decode_classifier_data(self.read_raw_classifier_data())
+
+    def read_raw_classifier_data(self):
+        """
+        Download the stored classifier data without deserializing it.
+
+        Returns:
+            str
+
+        Raises:
+            IOError
+            httplib.HTTPException
+
+        """
+        self.classifier_data.open('rb')  # pylint:disable=E1101
+        try:
+            return self.classifier_data.read()  # pylint:disable=E1101
+        finally:
+            self.classifier_data.close()  # pylint:disable=E1101
 
     @property
     def valid_scores(self):
@@ -448,6 +716,13 @@ class AIClassifier(models.Model):
         return sorted([option.points for option in self.criterion.options.all()])
 
 
+# Lightweight representation of an incomplete workflow, used to reschedule tasks.
+# `rubric_id` is None for training workflows, which get their rubric from the training examples.
+IncompleteWorkflow = namedtuple(
+    'IncompleteWorkflow', ['id', 'uuid', 'rubric_id', 'algorithm_id', 'classifier_set_id']
+)
+
+
 class AIWorkflow(models.Model):
     """
     Abstract base class for AI workflow database models.
@@ -513,35 +788,46 @@ class AIWorkflow(models.Model):
         self._log_complete_workflow()
 
     @classmethod
-    def get_incomplete_workflows(cls, course_id, item_id):
+    def get_incomplete_workflows(cls, course_id, item_id, after_id=0, chunk_size=500):
         """
-        Gets all incomplete grading workflows for a given course and item.
+        Gets all incomplete workflows for a given course and item.
+
+        Workflows are retrieved a chunk at a time, ordered by primary key,
+        and we load only the columns in `IncompleteWorkflow` (never the essay text),
+        so memory use doesn't depend on the number of incomplete workflows.
 
         Args:
             course_id (unicode): Uniquely identifies the course
             item_id (unicode): The discriminator for the item we are looking for
 
+        Kwargs:
+            after_id (int): Only include workflows with a primary key greater than this.
+            chunk_size (int): The number of workflows to retrieve in each query.
+
         Yields:
-            All incomplete workflows for this item, as a delayed "stream"
+            IncompleteWorkflow
 
         Raises:
             DatabaseError
-            cls.DoesNotExist
         """
-
-        # Finds all of the uuid's for workflows contained within the query
-        grade_workflow_uuids = [
-            wflow['uuid'] for wflow in cls.objects.filter(
-                course_id=course_id, item_id=item_id, completed_at__isnull=True
-            ).values('uuid')
-        ]
-
-        # Continues to generate output until all workflows in the queryset have been output
-        for workflow_uuid in grade_workflow_uuids:
-
-            # Returns the grading workflow associated with the uuid stored in the initial query
-            workflow = cls.objects.get(uuid=workflow_uuid)
-            yield workflow
+        has_rubric = any(field.name == 'rubric' for field in cls._meta.fields)
+        fields = ['id', 'uuid', 'rubric', 'algorithm_id', 'classifier_set']
+        if not has_rubric:
+            fields.remove('rubric')
+
+        workflows = cls.objects.filter(
+            course_id=course_id, item_id=item_id, completed_at__isnull=True
+        ).order_by('id')
+
+        while True:
+            rows = list(workflows.filter(id__gt=after_id).values_list(*fields)[:chunk_size])
+            if not rows:
+                break
+            for row in rows:
+                if not has_rubric:
+                    row = row[:2] + (None,) + row[2:]
+                yield IncompleteWorkflow(*row)
+            after_id = rows[-1][0]
 
     @classmethod
     def is_workflow_complete(cls, workflow_uuid):
@@ -706,6 +992,10 @@ class AITrainingWorkflow(AIWorkflow):
         )
         self.mark_complete_and_save()
 
+        # Creating the classifier set invalidated cached lookups, but a lookup
+        # made before the transaction committed could have cached the old result.
+        AIClassifierSet.invalidate_most_recent_classifier_sets()
+
 
 class AIGradingWorkflow(AIWorkflow):
     """
@@ -833,6 +1123,47 @@ class AIGradingWorkflow(AIWorkflow):
             InvalidRubricSelection
             DatabaseError
 
+        """
+        self._complete(criterion_scores)
+
+    @classmethod
+    @transaction.commit_on_success
+    def complete_batch(cls, workflows, scores_by_workflow_uuid):
+        """
+        Create assessments for several workflows and mark them complete,
+        all in one transaction.
+
+        Args:
+            workflows (list of AIGradingWorkflow): The workflows to complete.
+            scores_by_workflow_uuid (dict): Maps workflow UUIDs to dictionaries
+                mapping criteria names to integer scores.
+
+        Returns:
+            None
+
+        Raises:
+            InvalidRubricSelection
+            DatabaseError
+
+        """
+        for workflow in workflows:
+            workflow._complete(scores_by_workflow_uuid[workflow.uuid])
+
+    def _complete(self, criterion_scores):
+        """
+        Create the assessment and mark the workflow complete,
+        without managing the transaction.
+
+        Args:
+            criterion_scores (dict): Dictionary mapping criteria names to integer scores.
+
+        Returns:
+            None
+
+        Raises:
+            InvalidRubricSelection
+            DatabaseError
+
         """
         self.assessment = Assessment.create(
             self.rubric, self.algorithm_id, self.submission_uuid, AI_ASSESSMENT_TYPE
@@ -21,6 +21,7 @@ import json
 from django.core.cache import cache
 from django.db import models
 from django.utils.timezone import now
+from dogapi import dog_stats_api
 from lazy import lazy
 
 import logging
@@ -411,6 +412,10 @@ class Assessment(models.Model):
     """
     MAX_FEEDBACK_SIZE = 1024 * 100
 
+    # Increment this to invalidate cached scores by criterion
+    # (for example, if the format of the cached value changes).
+    SCORES_BY_CRITERION_CACHE_VERSION = 2
+
     submission_uuid = models.CharField(max_length=128, db_index=True)
     rubric = models.ForeignKey(Rubric)
 
@@ -571,28 +576,76 @@ class Assessment(models.Model):
                 "bar": [6, 7, 8]
             }
         """
-        assessments = list(assessments)  # Force us to read it all
-        if not assessments:
-            return []
-
-        # Generate a cache key that represents all the assessments we're being
-        # asked to grab scores from (comma separated list of assessment IDs)
-        cache_key = "assessments.scores_by_criterion.{}".format(
-            ",".join(str(assessment.id) for assessment in assessments)
+        return cls.scores_by_criterion_for_ids(
+            [assessment.id for assessment in assessments]
         )
+
+    @classmethod
+    def scores_by_criterion_for_ids(cls, assessment_ids):
+        """Create a dictionary of lists for scores associated with criterion
+
+        This is the same as `scores_by_criterion()`, but it takes assessment IDs,
+        so callers do not need to load the assessment models.  The points for
+        every part of every assessment are retrieved in a single query.
+
+        Args:
+            assessment_ids (list): List of assessment IDs.
+
+        Examples:
+            >>> Assessment.scores_by_criterion_for_ids([1, 2, 3])
+            {
+                "foo": [1, 2, 3],
+                "bar": [6, 7, 8]
+            }
+        """
+        assessment_ids = list(assessment_ids)  # Force us to read it all
+        if not assessment_ids:
+            return {}
+
+        cache_key = cls._scores_by_criterion_cache_key(assessment_ids)
         scores = cache.get(cache_key)
-        if scores:
+        if scores is not None:
+            dog_stats_api.increment('openassessment.assessment.scores_by_criterion.cache_hit')
             return scores
+        dog_stats_api.increment('openassessment.assessment.scores_by_criterion.cache_miss')
 
         scores = defaultdict(list)
-        for assessment in assessments:
-            for part in assessment.parts.all().select_related():
-                criterion_name = part.criterion.name
-                scores[criterion_name].append(part.points_earned)
-
+        parts = AssessmentPart.objects.filter(
+            assessment__in=assessment_ids
+        ).values_list('criterion__name', 'option__points')
+        for criterion_name, points in parts:
+            # By convention, an assessment part with no option (only feedback) earns 0 points.
+            scores[criterion_name].append(points if points is not None else 0)
+
+        # Cache a plain dict, which pickles more compactly than a defaultdict
+        scores = dict(scores)
         cache.set(cache_key, scores)
         return scores
 
+    @classmethod
+    def _scores_by_criterion_cache_key(cls, assessment_ids):
+        """
+        Return the cache key for the scores of a set of assessments.
+
+        We hash the assessment IDs so the key has a fixed length;
+        otherwise, submissions with many assessments would have keys
+        longer than memcached allows.  Assessments are never modified
+        once created, so the IDs (and the cache version) determine the scores.
+
+        Args:
+            assessment_ids (list): List of assessment IDs.
+
+        Returns:
+            str
+
+        """
+        ids_hash = sha1(
+            ",".join(str(assessment_id) for assessment_id in sorted(assessment_ids))
+        ).hexdigest()
+        return "assessments.scores_by_criterion.v{version}.{hash}".format(
+            version=cls.SCORES_BY_CRITERION_CACHE_VERSION, hash=ids_hash
+        )
+
 
 class AssessmentPart(models.Model):
     """Part of an Assessment corresponding to a particular Criterion.
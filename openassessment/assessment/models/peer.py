@@ -11,6 +11,7 @@ import random
 from datetime import timedelta
 
 from django.db import models, DatabaseError
+from django.db.models import Count, F, Q, Min, Max
 from django.utils.timezone import now
 
 from openassessment.assessment.models.base import Assessment
@@ -33,6 +34,10 @@ class AssessmentFeedbackOption(models.Model):
     """
     text = models.CharField(max_length=255, unique=True)
 
+    # Set to the modification time of the feedback that first selected the option,
+    # so incremental data exports write each option once.
+    created_at = models.DateTimeField(default=now, db_index=True)
+
     class Meta:
         app_label = "assessment"
 
@@ -57,6 +62,10 @@ class AssessmentFeedback(models.Model):
     feedback_text = models.TextField(max_length=10000, default="")
     options = models.ManyToManyField(AssessmentFeedbackOption, related_name='assessment_feedback', default=None)
 
+    # Updated whenever the student changes their feedback,
+    # so incremental data exports can find the feedback that changed.
+    modified = models.DateTimeField(default=now, db_index=True)
+
     class Meta:
         app_label = "assessment"
 
@@ -79,7 +88,9 @@ class AssessmentFeedback(models.Model):
         # If there are additional options that do not yet exist, create them
         new_options = [text for text in selected_options if text not in [opt.text for opt in options]]
         for new_option_text in new_options:
-            options.append(AssessmentFeedbackOption.objects.create(text=new_option_text))
+            options.append(AssessmentFeedbackOption.objects.create(
+                text=new_option_text, created_at=self.modified
+            ))
 
         # Add all options to the feedback model
         # Note that we've already saved each of the AssessmentFeedbackOption models, so they have primary keys
@@ -103,10 +114,33 @@ class PeerWorkflow(models.Model):
     The student item is the author of the submission.  Peer Workflow Items are
     created for each assessment made by this student.
 
+    To keep the peer assessment queue cheap for items with many submissions,
+    each workflow also stores denormalized counters describing the workflow
+    items that *assess* its submission:
+
+    * `assessed_count` is the number of completed assessments received.
+    * `open_count` is the number of leases (workflow items without an
+      assessment) handed out to scorers, whether or not they have expired.
+    * `last_leased_at` is the time the most recent lease was handed out.
+
+    These are maintained by `create_item` and `close_active_assessment`.
+    Counters for existing workflows are calculated by a data migration,
+    and can be recalculated using the `backfill_peer_workflow_counters`
+    management command.
+
     """
     # Amount of time before a lease on a submission expires
     TIME_LIMIT = timedelta(hours=8)
 
+    # When choosing a submission for over grading, we probe this many
+    # randomly chosen primary keys per query, for at most this many queries,
+    # before falling back to the first submission after a random key.
+    OVER_GRADING_SAMPLE_SIZE = 25
+    OVER_GRADING_SAMPLE_ATTEMPTS = 3
+
+    # Number of workflows to read at a time from the peer assessment queue
+    QUEUE_BATCH_SIZE = 50
+
     student_id = models.CharField(max_length=40, db_index=True)
     item_id = models.CharField(max_length=128, db_index=True)
     course_id = models.CharField(max_length=40, db_index=True)
@@ -115,6 +149,11 @@ class PeerWorkflow(models.Model):
     completed_at = models.DateTimeField(null=True, db_index=True)
     grading_completed_at = models.DateTimeField(null=True, db_index=True)
 
+    # Denormalized counters for the peer assessment queue
+    assessed_count = models.PositiveIntegerField(default=0)
+    open_count = models.PositiveIntegerField(default=0)
+    last_leased_at = models.DateTimeField(null=True)
+
     class Meta:
         ordering = ["created_at", "id"]
         app_label = "assessment"
@@ -184,14 +223,26 @@ class PeerWorkflow(models.Model):
 
             if len(workflow_items) > 0:
                 item = workflow_items[0]
+                new_lease = False
             else:
                 item = PeerWorkflowItem.objects.create(
                     scorer=scorer_workflow,
                     author=peer_workflow,
                     submission_uuid=submission_uuid
                 )
+                new_lease = True
             item.started_at = now()
             item.save()
+
+            # Keep the author's queue counters up to date.
+            # We use an `update()` with `F()` expressions so that
+            # concurrent requests do not overwrite each other's counts.
+            if peer_workflow is not None and item.assessment_id is None:
+                counter_updates = {'last_leased_at': item.started_at}
+                if new_lease:
+                    counter_updates['open_count'] = F('open_count') + 1
+                PeerWorkflow.objects.filter(pk=peer_workflow.pk).update(**counter_updates)
+
             return item
         except DatabaseError:
             error_message = (
@@ -221,24 +272,23 @@ class PeerWorkflow(models.Model):
 
         """
         oldest_acceptable = now() - self.TIME_LIMIT
-        items = list(self.graded.all().order_by("-started_at", "-id"))
-        valid_open_items = []
-        completed_sub_uuids = []
-
-        # First, remove all completed items.
-        for item in items:
-            if item.assessment is not None:
-                completed_sub_uuids.append(item.submission_uuid)
-            else:
-                valid_open_items.append(item)
-
-        # Remove any open items which have a submission which has been completed.
-        for item in valid_open_items:
-            if (item.started_at < oldest_acceptable or
-                    item.submission_uuid in completed_sub_uuids):
-                valid_open_items.remove(item)
 
-        return valid_open_items[0] if valid_open_items else None
+        # Skip open items for submissions the scorer has already assessed
+        # (for example, from an earlier lease that expired).
+        # The (scorer, assessment, started_at) index covers both parts of the query.
+        completed_sub_uuids = self.graded.filter(
+            assessment__isnull=False
+        ).order_by().values_list('submission_uuid', flat=True)
+
+        items = list(
+            self.graded.filter(
+                assessment__isnull=True,
+                started_at__gte=oldest_acceptable
+            ).exclude(
+                submission_uuid__in=completed_sub_uuids
+            ).order_by("-started_at", "-id")[:1]
+        )
+        return items[0] if items else None
 
     def get_submission_for_review(self, graded_by):
         """
@@ -257,7 +307,7 @@ class PeerWorkflow(models.Model):
                 the workflows or workflow items for this request.
 
         """
-        timeout = (now() - self.TIME_LIMIT).strftime("%Y-%m-%d %H:%M:%S")
+        oldest_acceptable = now() - self.TIME_LIMIT
         # The follow query behaves as the Peer Assessment Queue. This will
         # find the next submission (via PeerWorkflow) in this course / question
         # that:
@@ -266,41 +316,36 @@ class PeerWorkflow(models.Model):
         #  3) Is not something you have already scored.
         #  4) Does not have a combination of completed assessments or open
         #     assessments equal to or more than the requirement.
+        #
+        # Conditions (1) and (2) are answered by the denormalized counters
+        # while walking the (course_id, item_id, grading_completed_at, created_at)
+        # index in queue order, a batch at a time.  Conditions (3) and (4)
+        # are checked for each batch (see `_first_available_for_review()`).
         try:
-            peer_workflows = list(PeerWorkflow.objects.raw(
-                "select pw.id, pw.submission_uuid "
-                "from assessment_peerworkflow pw "
-                "where pw.item_id=%s "
-                "and pw.course_id=%s "
-                "and pw.student_id<>%s "
-                "and pw.grading_completed_at is NULL "
-                "and pw.id not in ("
-                "   select pwi.author_id "
-                "   from assessment_peerworkflowitem pwi "
-                "   where pwi.scorer_id=%s "
-                "   and pwi.assessment_id is not NULL "
-                ") "
-                "and ("
-                "   select count(pwi.id) as c "
-                "   from assessment_peerworkflowitem pwi "
-                "   where pwi.author_id=pw.id "
-                "   and (pwi.assessment_id is not NULL or pwi.started_at > %s) "
-                ") < %s "
-                "order by pw.created_at, pw.id "
-                "limit 1; ",
-                [
-                    self.item_id,
-                    self.course_id,
-                    self.student_id,
-                    self.id,
-                    timeout,
-                    graded_by
-                ]
-            ))
-            if not peer_workflows:
-                return None
-
-            return peer_workflows[0].submission_uuid
+            queue = PeerWorkflow.objects.filter(
+                course_id=self.course_id,
+                item_id=self.item_id,
+                grading_completed_at__isnull=True,
+                assessed_count__lt=graded_by
+            ).exclude(student_id=self.student_id).order_by('created_at', 'id')
+
+            last_created_at = last_id = None
+            while True:
+                batch_query = queue
+                if last_id is not None:
+                    batch_query = queue.filter(
+                        Q(created_at__gt=last_created_at) | Q(created_at=last_created_at, id__gt=last_id)
+                    )
+                batch = list(batch_query.values_list(
+                    'id', 'created_at', 'submission_uuid', 'assessed_count', 'open_count', 'last_leased_at'
+                )[:self.QUEUE_BATCH_SIZE])
+                if not batch:
+                    return None
+
+                submission_uuid = self._first_available_for_review(batch, graded_by, oldest_acceptable)
+                if submission_uuid is not None:
+                    return submission_uuid
+                last_id, last_created_at = batch[-1][:2]
         except DatabaseError:
             error_message = (
                 u"An internal error occurred while retrieving a peer submission "
@@ -309,9 +354,74 @@ class PeerWorkflow(models.Model):
             logger.exception(error_message)
             raise PeerAssessmentInternalError(error_message)
 
+    def _first_available_for_review(self, batch, graded_by, oldest_acceptable):
+        """
+        Find the first workflow in a batch read from the peer assessment queue
+        that this student can assess.
+
+        Instead of checking each workflow with a subquery, we find the submissions
+        in the batch the student has already assessed with one query, and count
+        the unexpired leases with one query, for only the workflows whose counters
+        don't rule out an active lease.
+
+        Args:
+            batch (list): `(id, created_at, submission_uuid, assessed_count, open_count, last_leased_at)`
+                tuples for the workflows, in queue order.
+            graded_by (int): The number of assessments each submission requires.
+            oldest_acceptable (datetime): Leases started before this have expired.
+
+        Returns:
+            unicode: The submission UUID, or None if no workflow in the batch is available.
+
+        Raises:
+            DatabaseError
+
+        """
+        workflow_ids = [row[0] for row in batch]
+        scored_author_ids = set(
+            PeerWorkflowItem.objects.filter(
+                scorer=self, assessment__isnull=False, author__in=workflow_ids
+            ).order_by().values_list('author_id', flat=True)
+        )
+
+        # The open leases are enough to complete the assessments only if
+        # some of them might still be active, so count the unexpired leases.
+        maybe_leased_ids = [
+            workflow_id
+            for workflow_id, __, __, assessed_count, open_count, last_leased_at in batch
+            if workflow_id not in scored_author_ids
+            and assessed_count + open_count >= graded_by
+            and last_leased_at is not None and last_leased_at > oldest_acceptable
+        ]
+        active_lease_counts = dict()
+        if maybe_leased_ids:
+            active_lease_counts = {
+                row['author']: row['num_items']
+                for row in PeerWorkflowItem.objects.filter(
+                    author__in=maybe_leased_ids,
+                    assessment__isnull=True,
+                    started_at__gt=oldest_acceptable
+                ).order_by().values('author').annotate(num_items=Count('id'))
+            }
+
+        for workflow_id, __, submission_uuid, assessed_count, __, __ in batch:
+            if workflow_id in scored_author_ids:
+                continue
+            if assessed_count + active_lease_counts.get(workflow_id, 0) >= graded_by:
+                continue
+            return submission_uuid
+        return None
+
     def get_submission_for_over_grading(self):
         """
         Retrieve the next submission uuid for over grading in peer assessment.
+
+        Rather than loading every candidate workflow, we probe batches of
+        random primary keys within the item's key range.  Each candidate
+        is equally likely to be chosen, and the number of rows read is
+        bounded by the sample size.  If the item's keys are too sparse for
+        the probes to find a candidate, we fall back to the first candidate
+        at or after a random key (wrapping around to the start).
         """
         # The follow query behaves as the Peer Assessment Over Grading Queue. This
         # will find a random submission (via PeerWorkflow) in this course / question
@@ -319,26 +429,42 @@ class PeerWorkflow(models.Model):
         #  1) Does not belong to you
         #  2) Is not something you have already scored
         try:
-            query = list(PeerWorkflow.objects.raw(
-                "select pw.id, pw.submission_uuid "
-                "from assessment_peerworkflow pw "
-                "where course_id=%s "
-                "and item_id=%s "
-                "and student_id<>%s "
-                "and pw.id not in ( "
-                    "select pwi.author_id "
-                    "from assessment_peerworkflowitem pwi "
-                    "where pwi.scorer_id=%s); ",
-                [self.course_id, self.item_id, self.student_id, self.id]
-            ))
-            workflow_count = len(query)
-            if workflow_count < 1:
-                return None
-
-            random_int = random.randint(0, workflow_count - 1)
-            random_workflow = query[random_int]
+            item_workflows = PeerWorkflow.objects.filter(
+                course_id=self.course_id, item_id=self.item_id
+            )
+            candidates = item_workflows.exclude(student_id=self.student_id).exclude(
+                id__in=PeerWorkflowItem.objects.filter(scorer=self).order_by().values_list('author_id', flat=True)
+            )
 
-            return random_workflow.submission_uuid
+            key_range = item_workflows.aggregate(min_id=Min('id'), max_id=Max('id'))
+            if key_range['min_id'] is None:
+                return None
+            min_id, max_id = key_range['min_id'], key_range['max_id']
+            num_keys = max_id - min_id + 1
+
+            for __ in range(self.OVER_GRADING_SAMPLE_ATTEMPTS):
+                sample = random.sample(xrange(min_id, max_id + 1), min(num_keys, self.OVER_GRADING_SAMPLE_SIZE))
+                found = dict(candidates.filter(id__in=sample).values_list('id', 'submission_uuid'))
+
+                # Choose the first match in the (random) sample order,
+                # so that every candidate is equally likely to be chosen.
+                for workflow_id in sample:
+                    if workflow_id in found:
+                        return found[workflow_id]
+
+                # If we probed every key in the range, there are no candidates.
+                if len(sample) == num_keys:
+                    return None
+
+            start_id = random.randint(min_id, max_id)
+            submission_uuids = list(
+                candidates.filter(id__gte=start_id).order_by('id').values_list('submission_uuid', flat=True)[:1]
+            )
+            if not submission_uuids:
+                submission_uuids = list(
+                    candidates.filter(id__lt=start_id).order_by('id').values_list('submission_uuid', flat=True)[:1]
+                )
+            return submission_uuids[0] if submission_uuids else None
         except DatabaseError:
             error_message = (
                 u"An internal error occurred while retrieving a peer submission "
@@ -373,13 +499,27 @@ class PeerWorkflow(models.Model):
                 ).format(self.student_id, submission_uuid)
                 raise PeerAssessmentWorkflowError(msg)
             item = items[0]
+            was_open = item.assessment_id is None
             item.assessment = assessment
             item.save()
 
-            if (not item.author.grading_completed_at
-                    and item.author.graded_by.filter(assessment__isnull=False).count() >= num_required_grades):
-                item.author.grading_completed_at = now()
-                item.author.save()
+            # Move the lease from "open" to "assessed" in the author's
+            # queue counters, then mark grading as complete if the
+            # author's submission now has enough assessments.
+            author_workflows = PeerWorkflow.objects.filter(pk=item.author_id)
+            if was_open:
+                num_updated = author_workflows.filter(open_count__gt=0).update(
+                    open_count=F('open_count') - 1,
+                    assessed_count=F('assessed_count') + 1
+                )
+                # Workflows that have not been backfilled may not have
+                # any open leases recorded.
+                if num_updated == 0:
+                    author_workflows.update(assessed_count=F('assessed_count') + 1)
+            author_workflows.filter(
+                grading_completed_at__isnull=True,
+                assessed_count__gte=num_required_grades
+            ).update(grading_completed_at=now())
         except (DatabaseError, PeerWorkflowItem.DoesNotExist):
             error_message = (
                 u"An internal error occurred while retrieving a workflow item for "
@@ -424,6 +564,9 @@ class PeerWorkflowItem(models.Model):
     started_at = models.DateTimeField(default=now, db_index=True)
     assessment = models.ForeignKey(Assessment, null=True)
 
+    # Migration 0025 adds a composite index on (scorer, assessment, started_at)
+    # for `PeerWorkflow.find_active_assessments()`.
+
     # This WorkflowItem was used to determine the final score for the Workflow.
     scored = models.BooleanField(default=False)
 
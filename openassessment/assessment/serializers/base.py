@@ -2,6 +2,7 @@
 """
 Serializers common to all assessment types.
 """
+from collections import defaultdict
 from copy import deepcopy
 import logging
 
@@ -160,18 +161,49 @@ class AssessmentSerializer(serializers.ModelSerializer):
 
 
 def serialize_assessments(assessments_qset):
+    """
+    Serialize many assessments at once.
+
+    This returns the same dicts as calling `full_assessment_dict()` for each
+    assessment, but we read the cached dicts with a single cache call, and
+    retrieve the parts of every uncached assessment in a single query.
+
+    Args:
+        assessments_qset (QuerySet): The assessments to serialize.
+
+    Returns:
+        list of dicts, in the same order as the assessments.
+
+    """
     assessments = list(assessments_qset.select_related("rubric"))
-    rubric_cache = {}
+    cache_keys = [_full_assessment_dict_cache_key(assessment) for assessment in assessments]
+    assessment_dicts = cache.get_many(cache_keys)
 
-    return [
-        full_assessment_dict(
-            assessment,
-            RubricSerializer.serialized_from_cache(
-                assessment.rubric, rubric_cache
-            )
-        )
-        for assessment in assessments
+    uncached = [
+        assessment for assessment, cache_key in zip(assessments, cache_keys)
+        if cache_key not in assessment_dicts
     ]
+    if uncached:
+        parts_by_assessment = defaultdict(list)
+        parts = AssessmentPart.objects.filter(
+            assessment__in=[assessment.id for assessment in uncached]
+        ).select_related("criterion", "option")
+        for part in parts:
+            parts_by_assessment[part.assessment_id].append(part)
+
+        rubric_cache = {}
+        new_dicts = {
+            _full_assessment_dict_cache_key(assessment): _build_full_assessment_dict(
+                assessment,
+                RubricSerializer.serialized_from_cache(assessment.rubric, rubric_cache),
+                parts_by_assessment[assessment.id]
+            )
+            for assessment in uncached
+        }
+        cache.set_many(new_dicts)
+        assessment_dicts.update(new_dicts)
+
+    return [assessment_dicts[cache_key] for cache_key in cache_keys]
 
 
 def full_assessment_dict(assessment, rubric_dict=None):
@@ -189,17 +221,54 @@ def full_assessment_dict(assessment, rubric_dict=None):
     Returns:
         dict with keys 'rubric' (serialized Rubric model) and 'parts' (serialized assessment parts)
     """
-    assessment_cache_key = "assessment.full_assessment_dict.{}.{}.{}".format(
-        assessment.id, assessment.submission_uuid, assessment.scored_at.isoformat()
-    )
+    assessment_cache_key = _full_assessment_dict_cache_key(assessment)
     assessment_dict = cache.get(assessment_cache_key)
     if assessment_dict:
         return assessment_dict
 
-    assessment_dict = AssessmentSerializer(assessment).data
     if not rubric_dict:
         rubric_dict = RubricSerializer.serialized_from_cache(assessment.rubric)
 
+    assessment_dict = _build_full_assessment_dict(
+        assessment, rubric_dict,
+        assessment.parts.all().select_related("criterion", "option")
+    )
+    cache.set(assessment_cache_key, assessment_dict)
+
+    return assessment_dict
+
+
+def _full_assessment_dict_cache_key(assessment):
+    """
+    Return the cache key for the serialized form of an assessment.
+
+    Args:
+        assessment (Assessment): The Assessment model.
+
+    Returns:
+        str
+
+    """
+    return "assessment.full_assessment_dict.{}.{}.{}".format(
+        assessment.id, assessment.submission_uuid, assessment.scored_at.isoformat()
+    )
+
+
+def _build_full_assessment_dict(assessment, rubric_dict, assessment_parts):
+    """
+    Serialize an assessment and its parts (see `full_assessment_dict()`).
+
+    Args:
+        assessment (Assessment): The Assessment model to serialize.
+        rubric_dict (dict): The serialized rubric for the assessment.
+        assessment_parts (iterable of AssessmentPart): The parts of the assessment,
+            with their criteria and options already loaded.
+
+    Returns:
+        dict
+
+    """
+    assessment_dict = AssessmentSerializer(assessment).data
     assessment_dict["rubric"] = rubric_dict
 
     # This part looks a little goofy, but it's in the name of saving dozens of
@@ -210,7 +279,7 @@ def full_assessment_dict(assessment, rubric_dict=None):
     # `CriterionOption` again, we simply index into the places we expect them to
     # be from the big, saved `Rubric` serialization.
     parts = []
-    for part in assessment.parts.all().select_related("criterion", "option"):
+    for part in assessment_parts:
         criterion_dict = rubric_dict["criteria"][part.criterion.order_num]
         options_dict = None
         if part.option is not None:
@@ -232,8 +301,6 @@ def full_assessment_dict(assessment, rubric_dict=None):
     )
     assessment_dict["points_possible"] = rubric_dict["points_possible"]
 
-    cache.set(assessment_cache_key, assessment_dict)
-
     return assessment_dict
 
 
@@ -9,3 +9,9 @@ import django.dispatch
 # You can fire this signal from asynchronous processes (such as AI grading)
 # to notify receivers that an assessment is available.
 assessment_complete_signal = django.dispatch.Signal(providing_args=['submission_uuid'])    # pylint: disable=C0103
+
+# Indicate that an assessment was created for (or by) the student
+# who made a submission, so the student's workflow may be out of date.
+# This is sent while students submit assessments, so receivers
+# should avoid doing expensive work synchronously.
+assessment_created_signal = django.dispatch.Signal(providing_args=['submission_uuid'])    # pylint: disable=C0103
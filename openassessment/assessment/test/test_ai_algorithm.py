@@ -3,7 +3,10 @@
 Tests for AI algorithm implementations.
 """
 import unittest
+import base64
+import hashlib
 import json
+import pickle
 import mock
 from openassessment.test_utils import CacheResetTest
 from openassessment.assessment.worker.algorithm import (
@@ -73,6 +76,11 @@ class FakeAIAlgorithmTest(AIAlgorithmTest):
         scores = self._scores(classifier, INPUT_ESSAYS)
         self.assertEqual(scores, expected_scores)
 
+    def test_score_batch(self):
+        classifier = self.algorithm.train_classifier(EXAMPLES)
+        scores = self.algorithm.score_batch(INPUT_ESSAYS, classifier, {})
+        self.assertEqual(scores, [2, 0, 0, 0, 4, 2, 4])
+
     def test_score_classifier_missing_key(self):
         with self.assertRaises(InvalidClassifier):
             self.algorithm.score(u"Test input", {}, {})
@@ -110,6 +118,33 @@ class EaseAIAlgorithmTest(AIAlgorithmTest):
         repeat_scores = self._scores(classifier, INPUT_ESSAYS)
         self.assertEqual(scores, repeat_scores)
 
+    def test_score_batch(self):
+        classifier = self.algorithm.train_classifier(EXAMPLES)
+
+        # Scoring the essays together should give the same
+        # scores as scoring each essay on its own.
+        expected_scores = [
+            self.algorithm.score(input_essay, classifier, {})
+            for input_essay in INPUT_ESSAYS
+        ]
+        cache = {}
+        self.assertEqual(self.algorithm.score_batch(INPUT_ESSAYS, classifier, cache), expected_scores)
+
+        # Re-use the cached essay set, as we would for another criterion
+        self.assertEqual(self.algorithm.score_batch(INPUT_ESSAYS, classifier, cache), expected_scores)
+
+    def test_load_classifier(self):
+        classifier = self.algorithm.train_classifier(EXAMPLES)
+        loaded = self.algorithm.load_classifier(classifier)
+
+        # Scores using the loaded classifier should match
+        # scores using the serialized classifier.
+        for input_essay in INPUT_ESSAYS:
+            self.assertEqual(
+                self.algorithm.score(input_essay, loaded, {}),
+                self.algorithm.score(input_essay, classifier, {})
+            )
+
     def test_all_examples_have_same_score(self):
         examples = [
             AIAlgorithm.ExampleEssay(u"Test ëṡṡäÿ", 1),
@@ -138,14 +173,18 @@ class EaseAIAlgorithmTest(AIAlgorithmTest):
         with self.assertRaises(TrainingError):
             self.algorithm.train_classifier([])
 
-    def test_json_serializable(self):
+    def test_legacy_base64_classifier(self):
         classifier = self.algorithm.train_classifier(EXAMPLES)
-        serialized = json.dumps(classifier)
-        deserialized = json.loads(serialized)
 
-        # This should not raise an exception
-        scores = self._scores(deserialized, INPUT_ESSAYS)
-        self.assertEqual(len(scores), len(INPUT_ESSAYS))
+        # Classifiers trained before we stored classifiers in a binary format
+        # were base64-encoded and serialized as JSON.
+        legacy_classifier = json.loads(json.dumps({
+            key: base64.b64encode(value)
+            for key, value in classifier.iteritems()
+        }))
+
+        scores = self._scores(legacy_classifier, INPUT_ESSAYS)
+        self.assertEqual(scores, self._scores(classifier, INPUT_ESSAYS))
 
     @mock.patch('openassessment.assessment.worker.algorithm.pickle')
     def test_pickle_serialize_error(self, mock_pickle):
@@ -163,3 +202,60 @@ class EaseAIAlgorithmTest(AIAlgorithmTest):
     def test_serialized_classifier_not_a_dict(self):
         with self.assertRaises(InvalidClassifier):
             self.algorithm.score(u"Test ëṡṡäÿ", "not a dict", {})
+
+
+class EaseFeatureSharingTest(CacheResetTest):
+    """
+    Test that criteria with identical EASE feature extractors share generated features.
+    These tests use stub classifiers, so they don't require EASE.
+    """
+
+    def setUp(self):
+        self.algorithm = EaseAIAlgorithm()
+        mock_ease = mock.MagicMock()
+        patcher = mock.patch.dict('sys.modules', {'ease': mock_ease, 'ease.essay_set': mock_ease.essay_set})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_identical_feature_extractors(self):
+        feature_extractor = mock.MagicMock()
+        cache = {}
+        self.algorithm.score(u"Test ëṡṡäÿ", self._classifiers(feature_extractor, "abcd"), cache)
+        self.algorithm.score(u"Test ëṡṡäÿ", self._classifiers(feature_extractor, "abcd"), cache)
+        self.assertEqual(feature_extractor.gen_feats.call_count, 1)
+
+    def test_different_feature_extractors(self):
+        first_extractor, second_extractor = mock.MagicMock(), mock.MagicMock()
+        cache = {}
+        self.algorithm.score(u"Test ëṡṡäÿ", self._classifiers(first_extractor, "abcd"), cache)
+        self.algorithm.score(u"Test ëṡṡäÿ", self._classifiers(second_extractor, "efgh"), cache)
+        self.assertEqual(first_extractor.gen_feats.call_count, 1)
+        self.assertEqual(second_extractor.gen_feats.call_count, 1)
+
+    def test_fingerprint_from_training(self):
+        classifier = {
+            'feature_extractor': pickle.dumps({'vocabulary': [u"ëṡṡäÿ"]}, 2),
+            'score_classifier': pickle.dumps({'weights': [1, 2]}, 2),
+            'feature_extractor_fingerprint': u"abcd",
+        }
+        self.assertEqual(self.algorithm.load_classifier(classifier).fingerprint, u"abcd")
+
+    def test_fingerprint_legacy_classifier(self):
+        # Classifiers trained before we stored the fingerprint
+        # get a fingerprint calculated from the pickled feature extractor.
+        pickled_feature_extractor = pickle.dumps({'vocabulary': [u"ëṡṡäÿ"]})
+        classifier = {
+            'feature_extractor': base64.b64encode(pickled_feature_extractor),
+            'score_classifier': base64.b64encode(pickle.dumps({'weights': [1, 2]})),
+        }
+        loaded = self.algorithm.load_classifier(classifier)
+        self.assertEqual(loaded.feature_extractor, {'vocabulary': [u"ëṡṡäÿ"]})
+        self.assertEqual(loaded.fingerprint, hashlib.sha1(pickled_feature_extractor).hexdigest())
+
+    def _classifiers(self, feature_extractor, fingerprint):
+        """
+        Create stub classifiers that give every essay a score of one.
+        """
+        score_classifier = mock.MagicMock()
+        score_classifier.predict.return_value = [1]
+        return EaseAIAlgorithm.LoadedClassifiers(feature_extractor, score_classifier, fingerprint)
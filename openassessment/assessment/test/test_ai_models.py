@@ -3,14 +3,25 @@
 Test AI Django models.
 """
 import copy
+import datetime
+import json
+import pickle
+import time
+import zlib
+import ddt
+import mock
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import TestCase
 from django.test.utils import override_settings
 from openassessment.test_utils import CacheResetTest
 from openassessment.assessment.models import (
-    AIClassifierSet, AIClassifier, AIGradingWorkflow, AI_CLASSIFIER_STORAGE,
-    CLASSIFIERS_CACHE_IN_MEM
+    AIClassifierSet, AIClassifier, AIGradingWorkflow, AITrainingWorkflow, AI_CLASSIFIER_STORAGE,
+    CLASSIFIERS_CACHE_IN_MEM, ClassifierSerializeError, CLASSIFIER_DATA_VERSION,
+    encode_classifier_data, decode_classifier_data, is_legacy_classifier_data
 )
-from openassessment.assessment.serializers import rubric_from_dict
-from .constants import RUBRIC
+from openassessment.assessment.serializers import rubric_from_dict, deserialize_training_examples
+from .constants import RUBRIC, EXAMPLES
 
 
 CLASSIFIERS_DICT = {
@@ -43,6 +54,34 @@ class AIClassifierTest(CacheResetTest):
         self.assertEqual(components[1], AI_CLASSIFIER_STORAGE)
         self.assertGreater(len(components[2]), 0)
 
+    def test_download_classifier_data(self):
+        classifier = self._create_classifier()
+        self.assertIn(classifier.download_classifier_data(), CLASSIFIERS_DICT.values())
+
+        # The data is stored in the binary format
+        self.assertFalse(is_legacy_classifier_data(classifier.read_raw_classifier_data()))
+
+    def test_download_legacy_classifier_data(self):
+        # Replace the stored data with the older JSON format
+        classifier = self._create_classifier()
+        classifier.classifier_data.save(u"legacy", ContentFile(json.dumps(u"ŀɇꝁȺȼɏ")))
+        self.assertTrue(is_legacy_classifier_data(classifier.read_raw_classifier_data()))
+        self.assertEqual(classifier.download_classifier_data(), u"ŀɇꝁȺȼɏ")
+
+    def test_download_classifier_data_remote_storage(self):
+        # Storage backends like S3 don't provide a local path
+        classifier = self._create_classifier()
+        patched = 'django.db.models.fields.files.FieldFile.path'
+        with mock.patch(patched, new_callable=mock.PropertyMock) as mock_path:
+            mock_path.side_effect = NotImplementedError
+            self.assertIn(classifier.download_classifier_data(), CLASSIFIERS_DICT.values())
+
+    def test_download_empty_classifier_data(self):
+        classifier = self._create_classifier()
+        classifier.classifier_data.save(u"empty", ContentFile(""))
+        with self.assertRaisesRegexp(ValueError, "empty"):
+            classifier.download_classifier_data()
+
     def _create_classifier(self):
         """
         Create and return an AIClassifier.
@@ -54,6 +93,54 @@ class AIClassifierTest(CacheResetTest):
         return AIClassifier.objects.filter(classifier_set=classifier_set)[0]
 
 
+@ddt.ddt
+class ClassifierDataFormatTest(TestCase):
+    """
+    Tests for encoding and decoding stored classifier data.
+    """
+
+    CLASSIFIER_DATA = {
+        u"ƒɇȺŧᵾɍɇ_ɇxŧɍȺȼŧøɍ": "\x80\x02binary\x00data",
+        u"scores": [0, 1, 2.5],
+        u"ȼøᵾɍsɇ": None,
+    }
+
+    @ddt.data(True, False)
+    def test_round_trip(self, compress):
+        encoded = encode_classifier_data(self.CLASSIFIER_DATA, compress=compress)
+        self.assertEqual(decode_classifier_data(encoded), self.CLASSIFIER_DATA)
+
+    def test_legacy_json(self):
+        encoded = json.dumps({u"scores": [0, 1, 2]})
+        self.assertTrue(is_legacy_classifier_data(encoded))
+        self.assertEqual(decode_classifier_data(encoded), {u"scores": [0, 1, 2]})
+
+    def test_not_serializable(self):
+        with self.assertRaises(ClassifierSerializeError):
+            encode_classifier_data({u"created": datetime.datetime.now()})
+
+    def test_unknown_version(self):
+        encoded = encode_classifier_data(self.CLASSIFIER_DATA)
+        encoded = encoded[:6] + chr(CLASSIFIER_DATA_VERSION + 1) + encoded[7:]
+        with self.assertRaises(ValueError):
+            decode_classifier_data(encoded)
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            decode_classifier_data("")
+
+    def test_truncated(self):
+        encoded = encode_classifier_data(self.CLASSIFIER_DATA)
+        with self.assertRaises(ValueError):
+            decode_classifier_data(encoded[:-1])
+
+    def test_corrupted(self):
+        encoded = encode_classifier_data(self.CLASSIFIER_DATA)
+        header_size = len(encoded) - len(zlib.compress(pickle.dumps(self.CLASSIFIER_DATA, 2)))
+        with self.assertRaises(ValueError):
+            decode_classifier_data(encoded[:header_size] + "x" * (len(encoded) - header_size))
+
+
 class AIClassifierSetTest(CacheResetTest):
     """
     Tests for the AIClassifierSet model.
@@ -188,3 +275,102 @@ class AIGradingWorkflowTest(CacheResetTest):
         found = self.workflow.assign_most_recent_classifier_set()
         self.assertTrue(found)
         self.assertEqual(classifier_set.pk, self.workflow.classifier_set.pk)
+
+    def test_most_recent_classifier_set_cached(self):
+        classifier_set = AIClassifierSet.create_classifier_set(
+            self.CLASSIFIERS_DICT, self.rubric, self.ALGORITHM_ID,
+            self.COURSE_ID, self.ITEM_ID
+        )
+        found = AIClassifierSet.most_recent_classifier_set(
+            self.rubric, self.ALGORITHM_ID, self.COURSE_ID, self.ITEM_ID
+        )
+        self.assertEqual(found.pk, classifier_set.pk)
+
+        # The second lookup should use the cached result
+        with self.assertNumQueries(0):
+            found = AIClassifierSet.most_recent_classifier_set(
+                self.rubric, self.ALGORITHM_ID, self.COURSE_ID, self.ITEM_ID
+            )
+        self.assertEqual(found.pk, classifier_set.pk)
+
+        # Creating a new classifier set invalidates the cache
+        new_classifier_set = AIClassifierSet.create_classifier_set(
+            self.CLASSIFIERS_DICT, self.rubric, self.ALGORITHM_ID,
+            self.COURSE_ID, self.ITEM_ID
+        )
+        found = AIClassifierSet.most_recent_classifier_set(
+            self.rubric, self.ALGORITHM_ID, self.COURSE_ID, self.ITEM_ID
+        )
+        self.assertEqual(found.pk, new_classifier_set.pk)
+
+    def test_most_recent_classifier_set_cached_none(self):
+        # Cache the result that there are no classifier sets
+        self.assertIs(AIClassifierSet.most_recent_classifier_set(
+            self.rubric, self.ALGORITHM_ID, self.COURSE_ID, self.ITEM_ID
+        ), None)
+        with self.assertNumQueries(0):
+            self.assertIs(AIClassifierSet.most_recent_classifier_set(
+                self.rubric, self.ALGORITHM_ID, self.COURSE_ID, self.ITEM_ID
+            ), None)
+
+        # Completing a training workflow creates a classifier set,
+        # which we should find on the next lookup.
+        examples = deserialize_training_examples(EXAMPLES, RUBRIC)
+        training_workflow = AITrainingWorkflow.start_workflow(
+            examples, self.COURSE_ID, self.ITEM_ID, self.ALGORITHM_ID
+        )
+        training_workflow.complete(self.CLASSIFIERS_DICT)
+        found = AIClassifierSet.most_recent_classifier_set(
+            self.rubric, self.ALGORITHM_ID, self.COURSE_ID, self.ITEM_ID
+        )
+        self.assertEqual(found.pk, training_workflow.classifier_set.pk)
+
+    def test_most_recent_generation_outlives_default_timeout(self):
+        AIClassifierSet.invalidate_most_recent_classifier_sets()
+        generation = cache.get(AIClassifierSet.MOST_RECENT_GENERATION_CACHE_KEY)
+        self.assertIsNot(generation, None)
+
+        # The generation should still be cached after the default timeout (five minutes)
+        one_day_later = time.time() + 24 * 60 * 60
+        with mock.patch('django.core.cache.backends.locmem.time.time') as mock_time:
+            mock_time.return_value = one_day_later
+            self.assertEqual(cache.get(AIClassifierSet.MOST_RECENT_GENERATION_CACHE_KEY), generation)
+
+    def test_get_incomplete_workflows(self):
+        # Create more workflows, and mark one of them complete
+        workflows = [self.workflow]
+        for num in range(4):
+            workflows.append(AIGradingWorkflow.objects.create(
+                submission_uuid='test_{}'.format(num), essay_text='test',
+                rubric=self.rubric, algorithm_id=self.ALGORITHM_ID,
+                item_id=self.ITEM_ID, course_id=self.COURSE_ID
+            ))
+        workflows[1].mark_complete_and_save()
+        expected = [
+            (workflow.id, workflow.uuid, self.rubric.pk, self.ALGORITHM_ID, None)
+            for workflow in workflows if workflow.completed_at is None
+        ]
+
+        # Retrieve the workflows two at a time (plus one query to find there are no more)
+        with self.assertNumQueries(3):
+            incomplete = list(AIGradingWorkflow.get_incomplete_workflows(
+                self.COURSE_ID, self.ITEM_ID, chunk_size=2
+            ))
+        self.assertEqual(incomplete, expected)
+        self.assertEqual(incomplete[0].rubric_id, self.rubric.pk)
+
+        # Resume after a workflow
+        incomplete = list(AIGradingWorkflow.get_incomplete_workflows(
+            self.COURSE_ID, self.ITEM_ID, after_id=expected[1][0]
+        ))
+        self.assertEqual(incomplete, expected[2:])
+
+    def test_get_incomplete_training_workflows(self):
+        examples = deserialize_training_examples(EXAMPLES, RUBRIC)
+        workflow = AITrainingWorkflow.start_workflow(
+            examples, self.COURSE_ID, self.ITEM_ID, self.ALGORITHM_ID
+        )
+
+        # Training workflows don't have a rubric field
+        incomplete = list(AITrainingWorkflow.get_incomplete_workflows(self.COURSE_ID, self.ITEM_ID))
+        self.assertEqual(incomplete, [(workflow.id, workflow.uuid, None, self.ALGORITHM_ID, None)])
@@ -241,6 +241,7 @@ class AIWorkerGradingTest(CacheResetTest):
         expected_params = {
             'essay_text': ANSWER,
             'classifier_set': CLASSIFIERS,
+            'classifier_set_id': AIGradingWorkflow.objects.get(uuid=self.workflow_uuid).classifier_set_id,
             'algorithm_id': ALGORITHM_ID,
             'valid_scores': {
                 u"vøȼȺƀᵾłȺɍɏ": [0, 1, 2],
@@ -318,6 +319,25 @@ class AIWorkerGradingTest(CacheResetTest):
         with self.assertRaises(AIGradingInternalError):
             ai_worker_api.create_assessment(self.workflow_uuid, self.SCORES)
 
+    def test_create_assessments_batch_invalid_selection(self):
+        # Create a second workflow in the batch
+        submission = sub_api.create_submission(STUDENT_ITEM, ANSWER)
+        other_workflow = AIGradingWorkflow.start_workflow(submission['uuid'], RUBRIC, ALGORITHM_ID)
+
+        # The scores for the second workflow don't match any option in the rubric
+        invalid_scores = copy.deepcopy(self.SCORES)
+        invalid_scores[u"vøȼȺƀᵾłȺɍɏ"] = 999
+        ai_worker_api.create_assessments_batch({
+            self.workflow_uuid: self.SCORES,
+            other_workflow.uuid: invalid_scores,
+        })
+
+        # The valid workflow should be completed, and the invalid workflow skipped
+        self.assertTrue(ai_worker_api.is_grading_workflow_complete(self.workflow_uuid))
+        self.assertEqual(Assessment.objects.get(submission_uuid=self.submission_uuid).points_earned, 1)
+        self.assertFalse(ai_worker_api.is_grading_workflow_complete(other_workflow.uuid))
+        self.assertFalse(Assessment.objects.filter(submission_uuid=submission['uuid']).exists())
+
     def test_is_workflow_complete(self):
         self.assertFalse(ai_worker_api.is_grading_workflow_complete(self.workflow_uuid))
         workflow = AIGradingWorkflow.objects.get(uuid=self.workflow_uuid)
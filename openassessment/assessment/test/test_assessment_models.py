@@ -3,6 +3,7 @@
 Tests for the assessment Django models.
 """
 import copy, ddt
+import mock
 from openassessment.test_utils import CacheResetTest
 from openassessment.assessment.serializers import rubric_from_dict
 from openassessment.assessment.models import Assessment, AssessmentPart, InvalidRubricSelection
@@ -133,6 +134,45 @@ class AssessmentTest(CacheResetTest):
         with self.assertRaises(InvalidRubricSelection):
             AssessmentPart.create_from_option_names(assessment, selected, feedback=feedback)
 
+    def test_scores_by_criterion(self):
+        rubric = self._rubric_with_one_feedback_only_criterion()
+        assessment_ids = []
+        for selected in [{u"vøȼȺƀᵾłȺɍɏ": 2, u"ﻭɼค๓๓คɼ": 1}, {u"vøȼȺƀᵾłȺɍɏ": 1, u"ﻭɼค๓๓คɼ": 0}]:
+            assessment = Assessment.create(rubric, "Bob", "submission UUID", "PE")
+            AssessmentPart.create_from_option_points(assessment, selected)
+            assessment_ids.append(assessment.id)
+
+        expected = {
+            u"vøȼȺƀᵾłȺɍɏ": [2, 1],
+            u"ﻭɼค๓๓คɼ": [1, 0],
+            u"feedback": [0, 0],
+        }
+        with mock.patch('openassessment.assessment.models.base.dog_stats_api') as mock_stats:
+            scores = Assessment.scores_by_criterion_for_ids(assessment_ids)
+            mock_stats.increment.assert_called_once_with('openassessment.assessment.scores_by_criterion.cache_miss')
+        self.assertIs(type(scores), dict)
+        self.assertEqual({name: sorted(points) for name, points in scores.iteritems()}, {
+            name: sorted(points) for name, points in expected.iteritems()
+        })
+
+        # The second time, the scores should come from the cache,
+        # regardless of the order of the IDs
+        with self.assertNumQueries(0):
+            with mock.patch('openassessment.assessment.models.base.dog_stats_api') as mock_stats:
+                cached_scores = Assessment.scores_by_criterion_for_ids(reversed(assessment_ids))
+                mock_stats.increment.assert_called_once_with('openassessment.assessment.scores_by_criterion.cache_hit')
+        self.assertEqual(cached_scores, scores)
+
+    def test_scores_by_criterion_cache_key_length(self):
+        # Even with many assessments, the key must be short enough for memcached
+        short_key = Assessment._scores_by_criterion_cache_key([1])
+        long_key = Assessment._scores_by_criterion_cache_key(range(1000000, 1001000))
+        self.assertEqual(len(short_key), len(long_key))
+        self.assertLess(len(long_key), 250)
+
+    def test_scores_by_criterion_no_assessments(self):
+        self.assertEqual(Assessment.scores_by_criterion_for_ids([]), {})
+
     def _rubric_with_one_feedback_only_criterion(self):
         """Create a rubric with one feedback-only criterion."""
         rubric_dict = copy.deepcopy(RUBRIC)
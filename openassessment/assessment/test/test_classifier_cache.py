@@ -0,0 +1,87 @@
+# coding=utf-8
+"""
+Tests for the in-memory cache of loaded classifiers.
+"""
+import mock
+from django.test import TestCase
+from django.test.utils import override_settings
+from openassessment.assessment.worker.classifier_cache import (
+    ClassifierLRUCache, serialized_size
+)
+
+
+class ClassifierLRUCacheTest(TestCase):
+    """
+    Tests for the size-bounded LRU cache of classifiers.
+    """
+
+    def setUp(self):
+        self.cache = ClassifierLRUCache(max_bytes=10)
+
+    def test_hit_and_miss(self):
+        load = mock.Mock(return_value="classifier")
+        self.assertEqual(self.cache.get_or_load((1, u"ȼɍɨŧɇɍɨøn"), load, 4), "classifier")
+        self.assertEqual(self.cache.get_or_load((1, u"ȼɍɨŧɇɍɨøn"), load, 4), "classifier")
+
+        # The classifier should have been loaded only once
+        self.assertEqual(load.call_count, 1)
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['bytes'], 4)
+
+    def test_evict_least_recently_used(self):
+        self.cache.get_or_load('first', lambda: 1, 4)
+        self.cache.get_or_load('second', lambda: 2, 4)
+
+        # Use the first classifier, so the second is evicted next
+        self.cache.get_or_load('first', lambda: 1, 4)
+        self.cache.get_or_load('third', lambda: 3, 4)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['bytes'], 8)
+
+        # The first classifier is still cached, but the second must be reloaded
+        load = mock.Mock(return_value=2)
+        self.cache.get_or_load('first', load, 4)
+        self.assertFalse(load.called)
+        self.cache.get_or_load('second', load, 4)
+        self.assertTrue(load.called)
+
+    def test_classifier_larger_than_cache(self):
+        self.cache.get_or_load('small', lambda: 1, 4)
+        self.assertEqual(self.cache.get_or_load('large', lambda: 2, 11), 2)
+
+        # The large classifier isn't cached, and doesn't evict anything
+        stats = self.cache.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['evictions'], 0)
+
+    def test_load_error(self):
+        load = mock.Mock(side_effect=ValueError("Test error"))
+        with self.assertRaises(ValueError):
+            self.cache.get_or_load('key', load, 4)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_clear(self):
+        self.cache.get_or_load('key', lambda: 1, 4)
+        self.cache.clear()
+        self.assertEqual(self.cache.stats(), {
+            'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 0, 'bytes': 0
+        })
+
+    @override_settings(ORA2_AI_CLASSIFIER_CACHE_MAX_BYTES=5)
+    def test_max_bytes_from_settings(self):
+        cache = ClassifierLRUCache()
+        self.assertEqual(cache.max_bytes, 5)
+
+    def test_serialized_size(self):
+        classifier = {
+            'feature_extractor': u"ƒɇȺŧᵾɍɇ",
+            'score_classifier': "abc",
+            'scores': [1, 2, u"ab"],
+        }
+        self.assertEqual(serialized_size(classifier), 12)
@@ -0,0 +1,85 @@
+# coding=utf-8
+"""
+Tests for the shared cache of essay scores.
+"""
+import mock
+from django.core.cache import cache, get_cache
+from django.test.utils import override_settings
+from openassessment.test_utils import CacheResetTest
+from openassessment.assessment.worker.essay_score_cache import (
+    normalize_essay_text, get_cached_scores, cache_scores
+)
+
+
+class EssayScoreCacheTest(CacheResetTest):
+    """
+    Tests for caching the scores assigned to duplicate essays.
+    """
+
+    SCORES = {u"vøȼȺƀᵾłȺɍɏ": 1, u"ﻭɼค๓๓คɼ": 2}
+
+    def test_normalize_essay_text(self):
+        self.assertEqual(normalize_essay_text(u"  ẗëṡẗ \n\t äṅṡẅëṛ\n"), u"ẗëṡẗ äṅṡẅëṛ")
+
+    def test_duplicate_essays(self):
+        cache_scores({'first': u"ẗëṡẗ äṅṡẅëṛ"}, {'first': self.SCORES}, 1)
+
+        # Essays that differ only in whitespace share the cached scores
+        scores = get_cached_scores({'second': u"ẗëṡẗ\n\näṅṡẅëṛ ", 'third': u"other"}, 1)
+        self.assertEqual(scores, {'second': self.SCORES})
+
+    def test_different_classifier_set(self):
+        cache_scores({'first': u"ẗëṡẗ äṅṡẅëṛ"}, {'first': self.SCORES}, 1)
+        self.assertEqual(get_cached_scores({'second': u"ẗëṡẗ äṅṡẅëṛ"}, 2), {})
+
+    def test_no_classifier_set_id(self):
+        cache_scores({'first': u"ẗëṡẗ äṅṡẅëṛ"}, {'first': self.SCORES}, None)
+        self.assertEqual(get_cached_scores({'first': u"ẗëṡẗ äṅṡẅëṛ"}, None), {})
+
+    @override_settings(ORA2_AI_ESSAY_SCORE_CACHE_MAX_LENGTH=5)
+    def test_long_essays_not_cached(self):
+        essays = {'short': u"ẗëṡẗ", 'long': u"ẗëṡẗ äṅṡẅëṛ"}
+        cache_scores(essays, {'short': self.SCORES, 'long': self.SCORES}, 1)
+        self.assertEqual(get_cached_scores(essays, 1), {'short': self.SCORES})
+
+    @override_settings(ORA2_AI_ESSAY_SCORE_CACHE_MAX_LENGTH=0)
+    def test_disabled(self):
+        cache_scores({'first': u""}, {'first': self.SCORES}, 1)
+        self.assertEqual(get_cached_scores({'first': u""}, 1), {})
+
+    @mock.patch('openassessment.assessment.worker.essay_score_cache.dog_stats_api')
+    def test_hit_rate_metrics(self, mock_stats):
+        cache_scores({'first': u"ẗëṡẗ äṅṡẅëṛ"}, {'first': self.SCORES}, 1)
+        get_cached_scores({'first': u"ẗëṡẗ äṅṡẅëṛ", 'second': u"other", 'third': u"another"}, 1)
+        mock_stats.increment.assert_any_call(
+            'openassessment.assessment.ai.essay_score_cache.hit', value=1
+        )
+        mock_stats.increment.assert_any_call(
+            'openassessment.assessment.ai.essay_score_cache.miss', value=2
+        )
+
+    @override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'default_loc_mem',
+            },
+            'essay_scores': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'essay_score_loc_mem',
+            },
+        },
+        ORA2_AI_ESSAY_SCORE_CACHE='essay_scores'
+    )
+    def test_cache_alias(self):
+        # The cache alias setting is read when the cache is used
+        essay_cache = get_cache('essay_scores')
+        essay_cache.clear()
+        cache_scores({'first': u"ẗëṡẗ äṅṡẅëṛ"}, {'first': self.SCORES}, 1)
+        self.assertEqual(get_cached_scores({'first': u"ẗëṡẗ äṅṡẅëṛ"}, 1), {'first': self.SCORES})
+
+        # The scores are stored in the configured cache, not the default cache
+        cache.clear()
+        self.assertEqual(get_cached_scores({'first': u"ẗëṡẗ äṅṡẅëṛ"}, 1), {'first': self.SCORES})
+        essay_cache.clear()
+        self.assertEqual(get_cached_scores({'first': u"ẗëṡẗ äṅṡẅëṛ"}, 1), {})
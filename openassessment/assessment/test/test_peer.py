@@ -2,10 +2,12 @@
 import datetime
 import pytz
 import copy
+import random
+from collections import Counter
 
-from django.db import DatabaseError, IntegrityError
+from django.db import connection, DatabaseError, IntegrityError
 from django.utils import timezone
-from ddt import ddt, file_data
+from ddt import ddt, data, file_data
 from mock import patch
 from nose.tools import raises
 
@@ -360,6 +362,55 @@ class TestPeerApi(CacheResetTest):
         self.assertTrue(finished)
         self.assertEqual(count, 1)
 
+    def test_finished_bulk(self):
+        tim_sub, _ = self._create_student_and_submission("Tim", "Tim's answer")
+        bob_sub, bob = self._create_student_and_submission("Bob", "Bob's answer")
+        sally_sub, _ = self._create_student_and_submission("Sally", "Sally's answer")
+        peer_api.get_submission_to_assess(bob_sub['uuid'], 1)
+        peer_api.create_assessment(
+            bob_sub["uuid"], bob["student_id"],
+            ASSESSMENT_DICT['options_selected'],
+            ASSESSMENT_DICT['criterion_feedback'],
+            ASSESSMENT_DICT['overall_feedback'],
+            RUBRIC_DICT,
+            1,
+        )
+        submission_uuids = [tim_sub['uuid'], bob_sub['uuid'], sally_sub['uuid'], "no such submission"]
+        requirements = {"must_grade": 1, "must_be_graded_by": 1}
+
+        # The bulk functions should agree with the single-submission functions
+        for bulk_func, single_func in [
+            (peer_api.submitter_is_finished_bulk, peer_api.submitter_is_finished),
+            (peer_api.assessment_is_finished_bulk, peer_api.assessment_is_finished),
+        ]:
+            finished = bulk_func(submission_uuids, requirements)
+            self.assertEqual(finished, {
+                submission_uuid: single_func(submission_uuid, requirements)
+                for submission_uuid in submission_uuids
+            })
+            self.assertEqual(bulk_func(submission_uuids, None), {
+                submission_uuid: False for submission_uuid in submission_uuids
+            })
+
+        self.assertTrue(peer_api.submitter_is_finished_bulk(submission_uuids, requirements)[bob_sub['uuid']])
+        self.assertTrue(peer_api.assessment_is_finished_bulk(submission_uuids, requirements)[tim_sub['uuid']])
+
+    def test_on_start_bulk(self):
+        tim_sub, _ = self._create_student_and_submission("Tim", "Tim's answer")
+        bob_student_item = STUDENT_ITEM.copy()
+        bob_student_item["student_id"] = "Bob"
+        bob_sub = sub_api.create_submission(bob_student_item, "Bob's answer")
+
+        # Only the submission without a peer workflow needs to be created
+        with patch.object(peer_api, 'on_start') as mock_on_start:
+            peer_api.on_start_bulk([tim_sub['uuid'], bob_sub['uuid']])
+        mock_on_start.assert_called_once_with(bob_sub['uuid'])
+
+        peer_api.on_start_bulk([tim_sub['uuid'], bob_sub['uuid']])
+        self.assertEqual(
+            PeerWorkflow.objects.filter(submission_uuid__in=[tim_sub['uuid'], bob_sub['uuid']]).count(), 2
+        )
+
     def test_peer_leases_same_submission(self):
         """
         Tests the scenario where a student pulls a peer's submission for
@@ -882,6 +933,45 @@ class TestPeerApi(CacheResetTest):
         item = buffy_workflow.find_active_assessments()
         self.assertEqual(xander_answer["uuid"], item.submission_uuid)
 
+    def test_find_active_assessments_skips_expired(self):
+        buffy_answer, _ = self._create_student_and_submission("Buffy", "Buffy's answer")
+        xander_answer, _ = self._create_student_and_submission("Xander", "Xander's answer")
+        willow_answer, _ = self._create_student_and_submission("Willow", "Willow's answer")
+        buffy_workflow = PeerWorkflow.get_by_submission_uuid(buffy_answer['uuid'])
+
+        # Buffy opens two leases, both of which expire
+        expired = timezone.now() - PeerWorkflow.TIME_LIMIT - datetime.timedelta(minutes=1)
+        for num, answer in enumerate([xander_answer, willow_answer]):
+            PeerWorkflow.create_item(buffy_workflow, answer["uuid"])
+            PeerWorkflowItem.objects.filter(
+                scorer=buffy_workflow, submission_uuid=answer["uuid"]
+            ).update(started_at=expired - datetime.timedelta(minutes=num))
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(buffy_workflow.find_active_assessments())
+
+    def test_find_active_assessments_skips_completed_submissions(self):
+        buffy_answer, _ = self._create_student_and_submission("Buffy", "Buffy's answer")
+        xander_answer, _ = self._create_student_and_submission("Xander", "Xander's answer")
+        buffy_workflow = PeerWorkflow.get_by_submission_uuid(buffy_answer['uuid'])
+
+        # Buffy assesses Xander, but still has another open lease for Xander
+        peer_api.get_submission_to_assess(buffy_answer['uuid'], 1)
+        peer_api.create_assessment(
+            buffy_answer['uuid'], "Buffy",
+            ASSESSMENT_DICT['options_selected'],
+            ASSESSMENT_DICT['criterion_feedback'],
+            ASSESSMENT_DICT['overall_feedback'],
+            RUBRIC_DICT, 1
+        )
+        PeerWorkflowItem.objects.create(
+            scorer=buffy_workflow,
+            author=PeerWorkflow.get_by_submission_uuid(xander_answer['uuid']),
+            submission_uuid=xander_answer['uuid']
+        )
+
+        self.assertIsNone(buffy_workflow.find_active_assessments())
+
     def test_get_workflow_by_uuid(self):
         buffy_answer, _ = self._create_student_and_submission("Buffy", "Buffy's answer")
         self._create_student_and_submission("Xander", "Xander's answer")
@@ -1016,7 +1106,7 @@ class TestPeerApi(CacheResetTest):
         submitted_assessments = peer_api.get_submitted_assessments(bob_sub["uuid"], scored_only=False)
         self.assertEqual(1, len(submitted_assessments))
 
-    @patch.object(PeerWorkflow.objects, 'raw')
+    @patch.object(PeerWorkflow.objects, 'filter')
     @raises(peer_api.PeerAssessmentInternalError)
     def test_failure_to_get_review_submission(self, mock_filter):
         tim_answer, _ = self._create_student_and_submission("Tim", "Tim's answer", MONDAY)
@@ -1297,7 +1387,7 @@ class TestPeerApi(CacheResetTest):
         tim_sub, tim = self._create_student_and_submission('Tim', 'Tim submission')
 
         # Bob assesses someone else, satisfying his requirements
-        peer_api.get_submission_to_assess(bob_sub['uuid'], bob['student_id'])
+        peer_api.get_submission_to_assess(bob_sub['uuid'], required_graded_by)
         peer_api.create_assessment(
             bob_sub['uuid'],
             bob['student_id'],
@@ -1309,7 +1399,7 @@ class TestPeerApi(CacheResetTest):
         )
 
         # Tim grades Bob, so now Bob has one assessment
-        peer_api.get_submission_to_assess(tim_sub['uuid'], tim['student_id'])
+        peer_api.get_submission_to_assess(tim_sub['uuid'], required_graded_by)
         peer_api.create_assessment(
             tim_sub['uuid'],
             tim['student_id'],
@@ -1331,7 +1421,7 @@ class TestPeerApi(CacheResetTest):
         sue_sub, sue = self._create_student_and_submission('Sue', 'Sue submission')
 
         # Sue grades the only person in the queue, who is Tim because Tim still needs an assessment
-        peer_api.get_submission_to_assess(sue_sub['uuid'], sue['student_id'])
+        peer_api.get_submission_to_assess(sue_sub['uuid'], required_graded_by)
         peer_api.create_assessment(
             sue_sub['uuid'],
             sue['student_id'],
@@ -1343,7 +1433,7 @@ class TestPeerApi(CacheResetTest):
         )
 
         # Sue grades the only person she hasn't graded yet (Bob)
-        peer_api.get_submission_to_assess(sue_sub['uuid'], sue['student_id'])
+        peer_api.get_submission_to_assess(sue_sub['uuid'], required_graded_by)
         peer_api.create_assessment(
             sue_sub['uuid'],
             sue['student_id'],
@@ -1364,6 +1454,48 @@ class TestPeerApi(CacheResetTest):
         self.assertEqual(len(scored_assessments), 1)
         self.assertEqual(scored_assessments[0]['scorer_id'], tim['student_id'])
 
+    @data(1, 3)
+    def test_get_score_num_queries(self, num_graders):
+        requirements = {
+            'must_grade': 1,
+            'must_be_graded_by': num_graders
+        }
+
+        # Bob assesses one of his graders, satisfying his requirements
+        bob_sub, bob = self._create_student_and_submission('Bob', 'Bob submission')
+        graders = [
+            self._create_student_and_submission(u'Grader {}'.format(num), u'Answer {}'.format(num))
+            for num in range(num_graders)
+        ]
+        peer_api.get_submission_to_assess(bob_sub['uuid'], num_graders)
+        peer_api.create_assessment(
+            bob_sub['uuid'], bob['student_id'],
+            ASSESSMENT_DICT['options_selected'],
+            ASSESSMENT_DICT['criterion_feedback'],
+            ASSESSMENT_DICT['overall_feedback'],
+            RUBRIC_DICT, num_graders
+        )
+
+        # Each grader assesses Bob
+        for grader_sub, grader in graders:
+            peer_api.get_submission_to_assess(grader_sub['uuid'], num_graders)
+            peer_api.create_assessment(
+                grader_sub['uuid'], grader['student_id'],
+                ASSESSMENT_DICT['options_selected'],
+                ASSESSMENT_DICT['criterion_feedback'],
+                ASSESSMENT_DICT['overall_feedback'],
+                RUBRIC_DICT, num_graders
+            )
+
+        # The number of queries should not depend on the number of assessments
+        with self.assertNumQueries(10):
+            score = peer_api.get_score(bob_sub['uuid'], requirements)
+
+        self.assertEqual(score['points_possible'], 14)
+        self.assertEqual(score['points_earned'], 6)
+        scored_assessments = peer_api.get_assessments(bob_sub['uuid'], scored_only=True)
+        self.assertEqual(len(scored_assessments), num_graders)
+
     @raises(peer_api.PeerAssessmentInternalError)
     def test_create_assessment_database_error(self):
         self._create_student_and_submission("Bob", "Bob's answer")
@@ -1452,6 +1584,192 @@ class PeerWorkflowTest(CacheResetTest):
         # This used to cause an error when `get_or_create` returned multiple workflow items
         PeerWorkflow.create_item(scorer_workflow, submitter_sub['uuid'])
 
+    def test_queue_counters(self):
+        submitter_sub = sub_api.create_submission(self.STUDENT_ITEM, 'test answer')
+        peer_api.on_start(submitter_sub['uuid'])
+        scorer_sub = sub_api.create_submission(self.OTHER_STUDENT, 'test answer 2')
+        peer_api.on_start(scorer_sub['uuid'])
+        scorer_workflow = PeerWorkflow.get_by_submission_uuid(scorer_sub['uuid'])
+
+        # Leasing the submission counts as an open assessment
+        PeerWorkflow.create_item(scorer_workflow, submitter_sub['uuid'])
+        submitter_workflow = PeerWorkflow.get_by_submission_uuid(submitter_sub['uuid'])
+        self.assertEqual(submitter_workflow.assessed_count, 0)
+        self.assertEqual(submitter_workflow.open_count, 1)
+        self.assertIsNotNone(submitter_workflow.last_leased_at)
+
+        # Re-leasing the same submission does not count twice
+        PeerWorkflow.create_item(scorer_workflow, submitter_sub['uuid'])
+        submitter_workflow = PeerWorkflow.get_by_submission_uuid(submitter_sub['uuid'])
+        self.assertEqual(submitter_workflow.open_count, 1)
+
+        # Completing the assessment moves the lease to the assessed count
+        peer_api.create_assessment(
+            scorer_sub['uuid'], self.OTHER_STUDENT['student_id'],
+            ASSESSMENT_DICT['options_selected'],
+            ASSESSMENT_DICT['criterion_feedback'],
+            ASSESSMENT_DICT['overall_feedback'],
+            RUBRIC_DICT, 1
+        )
+        submitter_workflow = PeerWorkflow.get_by_submission_uuid(submitter_sub['uuid'])
+        self.assertEqual(submitter_workflow.assessed_count, 1)
+        self.assertEqual(submitter_workflow.open_count, 0)
+        self.assertIsNotNone(submitter_workflow.grading_completed_at)
+
+    def test_queue_skips_active_leases(self):
+        submitter_sub = sub_api.create_submission(self.STUDENT_ITEM, 'test answer')
+        peer_api.on_start(submitter_sub['uuid'])
+        scorer_sub = sub_api.create_submission(self.OTHER_STUDENT, 'test answer 2')
+        peer_api.on_start(scorer_sub['uuid'])
+        third_student = dict(self.OTHER_STUDENT, student_id='test_student_3')
+        third_sub = sub_api.create_submission(third_student, 'test answer 3')
+        peer_api.on_start(third_sub['uuid'])
+
+        scorer_workflow = PeerWorkflow.get_by_submission_uuid(scorer_sub['uuid'])
+        third_workflow = PeerWorkflow.get_by_submission_uuid(third_sub['uuid'])
+
+        # The scorer holds an active lease, so the submission
+        # is no longer available when only one grade is required.
+        PeerWorkflow.create_item(scorer_workflow, submitter_sub['uuid'])
+        self.assertEqual(third_workflow.get_submission_for_review(1), scorer_sub['uuid'])
+        self.assertEqual(third_workflow.get_submission_for_review(2), submitter_sub['uuid'])
+
+        # Once the lease expires, the submission is back in the queue
+        PeerWorkflowItem.objects.filter(scorer=scorer_workflow).update(
+            started_at=timezone.now() - PeerWorkflow.TIME_LIMIT - datetime.timedelta(minutes=1)
+        )
+        self.assertEqual(third_workflow.get_submission_for_review(1), submitter_sub['uuid'])
+
+    def test_queue_counts_only_active_leases(self):
+        submitter_sub = sub_api.create_submission(self.STUDENT_ITEM, 'test answer')
+        peer_api.on_start(submitter_sub['uuid'])
+        scorer_workflows = []
+        for num in range(2, 5):
+            student_item = dict(self.OTHER_STUDENT, student_id='test_student_{}'.format(num))
+            scorer_sub = sub_api.create_submission(student_item, 'test answer {}'.format(num))
+            peer_api.on_start(scorer_sub['uuid'])
+            scorer_workflows.append(PeerWorkflow.get_by_submission_uuid(scorer_sub['uuid']))
+
+        # Two scorers lease the submission, but the first lease expires
+        PeerWorkflow.create_item(scorer_workflows[0], submitter_sub['uuid'])
+        PeerWorkflowItem.objects.filter(scorer=scorer_workflows[0]).update(
+            started_at=timezone.now() - PeerWorkflow.TIME_LIMIT - datetime.timedelta(minutes=1)
+        )
+        PeerWorkflow.create_item(scorer_workflows[1], submitter_sub['uuid'])
+
+        # Only the active lease counts towards the required grades
+        self.assertEqual(scorer_workflows[2].get_submission_for_review(2), submitter_sub['uuid'])
+        self.assertNotEqual(scorer_workflows[2].get_submission_for_review(1), submitter_sub['uuid'])
+
+    @patch.object(PeerWorkflow, 'QUEUE_BATCH_SIZE', 1)
+    def test_queue_query_has_no_subqueries(self):
+        scorer_sub = sub_api.create_submission(self.STUDENT_ITEM, 'test answer')
+        peer_api.on_start(scorer_sub['uuid'])
+        scorer_workflow = PeerWorkflow.get_by_submission_uuid(scorer_sub['uuid'])
+
+        submission_uuids = []
+        for num in range(2, 7):
+            student_item = dict(self.OTHER_STUDENT, student_id='test_student_{}'.format(num))
+            submission = sub_api.create_submission(student_item, 'test answer {}'.format(num))
+            peer_api.on_start(submission['uuid'])
+            submission_uuids.append(submission['uuid'])
+
+        # The scorer has already assessed the first submission,
+        # and two other students hold active leases on the second.
+        self.assertEqual(peer_api.get_submission_to_assess(scorer_sub['uuid'], 2)['uuid'], submission_uuids[0])
+        peer_api.create_assessment(
+            scorer_sub['uuid'], self.STUDENT_ITEM['student_id'],
+            ASSESSMENT_DICT['options_selected'],
+            ASSESSMENT_DICT['criterion_feedback'],
+            ASSESSMENT_DICT['overall_feedback'],
+            RUBRIC_DICT, 2
+        )
+        for submission_uuid in submission_uuids[3:]:
+            PeerWorkflow.create_item(PeerWorkflow.get_by_submission_uuid(submission_uuid), submission_uuids[1])
+
+        connection.use_debug_cursor = True
+        try:
+            num_queries = len(connection.queries)
+            self.assertEqual(scorer_workflow.get_submission_for_review(2), submission_uuids[2])
+            queries = [query['sql'] for query in connection.queries[num_queries:]]
+        finally:
+            connection.use_debug_cursor = False
+
+        # Each batch reads the queue with a single range query, and checks
+        # the batch with queries that don't depend on the number of candidates.
+        self.assertEqual(len(queries), 7)
+        for sql in queries:
+            self.assertEqual(sql.upper().count('SELECT'), 1, sql)
+
+    def test_over_grading_selection_is_uniform(self):
+        scorer_workflow, candidate_uuids = self._create_over_grading_workflows()
+
+        random.seed(0)
+        num_picks = 1000
+        picks = Counter(
+            scorer_workflow.get_submission_for_over_grading()
+            for _ in range(num_picks)
+        )
+
+        # Only eligible submissions are chosen, and each about equally often
+        self.assertItemsEqual(picks.keys(), candidate_uuids)
+        expected = num_picks / len(candidate_uuids)
+        for count in picks.values():
+            self.assertGreater(count, expected * 0.7)
+            self.assertLess(count, expected * 1.3)
+
+    def test_over_grading_fallback(self):
+        scorer_workflow, candidate_uuids = self._create_over_grading_workflows()
+
+        # If none of the random probes find a candidate, we fall back to
+        # a key range scan, which still returns an eligible submission.
+        with patch.object(PeerWorkflow, 'OVER_GRADING_SAMPLE_ATTEMPTS', 0):
+            picks = set(
+                scorer_workflow.get_submission_for_over_grading()
+                for _ in range(50)
+            )
+        self.assertTrue(picks.issubset(candidate_uuids))
+
+    def test_over_grading_no_candidates(self):
+        scorer_workflow = PeerWorkflow.objects.create(
+            student_id=self.STUDENT_ITEM['student_id'],
+            item_id=self.STUDENT_ITEM['item_id'],
+            course_id=self.STUDENT_ITEM['course_id'],
+            submission_uuid='scorer'
+        )
+        self.assertIs(scorer_workflow.get_submission_for_over_grading(), None)
+
+    def _create_over_grading_workflows(self):
+        """
+        Create peer workflows for over grading, interleaved with workflows
+        for another item so that the primary keys of the candidates have gaps.
+
+        Returns:
+            tuple of (scorer workflow, list of eligible submission UUIDs)
+        """
+        def _create_workflow(student_id, item_id, submission_uuid):
+            return PeerWorkflow.objects.create(
+                student_id=student_id,
+                item_id=item_id,
+                course_id=self.STUDENT_ITEM['course_id'],
+                submission_uuid=submission_uuid
+            )
+
+        scorer_workflow = _create_workflow(self.STUDENT_ITEM['student_id'], self.STUDENT_ITEM['item_id'], 'scorer')
+        candidate_uuids = []
+        for num in range(6):
+            for other_num in range(num):
+                _create_workflow('other_{}'.format(other_num), 'other_item', 'other_{}_{}'.format(num, other_num))
+            submission_uuid = 'peer_{}'.format(num)
+            _create_workflow('peer_{}'.format(num), self.STUDENT_ITEM['item_id'], submission_uuid)
+            candidate_uuids.append(submission_uuid)
+
+        # The scorer has already assessed one of the submissions,
+        # so it is no longer eligible for over grading.
+        already_assessed = candidate_uuids.pop()
+        PeerWorkflow.create_item(scorer_workflow, already_assessed)
+        return scorer_workflow, candidate_uuids
+
 
 class AssessmentFeedbackTest(CacheResetTest):
     """
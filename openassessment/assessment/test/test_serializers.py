@@ -7,12 +7,13 @@ import json
 import os.path
 import copy
 
+from django.core.cache import cache
 from openassessment.test_utils import CacheResetTest
 from openassessment.assessment.models import (
     Assessment, AssessmentPart, AssessmentFeedback
 )
 from openassessment.assessment.serializers import (
-    rubric_from_dict, full_assessment_dict,
+    rubric_from_dict, full_assessment_dict, serialize_assessments,
     AssessmentFeedbackSerializer, InvalidRubric
 )
 from .constants import RUBRIC
@@ -153,3 +154,45 @@ class AssessmentSerializerTest(CacheResetTest):
         # Verify that the assessment dict correctly serialized the criterion with no options.
         self.assertIs(serialized['parts'][2]['option'], None)
         self.assertEqual(serialized['parts'][2]['criterion']['name'], u"feedback only")
+
+    def test_serialize_assessments(self):
+        rubric = rubric_from_dict(RUBRIC)
+        for scorer_id in ["Bob", "Tim", "Sue", "Ann"]:
+            assessment = Assessment.create(rubric, scorer_id, "submission UUID", "PE")
+            AssessmentPart.create_from_option_names(assessment, {
+                u"vøȼȺƀᵾłȺɍɏ": u"𝓰𝓸𝓸𝓭",
+                u"ﻭɼค๓๓คɼ": u"єχ¢єℓℓєηт",
+            })
+        assessments = Assessment.objects.filter(submission_uuid="submission UUID")
+        expected = [
+            self._summarize(full_assessment_dict(assessment))
+            for assessment in assessments
+        ]
+
+        # With nothing cached, we need one query for the assessments,
+        # one for all of their parts, and the rest to serialize the rubric.
+        cache.clear()
+        with self.assertNumQueries(10):
+            serialized = serialize_assessments(assessments)
+        self.assertEqual([self._summarize(assessment) for assessment in serialized], expected)
+
+        # Once everything is cached, we need only the assessments query
+        with self.assertNumQueries(1):
+            serialized = serialize_assessments(assessments)
+        self.assertEqual([self._summarize(assessment) for assessment in serialized], expected)
+
+    @staticmethod
+    def _summarize(assessment_dict):
+        """
+        Summarize a serialized assessment, since the full dict
+        contains circular references that can't be compared.
+        """
+        return (
+            assessment_dict['scorer_id'],
+            assessment_dict['points_earned'],
+            assessment_dict['points_possible'],
+            [
+                (part['criterion']['name'], part['option']['name'], part['feedback'])
+                for part in assessment_dict['parts']
+            ]
+        )
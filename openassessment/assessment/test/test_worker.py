@@ -4,12 +4,16 @@ Tests for AI worker tasks.
 """
 from contextlib import contextmanager
 import itertools
+import time
 import mock
+from celery.exceptions import NotConfigured
+from django.db import DatabaseError
 from django.test.utils import override_settings
 from submissions import api as sub_api
 from openassessment.test_utils import CacheResetTest
 from openassessment.assessment.worker.training import train_classifiers, InvalidExample
-from openassessment.assessment.worker.grading import grade_essay
+from openassessment.assessment.worker.grading import grade_essay, grade_essays_batch, reschedule_grading_tasks
+from openassessment.assessment.worker.classifier_cache import LOADED_CLASSIFIERS
 from openassessment.assessment.api import ai_worker as ai_worker_api
 from openassessment.assessment.models import AITrainingWorkflow, AIGradingWorkflow, AIClassifierSet
 from openassessment.assessment.worker.algorithm import (
@@ -48,6 +52,26 @@ class ErrorStubAIAlgorithm(AIAlgorithm):
         raise ScoreError("Test error!")
 
 
+class UnpicklableTrainingError(TrainingError):
+    """
+    Training error whose constructor takes several arguments,
+    so it can't be unpickled.
+    """
+    def __init__(self, num_examples, msg):
+        super(UnpicklableTrainingError, self).__init__(u"{} examples: {}".format(num_examples, msg))
+
+
+class UnpicklableErrorAIAlgorithm(AIAlgorithm):
+    """
+    Stub implementation that raises an exception that can't be unpickled during training.
+    """
+    def train_classifier(self, examples):
+        raise UnpicklableTrainingError(len(examples), "Test error!")
+
+    def score(self, text, classifier, cache):
+        raise ScoreError("Test error!")
+
+
 class InvalidScoreAlgorithm(AIAlgorithm):
     """
     Stub implementation that returns a score that isn't in the rubric.
@@ -114,11 +138,13 @@ class AITrainingTaskTest(CeleryTaskTest):
     ERROR_STUB_ALGORITHM_ID = u"error-stub"
     UNDEFINED_CLASS_ALGORITHM_ID = u"undefined_class"
     UNDEFINED_MODULE_ALGORITHM_ID = u"undefined_module"
+    UNPICKLABLE_ERROR_ALGORITHM_ID = u"unpicklable-error"
     AI_ALGORITHMS = {
         ALGORITHM_ID: '{module}.StubAIAlgorithm'.format(module=__name__),
         ERROR_STUB_ALGORITHM_ID: '{module}.ErrorStubAIAlgorithm'.format(module=__name__),
         UNDEFINED_CLASS_ALGORITHM_ID: '{module}.NotDefinedAIAlgorithm'.format(module=__name__),
-        UNDEFINED_MODULE_ALGORITHM_ID: 'openassessment.not.valid.NotDefinedAIAlgorithm'
+        UNDEFINED_MODULE_ALGORITHM_ID: 'openassessment.not.valid.NotDefinedAIAlgorithm',
+        UNPICKLABLE_ERROR_ALGORITHM_ID: '{module}.UnpicklableErrorAIAlgorithm'.format(module=__name__),
     }
 
 
@@ -202,6 +228,55 @@ class AITrainingTaskTest(CeleryTaskTest):
         with self.assert_retry(train_classifiers, TrainingError):
             train_classifiers(self.workflow_uuid)
 
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_TRAINING_WORKERS=2)
+    def test_train_in_worker_processes(self):
+        train_classifiers(self.workflow_uuid)
+
+        # Every criterion should have a trained classifier
+        workflow = AITrainingWorkflow.objects.get(uuid=self.workflow_uuid)
+        self.assertTrue(workflow.is_complete)
+        self.assertItemsEqual(
+            workflow.classifier_set.classifier_data_by_criterion.keys(),
+            [criterion['name'] for criterion in RUBRIC['criteria']]
+        )
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_TRAINING_WORKERS=2)
+    def test_training_algorithm_error_in_worker_processes(self):
+        self._set_algorithm_id(ERROR_STUB_ALGORITHM_ID)
+        with self.assert_retry(train_classifiers, TrainingError):
+            train_classifiers(self.workflow_uuid)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_TRAINING_WORKERS=2)
+    @mock.patch('openassessment.assessment.worker.training.TRAINING_POOL_TIMEOUT', 30)
+    def test_unpicklable_error_in_worker_processes(self):
+        # The error can't be sent back from the worker processes,
+        # but we should still fail right away instead of waiting for the pool to time out.
+        self._set_algorithm_id(self.UNPICKLABLE_ERROR_ALGORITHM_ID)
+        start = time.time()
+        with self.assert_retry(train_classifiers, TrainingError):
+            train_classifiers(self.workflow_uuid)
+        self.assertLess(time.time() - start, 10)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_TRAINING_WORKERS=2)
+    @mock.patch('openassessment.assessment.worker.training.multiprocessing.Pool')
+    def test_worker_processes_error(self, mock_pool):
+        # Errors other than algorithm errors (for example, a lost worker process)
+        # should be reported as training errors.
+        mock_pool.return_value.imap_unordered.return_value.next.side_effect = IOError("Test error!")
+        with self.assert_retry(train_classifiers, TrainingError):
+            train_classifiers(self.workflow_uuid)
+        self.assertTrue(mock_pool.return_value.terminate.called)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    @mock.patch('openassessment.assessment.worker.training.dog_stats_api.histogram')
+    def test_training_time_per_criterion(self, mock_histogram):
+        train_classifiers(self.workflow_uuid)
+        training_times = [
+            call for call in mock_histogram.call_args_list
+            if call[0][0] == 'openassessment.assessment.ai.train_classifier.time'
+        ]
+        self.assertEqual(len(training_times), len(RUBRIC['criteria']))
+
     @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
     @mock.patch('openassessment.assessment.worker.training.ai_worker_api.create_classifiers')
     def test_create_classifiers_api_error(self, mock_call):
@@ -303,16 +378,52 @@ class AIGradingTaskTest(CeleryTaskTest):
             grade_essay(self.workflow_uuid)
             self.assertFalse(mock_call.called)
 
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_ESSAY_SCORE_CACHE_MAX_LENGTH=0)
+    def test_reuse_loaded_classifiers(self):
+        # Grade the essay twice
+        # (with the essay score cache disabled, so we need the classifiers both times)
+        patched = '{module}.StubAIAlgorithm.load_classifier'.format(module=__name__)
+        with mock.patch(patched) as mock_load:
+            mock_load.return_value = {}
+            grade_essay(self.workflow_uuid)
+            self._reset_workflow()
+            grade_essay(self.workflow_uuid)
+
+        # The classifiers should be loaded only the first time
+        self.assertEqual(mock_load.call_count, len(self.CLASSIFIERS))
+        self.assertEqual(LOADED_CLASSIFIERS.stats()['hits'], len(self.CLASSIFIERS))
+
     @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
     def test_check_complete_error(self):
         with self.assert_retry(grade_essay, AIGradingRequestError):
             grade_essay("no such workflow uuid")
 
-    @mock.patch('openassessment.assessment.api.ai_worker.create_assessment')
     @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_duplicate_essay_uses_cached_scores(self):
+        grade_essay(self.workflow_uuid)
+        first_assessment = AIGradingWorkflow.objects.get(uuid=self.workflow_uuid).assessment
+
+        # Grade an identical essay (except for whitespace) using the same classifiers
+        submission = sub_api.create_submission(STUDENT_ITEM, u"  {}\n".format(ANSWER))
+        workflow = AIGradingWorkflow.start_workflow(submission['uuid'], RUBRIC, ALGORITHM_ID)
+        workflow.classifier_set = AIGradingWorkflow.objects.get(uuid=self.workflow_uuid).classifier_set
+        workflow.save()
+
+        # We should re-use the scores without running the algorithm
+        patched = '{module}.StubAIAlgorithm.score'.format(module=__name__)
+        with mock.patch(patched) as mock_score:
+            grade_essay(workflow.uuid)
+            self.assertFalse(mock_score.called)
+
+        second_assessment = AIGradingWorkflow.objects.get(uuid=workflow.uuid).assessment
+        self.assertEqual(second_assessment.points_earned, first_assessment.points_earned)
+
+    @mock.patch('openassessment.assessment.api.ai_worker.create_assessment')
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS, ORA2_AI_ESSAY_SCORE_CACHE_MAX_LENGTH=0)
     def test_algorithm_gives_invalid_score(self, mock_create_assessment):
         # If an algorithm provides a score that isn't in the rubric,
         # we should choose the closest valid score.
+        # The stub algorithm's scores change each time, so we disable the essay score cache.
         self._set_algorithm_id(INVALID_SCORE_ALGORITHM_ID)
 
         # The first score given by the algorithm should be below the minimum valid score
@@ -392,6 +503,106 @@ class AIGradingTaskTest(CeleryTaskTest):
         with self.assert_retry(grade_essay, AIGradingInternalError):
             grade_essay(self.workflow_uuid)
 
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_grade_essays_batch(self):
+        # Create a second workflow that shares the classifier set
+        second_uuid = self._create_workflow_with_same_classifiers()
+
+        grade_essays_batch([self.workflow_uuid, second_uuid])
+
+        # Both workflows should be complete, with an assessment for each submission
+        for workflow_uuid in [self.workflow_uuid, second_uuid]:
+            workflow = AIGradingWorkflow.objects.get(uuid=workflow_uuid)
+            self.assertTrue(workflow.is_complete)
+            self.assertEqual(workflow.assessment.submission_uuid, workflow.submission_uuid)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_grade_essays_batch_scores_each_criterion_once(self):
+        second_uuid = self._create_workflow_with_same_classifiers()
+
+        # The algorithm should score the whole batch once per criterion
+        patched = '{module}.StubAIAlgorithm.score_batch'.format(module=__name__)
+        with mock.patch(patched) as mock_score_batch:
+            mock_score_batch.return_value = [0, 0]
+            grade_essays_batch([self.workflow_uuid, second_uuid])
+            self.assertEqual(mock_score_batch.call_count, len(self.CLASSIFIERS))
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_grade_essays_batch_uses_cached_scores(self):
+        # Grade the first essay, which caches its scores
+        grade_essay(self.workflow_uuid)
+
+        # The second essay is identical, so the batch doesn't need the algorithm
+        second_uuid = self._create_workflow_with_same_classifiers()
+        patched = '{module}.StubAIAlgorithm.score_batch'.format(module=__name__)
+        with mock.patch(patched) as mock_score_batch:
+            grade_essays_batch([second_uuid])
+            self.assertFalse(mock_score_batch.called)
+        self.assertTrue(AIGradingWorkflow.objects.get(uuid=second_uuid).is_complete)
+
+    @mock.patch('openassessment.assessment.worker.grading.ai_worker_api.create_assessments_batch')
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_grade_essays_batch_skips_completed_workflow(self, mock_create):
+        second_uuid = self._create_workflow_with_same_classifiers()
+        workflow = AIGradingWorkflow.objects.get(uuid=self.workflow_uuid)
+        workflow.mark_complete_and_save()
+
+        grade_essays_batch([self.workflow_uuid, second_uuid])
+        mock_create.assert_called_once_with({
+            second_uuid: {
+                u"vøȼȺƀᵾłȺɍɏ": 0,
+                u"ﻭɼค๓๓คɼ": 0
+            }
+        })
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_grade_essays_batch_different_classifier_sets(self):
+        # Create a second workflow with its own classifier set
+        submission = sub_api.create_submission(STUDENT_ITEM, ANSWER)
+        workflow = AIGradingWorkflow.start_workflow(submission['uuid'], RUBRIC, ALGORITHM_ID)
+        workflow.classifier_set = AIClassifierSet.create_classifier_set(
+            self.CLASSIFIERS, rubric_from_dict(RUBRIC), ALGORITHM_ID,
+            STUDENT_ITEM.get('course_id'), STUDENT_ITEM.get('item_id')
+        )
+        workflow.save()
+
+        with self.assert_retry(grade_essays_batch, AIGradingRequestError):
+            grade_essays_batch([self.workflow_uuid, workflow.uuid])
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_grade_essays_batch_score_error(self):
+        self._set_algorithm_id(ERROR_STUB_ALGORITHM_ID)
+        with self.assert_retry(grade_essays_batch, ScoreError):
+            grade_essays_batch([self.workflow_uuid])
+
+    @mock.patch('openassessment.assessment.models.ai.AIGradingWorkflow._complete')
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_grade_essays_batch_rolls_back(self, mock_complete):
+        # If any assessment in the batch fails, none of the workflows are completed
+        second_uuid = self._create_workflow_with_same_classifiers()
+        mock_complete.side_effect = [None, DatabaseError("Test error")]
+
+        with self.assert_retry(grade_essays_batch, AIGradingInternalError):
+            grade_essays_batch([self.workflow_uuid, second_uuid])
+
+        for workflow_uuid in [self.workflow_uuid, second_uuid]:
+            self.assertFalse(AIGradingWorkflow.objects.get(uuid=workflow_uuid).is_complete)
+
+    def _create_workflow_with_same_classifiers(self):
+        """
+        Create another grading workflow that uses the same classifier set
+        as the workflow created in `setUp()`.
+
+        Returns:
+            unicode: The UUID of the new workflow.
+
+        """
+        submission = sub_api.create_submission(STUDENT_ITEM, ANSWER)
+        workflow = AIGradingWorkflow.start_workflow(submission['uuid'], RUBRIC, ALGORITHM_ID)
+        workflow.classifier_set = AIGradingWorkflow.objects.get(uuid=self.workflow_uuid).classifier_set
+        workflow.save()
+        return workflow.uuid
+
     def _set_algorithm_id(self, algorithm_id):
         """
         Override the default algorithm ID for the grading workflow.
@@ -415,3 +626,135 @@ class AIGradingTaskTest(CeleryTaskTest):
         workflow.completed_at = None
         workflow.assessment = None
         workflow.save()
+
+
+class AIRescheduleGradingTaskTest(CeleryTaskTest):
+    """
+    Tests for the task that reschedules incomplete grading workflows.
+    """
+
+    COURSE_ID = STUDENT_ITEM.get('course_id')
+    ITEM_ID = STUDENT_ITEM.get('item_id')
+
+    def setUp(self):
+        """
+        Create grading workflows, with no classifiers available yet,
+        then train a classifier set.
+        """
+        self.workflow_uuids = []
+        for _ in range(3):
+            submission = sub_api.create_submission(STUDENT_ITEM, ANSWER)
+            workflow = AIGradingWorkflow.start_workflow(submission['uuid'], RUBRIC, ALGORITHM_ID)
+            self.workflow_uuids.append(workflow.uuid)
+
+        self.classifier_set = AIClassifierSet.create_classifier_set(
+            AIGradingTaskTest.CLASSIFIERS, rubric_from_dict(RUBRIC), ALGORITHM_ID, self.COURSE_ID, self.ITEM_ID
+        )
+
+    @mock.patch('openassessment.assessment.worker.grading.grade_essays_batch.apply_async')
+    def test_reschedule_in_batches(self, mock_grade):
+        reschedule_grading_tasks(self.COURSE_ID, self.ITEM_ID)
+
+        # Every workflow should be assigned the classifier set
+        for workflow in AIGradingWorkflow.objects.filter(uuid__in=self.workflow_uuids):
+            self.assertEqual(workflow.classifier_set, self.classifier_set)
+
+        # The workflows share a classifier set, so they are graded in one batch
+        mock_grade.assert_called_once_with(args=[self.workflow_uuids])
+
+    @mock.patch('openassessment.assessment.worker.grading.RESCHEDULE_CHUNK_SIZE', 1)
+    @mock.patch('openassessment.assessment.worker.grading.grade_essays_batch.apply_async')
+    def test_reschedule_looks_up_classifier_set_once(self, mock_grade):
+        patched = 'openassessment.assessment.worker.grading.AIClassifierSet.most_recent_classifier_set'
+        with mock.patch(patched) as mock_most_recent:
+            mock_most_recent.return_value = self.classifier_set
+            reschedule_grading_tasks(self.COURSE_ID, self.ITEM_ID)
+            self.assertEqual(mock_most_recent.call_count, 1)
+
+        # Each chunk is scheduled separately
+        self.assertEqual(mock_grade.call_count, len(self.workflow_uuids))
+
+    @mock.patch('openassessment.assessment.worker.grading.grade_essays_batch.apply_async')
+    def test_reschedule_from_checkpoint(self, mock_grade):
+        checkpoint = AIGradingWorkflow.objects.get(uuid=self.workflow_uuids[0]).id
+        reschedule_grading_tasks(self.COURSE_ID, self.ITEM_ID, checkpoint=checkpoint)
+        mock_grade.assert_called_once_with(args=[self.workflow_uuids[1:]])
+
+    @mock.patch('openassessment.assessment.worker.grading.RESCHEDULE_CHUNK_SIZE', 1)
+    @mock.patch('openassessment.assessment.worker.grading.grade_essays_batch.apply_async')
+    def test_retry_failed_workflows(self, mock_grade):
+        # Scheduling the second workflow fails
+        mock_grade.side_effect = [None, NotConfigured("Test error!"), None]
+        retry_kwargs = self._reschedule_with_retry()
+
+        # We should continue with the later chunks,
+        # then retry only the workflow that failed.
+        self.assertEqual(retry_kwargs, {'retry_ids': [self._workflow_ids()[1]]})
+        self.assertEqual(mock_grade.call_count, 3)
+
+    @mock.patch('openassessment.assessment.worker.grading.RESCHEDULE_CHUNK_SIZE', 1)
+    @mock.patch('openassessment.assessment.worker.grading.grade_essays_batch.apply_async')
+    def test_reschedule_skips_workflows_without_classifiers(self, mock_grade):
+        # The workflow in the first chunk uses an algorithm without classifiers
+        AIGradingWorkflow.objects.filter(uuid=self.workflow_uuids[0]).update(algorithm_id=u"no-classifiers")
+
+        with mock.patch.object(reschedule_grading_tasks, 'retry') as mock_retry:
+            reschedule_grading_tasks(self.COURSE_ID, self.ITEM_ID)
+
+        # That workflow isn't a failure, and the later chunks are still scheduled
+        self.assertFalse(mock_retry.called)
+        scheduled = [call[1]['args'][0] for call in mock_grade.call_args_list]
+        self.assertEqual(scheduled, [[self.workflow_uuids[1]], [self.workflow_uuids[2]]])
+
+    @mock.patch('openassessment.assessment.worker.grading.RESCHEDULE_CHUNK_SIZE', 1)
+    @mock.patch('openassessment.assessment.worker.grading.grade_essays_batch.apply_async')
+    def test_retry_schedules_each_workflow_once(self, mock_grade):
+        # Scheduling the middle chunk fails the first time
+        mock_grade.side_effect = [None, NotConfigured("Test error!"), None, None]
+        retry_kwargs = self._reschedule_with_retry()
+        reschedule_grading_tasks(self.COURSE_ID, self.ITEM_ID, **retry_kwargs)
+
+        # Across both attempts, each workflow should be scheduled exactly once
+        scheduled = [call[1]['args'][0] for call in mock_grade.call_args_list]
+        self.assertEqual(scheduled, [
+            [self.workflow_uuids[0]], [self.workflow_uuids[1]],
+            [self.workflow_uuids[2]], [self.workflow_uuids[1]],
+        ])
+        self.assertEqual(mock_grade.call_count, 4)
+
+    @mock.patch('openassessment.assessment.worker.grading.GRADING_BATCH_SIZE', 1)
+    @mock.patch('openassessment.assessment.worker.grading.grade_essays_batch.apply_async')
+    def test_retry_within_chunk_schedules_each_workflow_once(self, mock_grade):
+        # All the workflows are in one chunk, and the middle batch fails the first time
+        mock_grade.side_effect = [None, NotConfigured("Test error!"), None, None]
+        retry_kwargs = self._reschedule_with_retry()
+        reschedule_grading_tasks(self.COURSE_ID, self.ITEM_ID, **retry_kwargs)
+
+        # The retry should schedule only the workflow that failed
+        scheduled = [call[1]['args'][0][0] for call in mock_grade.call_args_list]
+        self.assertEqual(sorted(scheduled), sorted(self.workflow_uuids + [self.workflow_uuids[1]]))
+        self.assertEqual(scheduled[-1], self.workflow_uuids[1])
+
+    def _reschedule_with_retry(self):
+        """
+        Reschedule the grading tasks, expecting the task to be retried.
+
+        Returns:
+            dict: The keyword arguments for the retry.
+
+        """
+        with mock.patch.object(reschedule_grading_tasks, 'retry') as mock_retry:
+            mock_retry.return_value = AIGradingInternalError("Retried")
+            with self.assertRaises(AIGradingInternalError):
+                reschedule_grading_tasks(self.COURSE_ID, self.ITEM_ID)
+        self.assertEqual(mock_retry.call_count, 1)
+        return mock_retry.call_args[1]['kwargs']
+
+    def _workflow_ids(self):
+        """
+        Return the primary keys of the grading workflows, in the order created.
+        """
+        return [
+            AIGradingWorkflow.objects.get(uuid=workflow_uuid).id
+            for workflow_uuid in self.workflow_uuids
+        ]
@@ -11,9 +11,16 @@ from collections import namedtuple
 import importlib
 import traceback
 import base64
+import hashlib
 from django.conf import settings
 
 
+# Pickle protocol used to serialize classifiers.
+# Pickles using this protocol start with a prefix that can't occur
+# in base64-encoded data, which we used before storing classifiers in a binary format.
+PICKLE_PROTOCOL = 2
+PICKLE_PROTOCOL_PREFIX = "\x80\x02"
+
 DEFAULT_AI_ALGORITHMS = {
     'fake': 'openassessment.assessment.worker.algorithm.FakeAIAlgorithm',
     'ease': 'openassessment.assessment.worker.algorithm.EaseAIAlgorithm'
@@ -91,7 +98,8 @@ class AIAlgorithm(object):
             examples (list of AIAlgorithm.ExampleEssay): Example essays and scores.
 
         Returns:
-            JSON-serializable: The trained classifier.  This MUST be JSON-serializable.
+            JSON-serializable: The trained classifier.  This MUST be JSON-serializable,
+                except that byte strings (`str`) may contain binary data.
 
         Raises:
             TrainingError: The classifier could not be trained successfully.
@@ -118,6 +126,59 @@ class AIAlgorithm(object):
         """
         pass
 
+    def load_classifier(self, classifier):
+        """
+        Prepare a classifier for scoring.
+
+        The grading tasks keep loaded classifiers in memory and pass them
+        to `score()` in place of the serialized classifier, so algorithms
+        should do any expensive deserialization here.
+        By default, the serialized classifier is used as-is.
+
+        Args:
+            classifier (JSON-serializable): A classifier, using the same format
+                as `train_classifier()`.
+
+        Returns:
+            A classifier that `score()` accepts.
+
+        Raises:
+            InvalidClassifier: The provided classifier cannot be used by this algorithm.
+
+        """
+        return classifier
+
+    def score_batch(self, texts, classifier, cache):
+        """
+        Score many essays using a classifier.
+
+        By default, this scores each essay separately.  Algorithms can
+        override this to share work (such as loading the classifier)
+        across the essays.
+
+        Args:
+            texts (list of unicode): The texts to classify.
+            classifier (JSON-serializable): A classifier, using the same format
+                as `train_classifier()`.
+            cache (dict): An in-memory cache that persists until all criteria
+                in the rubric have been scored for every essay in the batch.
+
+        Returns:
+            list of scores, in the same order as `texts`.
+
+        Raises:
+            InvalidClassifier: The provided classifier cannot be used by this algorithm.
+            ScoreError: An error occurred while scoring.
+
+        """
+        # Give each essay its own cache, so algorithms can re-use
+        # results for an essay across rubric criteria.
+        essay_caches = cache.setdefault('essay_caches', [dict() for _ in texts])
+        return [
+            self.score(text, classifier, essay_cache)
+            for text, essay_cache in zip(texts, essay_caches)
+        ]
+
     @classmethod
     def algorithm_for_id(cls, algorithm_id):
         """
@@ -183,12 +244,23 @@ class EaseAIAlgorithm(AIAlgorithm):
     algorithm implementation instead.
     """
 
+    # Classifiers deserialized by `load_classifier()`.
+    # Criteria whose feature extractors have the same fingerprint
+    # share the features generated for an essay.
+    LoadedClassifiers = namedtuple(
+        'LoadedClassifiers', ['feature_extractor', 'score_classifier', 'fingerprint']
+    )
+
     def train_classifier(self, examples):
         """
         Train a text classifier using the EASE library.
         The classifier is serialized as a dictionary with keys:
             * 'feature_extractor': The pickled feature extractor (transforms text into a numeric feature vector).
             * 'score_classifier': The pickled classifier (uses the feature vector to assign scores to essays).
+            * 'feature_extractor_fingerprint': A hash of the pickled feature extractor.
+
+        The pickled values are binary strings.  Classifiers trained before we stored
+        classifiers in a binary format base64-encoded these values; we can still read those.
 
         Because we are using `pickle`, the serialized classifiers are unfortunately
         tied to the particular version of ease/scikit-learn/numpy/scipy/nltk that we
@@ -207,13 +279,29 @@ class EaseAIAlgorithm(AIAlgorithm):
         feature_ext, classifier = self._train_classifiers(examples)
         return self._serialize_classifiers(feature_ext, classifier)
 
+    def load_classifier(self, classifier):
+        """
+        Unpickle the feature extractor and score classifier.
+
+        Args:
+            classifier (dict): The serialized classifiers created during training.
+
+        Returns:
+            EaseAIAlgorithm.LoadedClassifiers
+
+        Raises:
+            InvalidClassifier
+
+        """
+        return self._deserialize_classifiers(classifier)
+
     def score(self, text, classifier, cache):
         """
         Score essays using EASE.
 
         Args:
             text (unicode): The essay text to score.
-            classifier (dict): The serialized classifiers created during training.
+            classifier (dict or EaseAIAlgorithm.LoadedClassifiers): The classifiers created during training.
             cache (dict): An in-memory cache that persists until all criteria
                 in the rubric have been scored.
 
@@ -231,7 +319,7 @@ class EaseAIAlgorithm(AIAlgorithm):
             msg = u"Could not import EASE to grade essays."
             raise ScoreError(msg)
 
-        feature_extractor, score_classifier = self._deserialize_classifiers(classifier)
+        classifiers = self._deserialize_classifiers(classifier)
 
         # The following is a modified version of `ease.grade.grade()`,
         # skipping things we don't use (cross-validation, feedback)
@@ -252,10 +340,10 @@ class EaseAIAlgorithm(AIAlgorithm):
                 cache['grading_essay_set'] = essay_set
 
             # Extract features from the text
-            features = feature_extractor.gen_feats(essay_set)
+            features = self._generate_features(classifiers, essay_set, cache)
 
             # Predict a score
-            return int(score_classifier.predict(features)[0])
+            return int(classifiers.score_classifier.predict(features)[0])
         except:
             msg = (
                 u"An unexpected error occurred while using "
@@ -263,6 +351,76 @@ class EaseAIAlgorithm(AIAlgorithm):
             ).format(traceback=traceback.format_exc())
             raise ScoreError(msg)
 
+    def score_batch(self, texts, classifier, cache):
+        """
+        Score many essays using EASE.
+
+        The classifier is deserialized once for the batch, and features
+        are extracted and scores predicted for all the essays at once.
+
+        Args:
+            texts (list of unicode): The essay texts to score.
+            classifier (dict or EaseAIAlgorithm.LoadedClassifiers): The classifiers created during training.
+            cache (dict): An in-memory cache that persists until all criteria
+                in the rubric have been scored for every essay in the batch.
+
+        Returns:
+            list of int
+
+        Raises:
+            InvalidClassifier
+            ScoreError
+
+        """
+        try:
+            from ease.essay_set import EssaySet    # pylint:disable=F0401
+        except ImportError:
+            msg = u"Could not import EASE to grade essays."
+            raise ScoreError(msg)
+
+        classifiers = self._deserialize_classifiers(classifier)
+
+        try:
+            # As in `score()`, every essay has a dummy score of "0",
+            # so we can re-use the essay set for each criterion in the rubric.
+            essay_set = cache.get('grading_essay_set')
+            if essay_set is None:
+                essay_set = EssaySet(essaytype="test")
+                for text in texts:
+                    essay_set.add_essay(text.encode('ascii', 'ignore'), 0)
+                cache['grading_essay_set'] = essay_set
+
+            # Extract features and predict scores for every essay at once
+            features = self._generate_features(classifiers, essay_set, cache)
+            return [int(score) for score in classifiers.score_classifier.predict(features)]
+        except:
+            msg = (
+                u"An unexpected error occurred while using "
+                u"EASE to score a batch of essays: {traceback}"
+            ).format(traceback=traceback.format_exc())
+            raise ScoreError(msg)
+
+    def _generate_features(self, classifiers, essay_set, cache):
+        """
+        Generate the features for an essay set, re-using the features
+        generated for another criterion if its feature extractor is identical.
+
+        Args:
+            classifiers (EaseAIAlgorithm.LoadedClassifiers): The classifiers for the criterion.
+            essay_set (ease.essay_set.EssaySet): The essays to score.
+            cache (dict): The in-memory cache for the essays.
+
+        Returns:
+            The feature matrix.
+
+        """
+        features_by_fingerprint = cache.setdefault('grading_features', dict())
+        features = features_by_fingerprint.get(classifiers.fingerprint)
+        if features is None:
+            features = classifiers.feature_extractor.gen_feats(essay_set)
+            features_by_fingerprint[classifiers.fingerprint] = features
+        return features
+
     def _train_classifiers(self, examples):
         """
         Use EASE to train classifiers.
@@ -325,9 +483,11 @@ class EaseAIAlgorithm(AIAlgorithm):
 
         """
         try:
+            pickled_feature_ext = pickle.dumps(feature_ext, PICKLE_PROTOCOL)
             return {
-                'feature_extractor': base64.b64encode(pickle.dumps(feature_ext)),
-                'score_classifier': base64.b64encode(pickle.dumps(classifier)),
+                'feature_extractor': pickled_feature_ext,
+                'score_classifier': pickle.dumps(classifier, PICKLE_PROTOCOL),
+                'feature_extractor_fingerprint': hashlib.sha1(pickled_feature_ext).hexdigest(),
             }
         except Exception as ex:
             msg = (
@@ -341,21 +501,25 @@ class EaseAIAlgorithm(AIAlgorithm):
         Deserialize the classifier objects.
 
         Args:
-            classifier_data (dict): The serialized classifiers.
+            classifier_data (dict or EaseAIAlgorithm.LoadedClassifiers): The serialized classifiers,
+                or classifiers already loaded by `load_classifier()`.
 
         Returns:
-            tuple of `(feature_extractor, score_classifier)`
+            EaseAIAlgorithm.LoadedClassifiers
 
         Raises:
             InvalidClassifier
 
         """
+        if isinstance(classifier_data, self.LoadedClassifiers):
+            return classifier_data
+
         if not isinstance(classifier_data, dict):
             raise InvalidClassifier("Classifier must be a dictionary.")
 
         try:
-            classifier_str = classifier_data.get('feature_extractor').encode('utf-8')
-            feature_extractor = pickle.loads(base64.b64decode(classifier_str))
+            pickled_feature_extractor = self._pickled_bytes(classifier_data.get('feature_extractor'))
+            feature_extractor = pickle.loads(pickled_feature_extractor)
         except Exception as ex:
             msg = (
                 u"An error occurred while deserializing the "
@@ -364,8 +528,7 @@ class EaseAIAlgorithm(AIAlgorithm):
             raise InvalidClassifier(msg)
 
         try:
-            score_classifier_str = classifier_data.get('score_classifier').encode('utf-8')
-            score_classifier = pickle.loads(base64.b64decode(score_classifier_str))
+            score_classifier = pickle.loads(self._pickled_bytes(classifier_data.get('score_classifier')))
         except Exception as ex:
             msg = (
                 u"An error occurred while deserializing the "
@@ -373,4 +536,52 @@ class EaseAIAlgorithm(AIAlgorithm):
             ).format(ex=ex)
             raise InvalidClassifier(msg)
 
-        return feature_extractor, score_classifier
+        # Classifiers trained before we stored the fingerprint
+        # get one calculated from the pickled feature extractor.
+        fingerprint = classifier_data.get('feature_extractor_fingerprint')
+        if fingerprint is None:
+            fingerprint = hashlib.sha1(pickled_feature_extractor).hexdigest()
+
+        return self.LoadedClassifiers(feature_extractor, score_classifier, fingerprint)
+
+    @classmethod
+    def binary_classifier_data(cls, classifier_data):
+        """
+        Convert serialized classifiers trained before we stored classifiers
+        in a binary format, replacing the base64-encoded pickles with the pickled bytes.
+
+        Args:
+            classifier_data (dict): The serialized classifiers.
+
+        Returns:
+            dict: A copy of the serialized classifiers.  Data that is not a dictionary
+                of EASE classifiers is returned unchanged.
+
+        """
+        if not isinstance(classifier_data, dict):
+            return classifier_data
+
+        converted = dict(classifier_data)
+        for key in ['feature_extractor', 'score_classifier']:
+            if isinstance(converted.get(key), basestring):
+                converted[key] = cls._pickled_bytes(converted[key])
+        return converted
+
+    @staticmethod
+    def _pickled_bytes(pickled):
+        """
+        Return the bytes of a pickled classifier object.
+
+        Args:
+            pickled (str or unicode): The pickled object, which is base64-encoded
+                if the classifier was trained before we stored classifiers in a binary format.
+
+        Returns:
+            str
+
+        """
+        if isinstance(pickled, unicode):
+            pickled = pickled.encode('utf-8')
+        if not pickled.startswith(PICKLE_PROTOCOL_PREFIX):
+            pickled = base64.b64decode(pickled)
+        return pickled
@@ -0,0 +1,160 @@
+"""
+In-memory cache of classifiers that are ready to use for grading.
+
+Deserializing a classifier (for EASE, unpickling the feature extractor
+and score classifier) is the most expensive part of a grading task,
+so each worker process keeps the most recently used classifiers in memory.
+Since classifier sets are immutable, entries never become stale;
+they are evicted only when the cache grows past its size limit.
+"""
+from collections import OrderedDict
+import threading
+from django.conf import settings
+from dogapi import dog_stats_api
+
+
+# Default limit on the (approximate) total size of the cached classifiers,
+# used if the `ORA2_AI_CLASSIFIER_CACHE_MAX_BYTES` setting is not defined.
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def serialized_size(classifier):
+    """
+    Estimate the memory used by a classifier from its serialized form.
+
+    We can't measure the size of arbitrary deserialized objects cheaply,
+    so we use the total length of the strings in the serialized classifier.
+
+    Args:
+        classifier (JSON-serializable): The serialized classifier.
+
+    Returns:
+        int
+
+    """
+    if isinstance(classifier, basestring):
+        return len(classifier)
+    elif isinstance(classifier, dict):
+        return sum(serialized_size(value) for value in classifier.itervalues())
+    elif isinstance(classifier, (list, tuple)):
+        return sum(serialized_size(value) for value in classifier)
+    else:
+        return 0
+
+
+class ClassifierLRUCache(object):
+    """
+    Size-bounded, least-recently-used cache of deserialized classifiers.
+    """
+
+    def __init__(self, max_bytes=None):
+        """
+        Create an empty cache.
+
+        Kwargs:
+            max_bytes (int): The maximum total size of the cached classifiers.
+                If not provided, this is read from the Django settings.
+
+        """
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        """
+        The maximum total size of the cached classifiers.
+
+        Returns:
+            int
+
+        """
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'ORA2_AI_CLASSIFIER_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+    def get_or_load(self, key, load_func, size):
+        """
+        Retrieve a classifier from the cache, loading it on a miss.
+
+        Args:
+            key (hashable): Identifies the classifier, for example
+                `(classifier_set_pk, criterion_name)`.
+            load_func (callable): Called with no arguments to load the classifier.
+            size (int): The approximate size of the classifier in bytes.
+
+        Returns:
+            The loaded classifier.
+
+        Raises:
+            Any errors raised by `load_func`.
+
+        """
+        with self._lock:
+            if key in self._entries:
+                # Move the entry to the end of the list, so it's evicted last.
+                classifier, entry_size = self._entries.pop(key)
+                self._entries[key] = (classifier, entry_size)
+                self.hits += 1
+                dog_stats_api.increment('openassessment.assessment.ai.classifier_cache.hit')
+                return classifier
+
+        self.misses += 1
+        dog_stats_api.increment('openassessment.assessment.ai.classifier_cache.miss')
+        classifier = load_func()
+
+        # Don't cache classifiers that would evict everything else
+        max_bytes = self.max_bytes
+        if size > max_bytes:
+            return classifier
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (classifier, size)
+                self._total_bytes += size
+            while self._total_bytes > max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                self.evictions += 1
+                dog_stats_api.increment('openassessment.assessment.ai.classifier_cache.evict')
+        return classifier
+
+    def stats(self):
+        """
+        Report how well the cache is working.
+
+        Returns:
+            dict with keys `hits`, `misses`, `evictions`, `entries`, and `bytes`.
+
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+            }
+
+    def clear(self):
+        """
+        Remove every classifier from the cache and reset the statistics.
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+# Classifiers loaded by the grading tasks in this process
+LOADED_CLASSIFIERS = ClassifierLRUCache()
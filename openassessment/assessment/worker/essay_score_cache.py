@@ -0,0 +1,150 @@
+"""
+Shared cache of the scores assigned to essays, keyed by essay text.
+
+Many AI-graded problems receive duplicate submissions (copy-pasted templates,
+or nearly-empty answers).  Since a classifier set always assigns the same scores
+to the same essay, we can skip scoring an essay if we have already scored an
+identical essay (ignoring differences in whitespace) with the same classifier set.
+
+The cache is stored in the Django cache named by the `ORA2_AI_ESSAY_SCORE_CACHE`
+setting (by default, the default cache), so that every worker can use the scores
+assigned by the others.
+The size of the cache is limited in two ways:
+
+* Only essays with at most `ORA2_AI_ESSAY_SCORE_CACHE_MAX_LENGTH` characters
+  (after normalization) are cached, since long essays are rarely duplicated.
+  Setting this to 0 disables the cache.
+
+* Entries expire after `ORA2_AI_ESSAY_SCORE_CACHE_TIMEOUT` seconds.
+  The cache backend may also evict entries (for example, memcached
+  evicts the least recently used entries when it is full).
+
+Cache hits and misses are reported to Datadog, so we can track the hit rate.
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import get_cache
+from dogapi import dog_stats_api
+
+
+# Defaults used if the settings are not defined
+DEFAULT_MAX_LENGTH = 2000
+DEFAULT_TIMEOUT = 24 * 60 * 60
+
+
+def normalize_essay_text(essay_text):
+    """
+    Normalize the whitespace in an essay, so that essays that differ
+    only in whitespace are treated as duplicates.
+
+    Args:
+        essay_text (unicode): The text of the essay.
+
+    Returns:
+        unicode
+
+    """
+    return u" ".join(essay_text.split())
+
+
+def get_cached_scores(essays, classifier_set_id):
+    """
+    Retrieve the cached scores for essays graded using a classifier set.
+
+    Args:
+        essays (dict): Maps workflow UUIDs to essay text.
+        classifier_set_id (int or None): Identifies the classifier set.
+            If None, nothing is retrieved from the cache.
+
+    Returns:
+        dict mapping workflow UUIDs to dictionaries of criterion scores,
+        for the essays found in the cache.
+
+    """
+    keys_by_uuid = _cache_keys(essays, classifier_set_id)
+    if not keys_by_uuid:
+        return dict()
+
+    cached = _cache().get_many(set(keys_by_uuid.values()))
+    scores_by_uuid = {
+        uuid: cached[key] for uuid, key in keys_by_uuid.iteritems()
+        if key in cached
+    }
+
+    if scores_by_uuid:
+        dog_stats_api.increment(
+            'openassessment.assessment.ai.essay_score_cache.hit', value=len(scores_by_uuid)
+        )
+    if len(scores_by_uuid) < len(keys_by_uuid):
+        dog_stats_api.increment(
+            'openassessment.assessment.ai.essay_score_cache.miss', value=len(keys_by_uuid) - len(scores_by_uuid)
+        )
+    return scores_by_uuid
+
+
+def cache_scores(essays, scores_by_uuid, classifier_set_id):
+    """
+    Cache the scores assigned to essays using a classifier set.
+
+    Args:
+        essays (dict): Maps workflow UUIDs to essay text.
+        scores_by_uuid (dict): Maps workflow UUIDs to dictionaries of criterion scores.
+        classifier_set_id (int or None): Identifies the classifier set.
+            If None, nothing is cached.
+
+    Returns:
+        None
+
+    """
+    keys_by_uuid = _cache_keys(essays, classifier_set_id)
+    entries = {
+        key: scores_by_uuid[uuid] for uuid, key in keys_by_uuid.iteritems()
+        if uuid in scores_by_uuid
+    }
+    if entries:
+        timeout = getattr(settings, 'ORA2_AI_ESSAY_SCORE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+        _cache().set_many(entries, timeout)
+
+
+def _cache():
+    """
+    Return the cache that holds the essay scores.
+
+    We use the default cache, so all workers share the scores, but allow settings
+    to choose another cache alias (a key in the `CACHES` setting).
+    The setting is read on each call rather than at import time,
+    so it can be changed after this module is loaded.
+
+    Returns:
+        Django cache backend
+
+    """
+    return get_cache(getattr(settings, 'ORA2_AI_ESSAY_SCORE_CACHE', 'default'))
+
+
+def _cache_keys(essays, classifier_set_id):
+    """
+    Construct the cache keys for the essays we can cache.
+
+    Args:
+        essays (dict): Maps workflow UUIDs to essay text.
+        classifier_set_id (int or None): Identifies the classifier set.
+
+    Returns:
+        dict mapping workflow UUIDs to cache keys
+        (excluding essays that are too long to cache).
+
+    """
+    max_length = getattr(settings, 'ORA2_AI_ESSAY_SCORE_CACHE_MAX_LENGTH', DEFAULT_MAX_LENGTH)
+    if classifier_set_id is None or max_length <= 0:
+        return dict()
+
+    keys_by_uuid = dict()
+    for uuid, essay_text in essays.iteritems():
+        normalized = normalize_essay_text(essay_text)
+        if len(normalized) <= max_length:
+            keys_by_uuid[uuid] = u"openassessment.assessment.ai.essay_scores.{set_id}.{essay_hash}".format(
+                set_id=classifier_set_id,
+                essay_hash=hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+            )
+    return keys_by_uuid
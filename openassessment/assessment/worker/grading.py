@@ -3,6 +3,8 @@ Asynchronous tasks for grading essays using text classifiers.
 """
 
 import datetime
+import itertools
+from collections import defaultdict
 from celery import task
 from django.db import DatabaseError
 from django.conf import settings
@@ -13,10 +15,21 @@ from openassessment.assessment.errors import (
     AIError, AIGradingInternalError, AIReschedulingInternalError, ANTICIPATED_CELERY_ERRORS
 )
 from .algorithm import AIAlgorithm, AIAlgorithmError
-from openassessment.assessment.models.ai import AIGradingWorkflow
+from .classifier_cache import LOADED_CLASSIFIERS, serialized_size
+from .essay_score_cache import get_cached_scores, cache_scores
+from openassessment.assessment.models.ai import AIGradingWorkflow, AIClassifierSet
+from openassessment.assessment.models.base import Rubric
 
 MAX_RETRIES = 2
 
+# Maximum number of grading workflows to grade in a single task
+# when rescheduling incomplete workflows.
+GRADING_BATCH_SIZE = 50
+
+# Number of incomplete grading workflows to load at a time
+# when rescheduling grading tasks.
+RESCHEDULE_CHUNK_SIZE = 500
+
 logger = get_task_logger(__name__)
 
 # If the Django settings define a low-priority queue, use that.
@@ -68,6 +81,7 @@ def grade_essay(workflow_uuid):
         params = ai_worker_api.get_grading_task_params(workflow_uuid)
         essay_text = params['essay_text']
         classifier_set = params['classifier_set']
+        classifier_set_id = params.get('classifier_set_id')
         algorithm_id = params['algorithm_id']
         valid_scores = params['valid_scores']
     except (AIError, KeyError):
@@ -79,76 +93,186 @@ def grade_essay(workflow_uuid):
         raise grade_essay.retry()
 
     # Validate that the we have valid scores for each criterion
-    for criterion_name in classifier_set.keys():
-        msg = None
-        if criterion_name not in valid_scores:
+    _validate_valid_scores(classifier_set, valid_scores, workflow_uuid)
+
+    # If we've already scored an identical essay using these classifiers,
+    # re-use the scores instead of running the algorithm again.
+    essays = {workflow_uuid: essay_text}
+    scores_by_criterion = get_cached_scores(essays, classifier_set_id).get(workflow_uuid)
+
+    if scores_by_criterion is None:
+        # Retrieve the AI algorithm
+        try:
+            algorithm = AIAlgorithm.algorithm_for_id(algorithm_id)
+        except AIAlgorithmError:
             msg = (
-                u"Could not find {criterion} in the list of valid scores "
-                u"for grading workflow with UUID {uuid}"
-            ).format(criterion=criterion_name, uuid=workflow_uuid)
-        elif len(valid_scores[criterion_name]) == 0:
+                u"An error occurred while retrieving "
+                u"the algorithm ID (grading workflow UUID {})"
+            ).format(workflow_uuid)
+            logger.exception(msg)
+            raise grade_essay.retry()
+
+        # Use the algorithm to evaluate the essay for each criterion
+        # Provide an in-memory cache so the algorithm can re-use
+        # results for multiple rubric criteria.
+        try:
+            cache = dict()
+            classifiers = _load_classifiers(algorithm, classifier_set, classifier_set_id)
+            scores_by_criterion = {
+                criterion_name: _closest_valid_score(
+                    algorithm.score(essay_text, classifier, cache),
+                    valid_scores[criterion_name]
+                )
+                for criterion_name, classifier in classifiers.iteritems()
+            }
+        except AIAlgorithmError:
             msg = (
-                u"Valid scores for {criterion} is empty for "
-                u"grading workflow with UUID {uuid}"
-            ).format(criterion=criterion_name, uuid=workflow_uuid)
-        if msg:
+                u"An error occurred while scoring essays using "
+                u"an AI algorithm (worker workflow UUID {})"
+            ).format(workflow_uuid)
             logger.exception(msg)
-            raise AIGradingInternalError(msg)
+            raise grade_essay.retry()
 
-    # Retrieve the AI algorithm
+        cache_scores(essays, {workflow_uuid: scores_by_criterion}, classifier_set_id)
+
+    # Create the assessment and mark the workflow complete
     try:
-        algorithm = AIAlgorithm.algorithm_for_id(algorithm_id)
-    except AIAlgorithmError:
+        ai_worker_api.create_assessment(workflow_uuid, scores_by_criterion)
+    except AIError:
         msg = (
-            u"An error occurred while retrieving "
-            u"the algorithm ID (grading workflow UUID {})"
-        ).format(workflow_uuid)
+            u"An error occurred while creating assessments "
+            u"for the AI grading workflow with UUID {uuid}. "
+            u"The assessment scores were: {scores}"
+        ).format(uuid=workflow_uuid, scores=scores_by_criterion)
         logger.exception(msg)
         raise grade_essay.retry()
 
-    # Use the algorithm to evaluate the essay for each criterion
-    # Provide an in-memory cache so the algorithm can re-use
-    # results for multiple rubric criteria.
+
+@task(max_retries=MAX_RETRIES)  # pylint: disable=E1102
+@dog_stats_api.timed('openassessment.assessment.ai.grade_essays_batch.time')
+def grade_essays_batch(workflow_uuids):
+    """
+    Asynchronous task to grade a batch of essays that share a classifier set.
+
+    The classifiers are loaded once for the batch, and the algorithm
+    scores all the essays together for each criterion.  The assessments
+    are then created in a single transaction.
+
+    As with `grade_essay`, the task is retried a few times on failure;
+    workflows that are already complete are skipped.
+
+    Args:
+        workflow_uuids (list of str): The UUIDs of the grading workflows
+            to grade.  These must share a classifier set.
+
+    Returns:
+        None
+
+    Raises:
+        AIError: An error occurred while making an AI worker API call.
+        AIAlgorithmError: An error occurred while retrieving or using an AI algorithm.
+
+    """
+    # Retrieve the task parameters
     try:
-        cache = dict()
-        scores_by_criterion = {
-            criterion_name: _closest_valid_score(
-                algorithm.score(essay_text, classifier, cache),
-                valid_scores[criterion_name]
-            )
-            for criterion_name, classifier in classifier_set.iteritems()
-        }
-    except AIAlgorithmError:
+        params = ai_worker_api.get_grading_task_params_batch(workflow_uuids)
+        essays = params['essays']
+        classifier_set = params['classifier_set']
+        classifier_set_id = params.get('classifier_set_id')
+        algorithm_id = params['algorithm_id']
+        valid_scores = params['valid_scores']
+    except (AIError, KeyError):
         msg = (
-            u"An error occurred while scoring essays using "
-            u"an AI algorithm (worker workflow UUID {})"
-        ).format(workflow_uuid)
+            u"An error occurred while retrieving the AI grading task "
+            u"parameters for the workflows with UUIDs {}"
+        ).format(workflow_uuids)
         logger.exception(msg)
-        raise grade_essay.retry()
+        raise grade_essays_batch.retry()
 
-    # Create the assessment and mark the workflow complete
+    # Short-circuit if every workflow is already marked complete
+    if not essays:
+        return
+
+    # Validate that the we have valid scores for each criterion
+    _validate_valid_scores(classifier_set, valid_scores, workflow_uuids)
+
+    # Re-use the scores for essays identical to ones we've already scored
+    # using these classifiers; we need to run the algorithm only for the rest.
+    scores_by_workflow_uuid = get_cached_scores(essays, classifier_set_id)
+    batch_uuids = [uuid for uuid in essays if uuid not in scores_by_workflow_uuid]
+
+    if batch_uuids:
+        # Retrieve the AI algorithm
+        try:
+            algorithm = AIAlgorithm.algorithm_for_id(algorithm_id)
+        except AIAlgorithmError:
+            msg = (
+                u"An error occurred while retrieving "
+                u"the algorithm ID (grading workflow UUIDs {})"
+            ).format(workflow_uuids)
+            logger.exception(msg)
+            raise grade_essays_batch.retry()
+
+        # Use the algorithm to evaluate all the essays for each criterion
+        # Provide an in-memory cache so the algorithm can re-use
+        # results for multiple rubric criteria.
+        texts = [essays[uuid] for uuid in batch_uuids]
+        batch_scores = {uuid: dict() for uuid in batch_uuids}
+        try:
+            cache = dict()
+            classifiers = _load_classifiers(algorithm, classifier_set, classifier_set_id)
+            for criterion_name, classifier in classifiers.iteritems():
+                scores = algorithm.score_batch(texts, classifier, cache)
+                for uuid, score in zip(batch_uuids, scores):
+                    batch_scores[uuid][criterion_name] = _closest_valid_score(
+                        score, valid_scores[criterion_name]
+                    )
+        except AIAlgorithmError:
+            msg = (
+                u"An error occurred while scoring essays using "
+                u"an AI algorithm (worker workflow UUIDs {})"
+            ).format(workflow_uuids)
+            logger.exception(msg)
+            raise grade_essays_batch.retry()
+
+        cache_scores(essays, batch_scores, classifier_set_id)
+        scores_by_workflow_uuid.update(batch_scores)
+
+    # Create the assessments and mark the workflows complete
     try:
-        ai_worker_api.create_assessment(workflow_uuid, scores_by_criterion)
+        ai_worker_api.create_assessments_batch(scores_by_workflow_uuid)
     except AIError:
         msg = (
             u"An error occurred while creating assessments "
-            u"for the AI grading workflow with UUID {uuid}. "
+            u"for the AI grading workflows with UUIDs {uuids}. "
             u"The assessment scores were: {scores}"
-        ).format(uuid=workflow_uuid, scores=scores_by_criterion)
+        ).format(uuids=workflow_uuids, scores=scores_by_workflow_uuid)
         logger.exception(msg)
-        raise grade_essay.retry()
+        raise grade_essays_batch.retry()
 
 
 @task(queue=RESCHEDULE_TASK_QUEUE, max_retries=MAX_RETRIES)  # pylint: disable=E1102
 @dog_stats_api.timed('openassessment.assessment.ai.reschedule_grading_tasks.time')
-def reschedule_grading_tasks(course_id, item_id):
+def reschedule_grading_tasks(course_id, item_id, checkpoint=0, retry_ids=None):
     """
     Reschedules all incomplete grading workflows with the specified parameters.
 
+    Workflows are processed in chunks ordered by primary key.  If rescheduling
+    fails for any workflows, we continue with the remaining chunks, then retry
+    the task for only the workflows that failed, so no workflow is scheduled twice.
+
+    Workflows without classifiers for their rubric and algorithm are skipped
+    (they aren't failures); they are rescheduled once classifiers have been trained.
+
     Args:
         course_id (unicode): The course item that we will be rerunning the rescheduling on.
         item_id (unicode): The item that the rescheduling will be running on
 
+    Kwargs:
+        checkpoint (int): Only reschedule workflows with a primary key greater than this.
+        retry_ids (list of int): If provided, reschedule only the workflows with these
+            primary keys (the workflows the previous attempt failed to reschedule).
+
     Raises:
         AIReschedulingInternalError
         AIGradingInternalError
@@ -158,9 +282,39 @@ def reschedule_grading_tasks(course_id, item_id):
     _log_start_reschedule_grading(course_id=course_id, item_id=item_id)
     start_time = datetime.datetime.now()
 
-    # Finds all incomplete grading workflows
+    # The primary keys of the workflows we failed to reschedule.
+    # If there are any, the process of rescheduling will be retried for those workflows.
+    failed_ids = []
+
+    # When retrying, we can skip the workflows before the first one that failed,
+    # and stop after the last one.
+    last_retry_id = None
+    if retry_ids is not None:
+        retry_ids = set(retry_ids)
+        if retry_ids:
+            checkpoint = max(checkpoint, min(retry_ids) - 1)
+            last_retry_id = max(retry_ids)
+
+    # Maps tuples of (rubric ID, algorithm ID) to the most recent classifier set (or None if there isn't one).
+    # The course and item are the same for every workflow, so we need to look up each classifier set only once.
+    classifier_sets = {}
+
+    # Finds all incomplete grading workflows, a chunk at a time
     try:
-        grading_workflows = AIGradingWorkflow.get_incomplete_workflows(course_id, item_id)
+        workflows = AIGradingWorkflow.get_incomplete_workflows(
+            course_id, item_id, after_id=checkpoint, chunk_size=RESCHEDULE_CHUNK_SIZE
+        )
+        for chunk in _chunks(workflows, RESCHEDULE_CHUNK_SIZE):
+            chunk_through_id = chunk[-1].id
+
+            # Skip the workflows the previous attempt already rescheduled
+            if retry_ids is not None:
+                chunk = [workflow for workflow in chunk if workflow.id in retry_ids]
+
+            failed_ids.extend(_reschedule_grading_chunk(chunk, course_id, item_id, classifier_sets))
+
+            if retry_ids is not None and chunk_through_id >= last_retry_id:
+                break
     except (DatabaseError, AIGradingWorkflow.DoesNotExist) as ex:
         msg = (
             u"An unexpected error occurred while retrieving all incomplete "
@@ -169,96 +323,204 @@ def reschedule_grading_tasks(course_id, item_id):
         logger.exception(msg)
         raise AIReschedulingInternalError(msg)
 
-    # Notes whether or not one or more operations failed. If they did, the process of rescheduling will be retried.
-    failures = 0
+    # Logs the data from our rescheduling attempt
+    time_delta = datetime.datetime.now() - start_time
+    _log_complete_reschedule_grading(
+        course_id=course_id, item_id=item_id, seconds=time_delta.total_seconds(), success=(not failed_ids)
+    )
 
-    # A dictionary mapping tuples of (rubric, algorithm_id) to completed classifier sets. Used to avoid repeated
-    # queries which will return the same value. This loop implements a memoization of the the query.
-    maintained_classifiers = {}
+    # If one or more of these failed, we want to retry rescheduling those workflows.  Note that this retry is
+    # executed in such a way that if it fails, an AIGradingInternalError will be raised with the number of failures
+    # on the last attempt.
+    if failed_ids:
+        try:
+            raise AIGradingInternalError(
+                u"In an attempt to reschedule grading workflows, there were {} failures.".format(len(failed_ids))
+            )
+        except AIGradingInternalError as ex:
+            raise reschedule_grading_tasks.retry(kwargs={'retry_ids': failed_ids})
 
-    # Try to grade all incomplete grading workflows
-    for workflow in grading_workflows:
 
-        # We will always go through the process of finding the most recent set of classifiers for an
-        # incomplete grading workflow. The rationale for this is that if we are ever rescheduling
-        # grading, we likely had classifiers which were not working. This way, we always take the last
-        # completed set.
+def _reschedule_grading_chunk(workflows, course_id, item_id, classifier_sets):
+    """
+    Assign the most recent classifier sets to a chunk of incomplete grading workflows,
+    then schedule batch grading tasks for them.
 
-        # Note that this solution will lead to failure if "Train Classifiers" and "Refinish Grading Tasks"
-        # are called in rapid succession. This is part of the reason this button is in the admin view.
+    We will always go through the process of finding the most recent set of classifiers for an
+    incomplete grading workflow. The rationale for this is that if we are ever rescheduling
+    grading, we likely had classifiers which were not working. This way, we always take the last
+    completed set.
 
-        # Tries to find a set of classifiers that are already defined in our maintained_classifiers based on a
-        # description of the workflow in the form of a tuple (rubric, course_id, item_id, algorithm_id)
-        workflow_description = (workflow.rubric, course_id, item_id, workflow.algorithm_id)
-        found_classifiers = maintained_classifiers.get(workflow_description)
+    Note that this solution will lead to failure if "Train Classifiers" and "Refinish Grading Tasks"
+    are called in rapid succession. This is part of the reason this button is in the admin view.
 
-        # If no set of classifiers is found, we perform the query to try to find them. We take the most recent
-        # and add it to our dictionary of maintained classifiers for future reference.
-        if found_classifiers is None:
-            try:
-                found = workflow.assign_most_recent_classifier_set()
-                if found:
-                    found_classifiers = workflow.classifier_set
-                    maintained_classifiers[workflow_description] = found_classifiers
-                else:
-                    msg = u"No applicable classifiers yet exist for essay with uuid='{}'".format(workflow.uuid)
-                    logger.log(msg)
-            except DatabaseError as ex:
-                msg = (
-                    u"A Database error occurred while trying to assign classifiers to an essay with uuid='{id}'"
-                ).format(id=workflow.uuid)
-                logger.exception(msg)
+    Args:
+        workflows (list of IncompleteWorkflow): The workflows, as returned by
+            `AIGradingWorkflow.get_incomplete_workflows()`.
+        course_id (unicode): The course of the workflows.
+        item_id (unicode): The item of the workflows.
+        classifier_sets (dict): Maps (rubric ID, algorithm ID) tuples to the most recent
+            classifier set; updated with any classifier sets we look up.
+
+    Returns:
+        list of int: The primary keys of the workflows we could not reschedule.
 
-        # If we found classifiers in our memoized lookup dictionary, we assign them and save.
-        else:
-            workflow.classifier_set = found_classifiers
+    """
+    failed_ids = []
+
+    workflows_by_description = defaultdict(list)
+    for workflow in workflows:
+        workflows_by_description[(workflow.rubric_id, workflow.algorithm_id)].append(workflow)
+
+    for workflow_description, described_workflows in workflows_by_description.iteritems():
+        workflow_uuids = [workflow.uuid for workflow in described_workflows]
+
+        # If we haven't already, find the most recent classifier set for the rubric and algorithm.
+        if workflow_description not in classifier_sets:
+            rubric_id, algorithm_id = workflow_description
             try:
-                workflow.save()
-                logger.info(
-                    u"Classifiers were successfully assigned to grading workflow with uuid={}".format(workflow.uuid)
+                classifier_sets[workflow_description] = AIClassifierSet.most_recent_classifier_set(
+                    Rubric.objects.get(pk=rubric_id), algorithm_id, course_id, item_id
                 )
-            except DatabaseError as ex:
+            except (DatabaseError, Rubric.DoesNotExist):
                 msg = (
-                    u"A Database error occurred while trying to save classifiers to an essay with uuid='{id}'"
-                ).format(id=workflow.uuid)
+                    u"A Database error occurred while trying to find classifiers for essays with uuids={}"
+                ).format(workflow_uuids)
                 logger.exception(msg)
+                failed_ids.extend(workflow.id for workflow in described_workflows)
+                continue
+
+        # If there aren't any classifiers yet, skip the workflows.  This isn't a failure
+        # (retrying wouldn't help); they will be rescheduled when classifiers are trained.
+        classifier_set = classifier_sets[workflow_description]
+        if classifier_set is None:
+            logger.info(u"No applicable classifiers yet exist for essays with uuids={}".format(workflow_uuids))
+            continue
+
+        # Assign the classifier set to every workflow that doesn't already have it
+        workflow_ids = [
+            workflow.id for workflow in described_workflows
+            if workflow.classifier_set_id != classifier_set.pk
+        ]
+        try:
+            if workflow_ids:
+                AIGradingWorkflow.objects.filter(pk__in=workflow_ids).update(classifier_set=classifier_set)
+                logger.info(
+                    u"Classifiers were successfully assigned to {} grading workflows".format(len(workflow_ids))
+                )
+        except DatabaseError:
+            msg = (
+                u"A Database error occurred while trying to save classifiers to essays with uuids={}"
+            ).format(workflow_uuids)
+            logger.exception(msg)
+            failed_ids.extend(workflow.id for workflow in described_workflows)
+            continue
 
-        if found_classifiers is not None:
-
-            # Now we should (unless we had an exception above) have a classifier set.
-            # Try to schedule the grading
+        # Try to schedule the grading, one task for each batch of workflows
+        for index in range(0, len(described_workflows), GRADING_BATCH_SIZE):
+            batch_workflows = described_workflows[index:index + GRADING_BATCH_SIZE]
+            batch_uuids = [workflow.uuid for workflow in batch_workflows]
             try:
-                grade_essay.apply_async(args=[workflow.uuid])
+                grade_essays_batch.apply_async(args=[batch_uuids])
                 logger.info(
-                    u"Rescheduling of grading was successful for grading workflow with uuid='{}'".format(workflow.uuid)
+                    u"Rescheduling of grading was successful for grading workflows with uuids={}".format(batch_uuids)
                 )
             except ANTICIPATED_CELERY_ERRORS as ex:
                 msg = (
-                    u"An error occurred while try to grade essay with uuid='{id}': {ex}"
-                ).format(id=workflow.uuid, ex=ex)
+                    u"An error occurred while try to grade essays with uuids={ids}: {ex}"
+                ).format(ids=batch_uuids, ex=ex)
                 logger.exception(msg)
-                failures += 1
+                failed_ids.extend(workflow.id for workflow in batch_workflows)
 
-        # If we couldn't assign classifiers, we failed.
-        else:
-            failures += 1
+    return failed_ids
 
-    # Logs the data from our rescheduling attempt
-    time_delta = datetime.datetime.now() - start_time
-    _log_complete_reschedule_grading(
-        course_id=course_id, item_id=item_id, seconds=time_delta.total_seconds(), success=(failures == 0)
-    )
 
-    # If one or more of these failed, we want to retry rescheduling.  Note that this retry is executed in such a way
-    # that if it fails, an AIGradingInternalError will be raised with the number of failures on the last attempt (i.e.
-    # the total number of workflows matching these critera that still have left to be graded).
-    if failures > 0:
-        try:
-            raise AIGradingInternalError(
-                u"In an attempt to reschedule grading workflows, there were {} failures.".format(failures)
-            )
-        except AIGradingInternalError as ex:
-            raise reschedule_grading_tasks.retry()
+def _chunks(items, chunk_size):
+    """
+    Split an iterable into lists of at most `chunk_size` items,
+    without loading the whole iterable into memory.
+
+    Args:
+        items (iterable): The items to split.
+        chunk_size (int): The maximum number of items in each chunk.
+
+    Yields:
+        list
+
+    """
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def _validate_valid_scores(classifier_set, valid_scores, workflow_uuid):
+    """
+    Check that we have valid scores for each criterion in the classifier set.
+
+    Args:
+        classifier_set (dict): Maps criterion names to serialized classifiers.
+        valid_scores (dict): Maps criterion names to a list of valid scores for that criterion.
+        workflow_uuid (str or list of str): The UUID(s) of the grading workflow(s), for logging.
+
+    Returns:
+        None
+
+    Raises:
+        AIGradingInternalError
+
+    """
+    for criterion_name in classifier_set.keys():
+        msg = None
+        if criterion_name not in valid_scores:
+            msg = (
+                u"Could not find {criterion} in the list of valid scores "
+                u"for grading workflow with UUID {uuid}"
+            ).format(criterion=criterion_name, uuid=workflow_uuid)
+        elif len(valid_scores[criterion_name]) == 0:
+            msg = (
+                u"Valid scores for {criterion} is empty for "
+                u"grading workflow with UUID {uuid}"
+            ).format(criterion=criterion_name, uuid=workflow_uuid)
+        if msg:
+            logger.exception(msg)
+            raise AIGradingInternalError(msg)
+
+
+def _load_classifiers(algorithm, classifier_set, classifier_set_id):
+    """
+    Load the classifiers for each criterion, re-using classifiers
+    already loaded by this worker process.
+
+    Args:
+        algorithm (AIAlgorithm): The algorithm that will use the classifiers.
+        classifier_set (dict): Maps criterion names to serialized classifiers.
+        classifier_set_id (int or None): Identifies the classifier set.
+            If None, the classifiers are loaded without caching.
+
+    Returns:
+        dict mapping criterion names to loaded classifiers
+
+    Raises:
+        AIAlgorithmError
+
+    """
+    if classifier_set_id is None:
+        return {
+            criterion_name: algorithm.load_classifier(classifier)
+            for criterion_name, classifier in classifier_set.iteritems()
+        }
+
+    return {
+        criterion_name: LOADED_CLASSIFIERS.get_or_load(
+            (classifier_set_id, criterion_name),
+            lambda classifier=classifier: algorithm.load_classifier(classifier),
+            serialized_size(classifier)
+        )
+        for criterion_name, classifier in classifier_set.iteritems()
+    }
 
 
 def _closest_valid_score(score, valid_scores):
@@ -2,6 +2,8 @@
 Asynchronous tasks for training classifiers from examples.
 """
 import datetime
+import multiprocessing
+import time
 from collections import defaultdict
 from celery import task
 from celery.utils.log import get_task_logger
@@ -10,7 +12,7 @@ from django.conf import settings
 from django.db import DatabaseError
 from openassessment.assessment.api import ai_worker as ai_worker_api
 from openassessment.assessment.errors import AIError, ANTICIPATED_CELERY_ERRORS
-from .algorithm import AIAlgorithm, AIAlgorithmError
+from .algorithm import AIAlgorithm, AIAlgorithmError, TrainingError
 from .grading import reschedule_grading_tasks
 from openassessment.assessment.errors.ai import AIGradingInternalError
 from openassessment.assessment.models.ai import AITrainingWorkflow
@@ -24,6 +26,10 @@ logger = get_task_logger(__name__)
 TRAINING_TASK_QUEUE = getattr(settings, 'LOW_PRIORITY_QUEUE', None)
 RESCHEDULE_TASK_QUEUE = getattr(settings, 'LOW_PRIORITY_QUEUE', None)
 
+# Maximum number of seconds to wait for a process pool to train
+# the classifier for the next criterion in the rubric.
+TRAINING_POOL_TIMEOUT = 60 * 60
+
 
 class InvalidExample(Exception):
     """
@@ -118,11 +124,9 @@ def train_classifiers(workflow_uuid):
     # The AIAlgorithm subclass is responsible for ensuring that
     # the trained classifiers are JSON-serializable.
     try:
-        classifier_set = {
-            criterion_name: algorithm.train_classifier(examples_dict)
-            for criterion_name, examples_dict
-            in _examples_by_criterion(examples).iteritems()
-        }
+        classifier_set = _train_classifiers_by_criterion(
+            algorithm, algorithm_id, _examples_by_criterion(examples)
+        )
     except InvalidExample:
         msg = (
             u"Training example format was not valid "
@@ -182,9 +186,26 @@ def reschedule_training_tasks(course_id, item_id):
     _log_start_reschedule_training(course_id=course_id, item_id=item_id)
     start_time = datetime.datetime.now()
 
-    # Run a query to find the incomplete training workflows
+    # Tries to train every workflow that has not completed.
+    # The incomplete training workflows are retrieved a chunk at a time as we go.
     try:
-        training_workflows = AITrainingWorkflow.get_incomplete_workflows(course_id, item_id)
+        for target_workflow in AITrainingWorkflow.get_incomplete_workflows(course_id, item_id):
+            try:
+                train_classifiers.apply_async(args=[target_workflow.uuid])
+                logger.info(
+                    u"Rescheduling of training was successful for workflow with uuid{}".format(target_workflow.uuid)
+                )
+            except ANTICIPATED_CELERY_ERRORS as ex:
+                msg = (
+                    u"An unexpected error occurred while scheduling the task for training workflow with UUID {id}: {ex}"
+                ).format(id=target_workflow.uuid, ex=ex)
+                logger.exception(msg)
+
+                time_delta = datetime.datetime.now() - start_time
+                _log_complete_reschedule_training(
+                    course_id=course_id, item_id=item_id, seconds=time_delta.total_seconds(), success=False
+                )
+                raise reschedule_training_tasks.retry()
     except (DatabaseError, AITrainingWorkflow.DoesNotExist) as ex:
         msg = (
             u"An unexpected error occurred while retrieving all incomplete "
@@ -193,31 +214,140 @@ def reschedule_training_tasks(course_id, item_id):
         logger.exception(msg)
         raise reschedule_training_tasks.retry()
 
-    # Tries to train every workflow that has not completed.
-    for target_workflow in training_workflows:
-        try:
-            train_classifiers.apply_async(args=[target_workflow.uuid])
-            logger.info(
-                u"Rescheduling of training was successful for workflow with uuid{}".format(target_workflow.uuid)
-            )
-        except ANTICIPATED_CELERY_ERRORS as ex:
-            msg = (
-                u"An unexpected error occurred while scheduling the task for training workflow with UUID {id}: {ex}"
-            ).format(id=target_workflow.uuid, ex=ex)
-            logger.exception(msg)
-
-            time_delta = datetime.datetime.now() - start_time
-            _log_complete_reschedule_training(
-                course_id=course_id, item_id=item_id, seconds=time_delta.total_seconds(), success=False
-            )
-            raise reschedule_training_tasks.retry()
-
     # Logs the total time to reschedule all training of classifiers if not logged beforehand by exception.
     time_delta = datetime.datetime.now() - start_time
     _log_complete_reschedule_training(
         course_id=course_id, item_id=item_id, seconds=time_delta.total_seconds(), success=True
     )
 
+
+def _train_classifiers_by_criterion(algorithm, algorithm_id, examples_by_criterion):
+    """
+    Train a classifier for each criterion in the rubric.
+
+    If the `ORA2_AI_TRAINING_WORKERS` setting is greater than one,
+    the criteria are trained in parallel using a pool of that many processes;
+    otherwise, they are trained one at a time in this process.
+
+    Args:
+        algorithm (AIAlgorithm): The algorithm to use for sequential training.
+        algorithm_id (unicode): The ID of the algorithm, which worker processes use to load it.
+        examples_by_criterion (dict): Maps criterion names to lists of `AIAlgorithm.ExampleEssay`s.
+
+    Returns:
+        dict mapping criterion names to trained classifiers
+
+    Raises:
+        AIAlgorithmError
+
+    """
+    num_workers = getattr(settings, 'ORA2_AI_TRAINING_WORKERS', 1)
+    if num_workers <= 1 or len(examples_by_criterion) <= 1:
+        results = [
+            _train_criterion_classifier(algorithm, criterion_name, examples)
+            for criterion_name, examples in examples_by_criterion.iteritems()
+        ]
+    else:
+        # Namedtuples defined inside a class can't be pickled,
+        # so we send the examples to the worker processes as plain tuples.
+        jobs = [
+            (algorithm_id, criterion_name, [tuple(example) for example in examples])
+            for criterion_name, examples in examples_by_criterion.iteritems()
+        ]
+
+        # We use the standard library's `multiprocessing` rather than Celery's `billiard`:
+        # Celery's worker processes are daemons, and `billiard` won't let them create children.
+        pool = multiprocessing.Pool(processes=min(num_workers, len(jobs)))
+        try:
+            # Check each result as soon as it's available,
+            # so we stop training as soon as any criterion fails.
+            results = []
+            job_results = pool.imap_unordered(_train_criterion_job, jobs)
+            for __ in jobs:
+                criterion_name, classifier, seconds, error = job_results.next(TRAINING_POOL_TIMEOUT)
+                if error is not None:
+                    msg = (
+                        u"An error occurred while training the classifier for criterion \"{criterion}\": {error}"
+                    ).format(criterion=criterion_name, error=error)
+                    raise TrainingError(msg)
+                results.append((criterion_name, classifier, seconds))
+            pool.close()
+        except AIAlgorithmError:
+            pool.terminate()
+            raise
+        except Exception as ex:
+            pool.terminate()
+            msg = (
+                u"An error occurred while training classifiers in worker processes: {ex}"
+            ).format(ex=ex)
+            raise TrainingError(msg)
+        finally:
+            pool.join()
+
+    classifier_set = {}
+    for criterion_name, classifier, seconds in results:
+        dog_stats_api.histogram(
+            'openassessment.assessment.ai.train_classifier.time', seconds,
+            tags=[u"algorithm_id:{}".format(algorithm_id)]
+        )
+        logger.info(
+            u"Trained the classifier for criterion \"{criterion}\" in {seconds} seconds".format(
+                criterion=criterion_name, seconds=seconds
+            )
+        )
+        classifier_set[criterion_name] = classifier
+    return classifier_set
+
+
+def _train_criterion_job(job):
+    """
+    Train the classifier for one criterion in a worker process.
+
+    Args:
+        job (tuple): The algorithm ID, the criterion name,
+            and a list of `(text, score)` example tuples.
+
+    Returns:
+        tuple of `(criterion_name, classifier, seconds, error)`, where `error`
+        is None if training succeeded, or otherwise a description of the error.
+
+    We return errors instead of raising them, because exceptions whose
+    constructors take several arguments (such as `AlgorithmLoadError`)
+    can't be unpickled in the parent process, which would then wait
+    for a result until the pool timed out.
+
+    """
+    algorithm_id, criterion_name, examples = job
+    try:
+        algorithm = AIAlgorithm.algorithm_for_id(algorithm_id)
+        examples = [AIAlgorithm.ExampleEssay(text, score) for text, score in examples]
+        criterion_name, classifier, seconds = _train_criterion_classifier(algorithm, criterion_name, examples)
+    except Exception as ex:     # pylint: disable=W0703
+        return criterion_name, None, None, u"{name}: {ex}".format(name=ex.__class__.__name__, ex=ex)
+    return criterion_name, classifier, seconds, None
+
+
+def _train_criterion_classifier(algorithm, criterion_name, examples):
+    """
+    Train the classifier for one criterion, timing how long it takes.
+
+    Args:
+        algorithm (AIAlgorithm): The algorithm to use for training.
+        criterion_name (unicode): The name of the criterion.
+        examples (list of AIAlgorithm.ExampleEssay): The training examples for the criterion.
+
+    Returns:
+        tuple of `(criterion_name, classifier, seconds)`
+
+    Raises:
+        AIAlgorithmError
+
+    """
+    start_time = time.time()
+    classifier = algorithm.train_classifier(examples)
+    return criterion_name, classifier, time.time() - start_time
+
+
 def _examples_by_criterion(examples):
     """
     Transform the examples returned by the AI API into our internal format.
@@ -3,10 +3,14 @@ Aggregate data for openassessment.
 """
 import csv
 import json
+from collections import defaultdict
 from django.conf import settings
-from submissions import api as sub_api
+from django.db.models import F, Q
+from submissions.models import Submission, Score
 from openassessment.workflow.models import AssessmentWorkflow
-from openassessment.assessment.models import AssessmentPart, AssessmentFeedback
+from openassessment.assessment.models import (
+    Assessment, AssessmentPart, AssessmentFeedback, AssessmentFeedbackOption
+)
 
 
 class CsvWriter(object):
@@ -51,9 +55,11 @@ class CsvWriter(object):
     # Number of submissions to retrieve at a time
     # from the database.  We need to do this in order
     # to avoid loading thousands of records into memory at once.
+    # The submissions, scores, assessments and feedback
+    # for each chunk of submissions are loaded together.
     QUERY_INTERVAL = 100
 
-    def __init__(self, output_streams, progress_callback=None):
+    def __init__(self, output_streams, progress_callback=None, checkpoint_callback=None):
         """
         Configure where the writer will write data.
 
@@ -70,6 +76,11 @@ class CsvWriter(object):
             progress_callback (callable): Callable that accepts
                 no arguments.  Called once per submission loaded
                 from the database.
+            checkpoint_callback (callable): Callable that accepts
+                a cursor (a JSON-serializable dict).  Called each time
+                the writer finishes writing a chunk of submissions.
+                Passing the last cursor to `write_to_csv()` resumes
+                an interrupted export after that chunk.
 
         Example usage:
             >>> output_streams = {
@@ -86,45 +97,330 @@ class CsvWriter(object):
             if key in self.MODELS
         }
         self._progress_callback = progress_callback
+        self._checkpoint_callback = checkpoint_callback
 
-    def write_to_csv(self, course_id):
+    def write_to_csv(self, course_id, cursor=None, last_submission_uuid=None):
         """
         Write assessment and submission data for a course to CSV files.
 
-        NOTE: The current implementation optimizes for memory usage,
-        but not for the number of database queries.  All the queries
-        use indexed fields (the submission uuid), so they should be
-        relatively quick.
+        Submissions are processed in chunks of `QUERY_INTERVAL`.
+        For each chunk, we load the submissions, scores, assessment parts,
+        and assessment feedback with one query each (using the indexed
+        submission uuid), then write the rows in submission order.
+        The number of queries is proportional to the number of chunks,
+        and we never hold more than one chunk in memory.
 
         Args:
             course_id (unicode): The course ID from which to pull data.
 
+        Keyword Arguments:
+            cursor (dict): If provided, resume an interrupted export
+                after the last chunk passed to the checkpoint callback.
+                The headers are not written again, since the output
+                streams should already contain them.
+            last_submission_uuid (unicode): If provided, stop after the workflow
+                for this submission.  Together with the cursor, this lets
+                us write one shard of the course (see `submission_uuid_shards()`).
+
+        Returns:
+            None
+
+        Raises:
+            AssessmentWorkflow.DoesNotExist: The cursor or last submission
+                refers to a workflow that is not in the database.
+
+        """
+        rubric_points_cache = dict()
+        if cursor is None:
+            self._write_csv_headers()
+            after_submission_uuid = None
+            feedback_option_set = set()
+        else:
+            after_submission_uuid = cursor['submission_uuid']
+            feedback_option_set = set(
+                self._use_read_replica(
+                    AssessmentFeedbackOption.objects.filter(id__in=cursor['feedback_option_ids'])
+                )
+            )
+
+        submission_uuid_chunks = self._submission_uuid_chunks(
+            course_id, after_submission_uuid, last_submission_uuid
+        )
+        for submission_uuids in submission_uuid_chunks:
+            self._write_chunk_to_csv(submission_uuids, rubric_points_cache, feedback_option_set)
+
+            if self._checkpoint_callback is not None:
+                self._checkpoint_callback({
+                    'submission_uuid': submission_uuids[-1],
+                    'feedback_option_ids': sorted(option.id for option in feedback_option_set),
+                })
+
+        # The set of available options should be relatively small,
+        # since they're not (currently) user-defined.
+        self._write_feedback_options_to_csv(feedback_option_set)
+
+    def write_changes_to_csv(self, course_id, since, until, write_headers=True):
+        """
+        Write the assessment and submission data for a course
+        that was created or modified in a time window to CSV files.
+
+        This writes the submissions created in the window, the latest score
+        for each submission created in the window, the assessments
+        (and their parts) scored in the window, and the assessment feedback
+        modified in the window, along with the feedback options it uses.
+        The rows have the same format as `write_to_csv()`, so they can be
+        appended to the output of an earlier export.  When appending
+        (that is, when `write_headers` is False), we write only the feedback
+        options created in the window, since the earlier export
+        already contains the others.  Since feedback can change,
+        an appended file may contain several rows for the same submission's
+        feedback (or score), in which case the last row is the current one.
+        If a submission's score is hidden or reset in the window, we write
+        a score row with zero points possible, which replaces the earlier score.
+
+        To export the data incrementally, use the end of one window
+        as the start of the next, so every change is written exactly once.
+
+        Args:
+            course_id (unicode): The course ID from which to pull data.
+            since (datetime): The start of the time window (inclusive).
+            until (datetime): The end of the time window (exclusive).
+
+        Keyword Arguments:
+            write_headers (bool): If False, don't write the headers,
+                so the output can be appended to an earlier export.
+
         Returns:
             None
 
         """
-        self._write_csv_headers()
+        if write_headers:
+            self._write_csv_headers()
 
         rubric_points_cache = dict()
         feedback_option_set = set()
-        for submission_uuid in self._submission_uuids(course_id):
-            self._write_submission_to_csv(submission_uuid)
-
-            # Django 1.4 doesn't follow reverse relations when using select_related,
-            # so we select AssessmentPart and follow the foreign key to the Assessment.
-            parts = self._use_read_replica(
-                AssessmentPart.objects.select_related('assessment', 'option', 'option__criterion')
-                    .filter(assessment__submission_uuid=submission_uuid)
-                    .order_by('assessment__pk')
+        submission_uuids = self._changed_submission_uuids(course_id, since, until)
+        for start in range(0, len(submission_uuids), self.QUERY_INTERVAL):
+            self._write_chunk_to_csv(
+                submission_uuids[start:start + self.QUERY_INTERVAL],
+                rubric_points_cache, feedback_option_set,
+                window=(since, until)
             )
-            self._write_assessment_to_csv(parts, rubric_points_cache)
 
-            feedback_query = self._use_read_replica(
-                AssessmentFeedback.objects
-                    .filter(submission_uuid=submission_uuid)
-                    .prefetch_related('options')
+        if not write_headers:
+            feedback_option_set = set(
+                option for option in feedback_option_set
+                if since <= option.created_at < until
             )
-            for assessment_feedback in feedback_query:
+        self._write_feedback_options_to_csv(feedback_option_set)
+
+    def _changed_submission_uuids(self, course_id, since, until):
+        """
+        Find the submissions with data created or modified in a time window.
+        Each query uses the index on the timestamp, so the cost is proportional
+        to the amount of data that changed, not the size of the course.
+
+        Args:
+            course_id (unicode): The ID of the course.
+            since (datetime): The start of the time window (inclusive).
+            until (datetime): The end of the time window (exclusive).
+
+        Returns:
+            list of submission UUIDs, in the same order as `write_to_csv()`
+
+        """
+        course_submission_uuids = self._use_read_replica(
+            AssessmentWorkflow.objects.filter(course_id=course_id)
+        ).values('submission_uuid')
+
+        changed_uuids = set()
+        changed_uuids.update(self._use_read_replica(
+            Submission.objects.filter(
+                student_item__course_id=course_id,
+                created_at__gte=since, created_at__lt=until
+            )
+        ).values_list('uuid', flat=True))
+        reset_student_item_ids = set()
+        scores = self._use_read_replica(
+            Score.objects.filter(
+                student_item__course_id=course_id,
+                created_at__gte=since, created_at__lt=until
+            )
+        ).values_list('submission__uuid', 'student_item')
+        for submission_uuid, student_item_id in scores:
+            # A "reset" score has no submission; it resets the scores
+            # for every submission the student made for the problem.
+            if submission_uuid is None:
+                reset_student_item_ids.add(student_item_id)
+            else:
+                changed_uuids.add(submission_uuid)
+        changed_uuids.update(self._use_read_replica(
+            Assessment.objects.filter(
+                submission_uuid__in=course_submission_uuids,
+                scored_at__gte=since, scored_at__lt=until
+            )
+        ).values_list('submission_uuid', flat=True))
+        changed_uuids.update(self._use_read_replica(
+            AssessmentFeedback.objects.filter(
+                submission_uuid__in=course_submission_uuids,
+                modified__gte=since, modified__lt=until
+            )
+        ).values_list('submission_uuid', flat=True))
+
+        reset_student_item_ids = list(reset_student_item_ids)
+        for start in range(0, len(reset_student_item_ids), self.QUERY_INTERVAL):
+            changed_uuids.update(self._use_read_replica(
+                Submission.objects.filter(
+                    student_item__in=reset_student_item_ids[start:start + self.QUERY_INTERVAL],
+                    created_at__lt=until
+                )
+            ).values_list('uuid', flat=True))
+
+        # Order the submissions by their workflows, like `write_to_csv()`.
+        # This also excludes submissions without workflows.
+        changed_uuids = list(changed_uuids)
+        workflow_keys = []
+        for start in range(0, len(changed_uuids), self.QUERY_INTERVAL):
+            workflow_keys.extend(self._use_read_replica(
+                AssessmentWorkflow.objects.filter(
+                    course_id=course_id,
+                    submission_uuid__in=changed_uuids[start:start + self.QUERY_INTERVAL]
+                )
+            ).values_list('created', 'id', 'submission_uuid'))
+        return [submission_uuid for __, __, submission_uuid in sorted(workflow_keys)]
+
+    def submission_uuid_shards(self, course_id, num_shards):
+        """
+        Split the submissions for a course into contiguous shards
+        of (roughly) equal size, in the order used by `write_to_csv()`.
+
+        Writing each shard with `write_to_csv()` (the first with headers,
+        the rest without) and concatenating the output in shard order
+        produces the same rows as writing the whole course at once,
+        except for the feedback options, which each shard writes separately.
+
+        Args:
+            course_id (unicode): The ID of the course.
+            num_shards (int): The maximum number of shards.  There are never
+                more shards than submissions, but there is always at least one shard.
+
+        Returns:
+            list of `(after_submission_uuid, last_submission_uuid)` tuples,
+            to pass to `write_to_csv()` as the cursor's submission UUID
+            and the last submission UUID.  None means the shard is unbounded
+            at that end.
+
+        """
+        workflows = self._use_read_replica(
+            AssessmentWorkflow.objects.filter(course_id=course_id)
+        ).order_by('created', 'id')
+        num_workflows = workflows.count()
+        num_shards = max(min(num_shards, num_workflows), 1)
+
+        # Each boundary query scans the index up to the offset,
+        # but we only need one query per shard.
+        boundaries = [None]
+        for shard_num in range(1, num_shards):
+            offset = shard_num * num_workflows // num_shards - 1
+            boundaries.append(workflows.values_list('submission_uuid', flat=True)[offset])
+        boundaries.append(None)
+        return zip(boundaries[:-1], boundaries[1:])
+
+    def _write_chunk_to_csv(self, submission_uuids, rubric_points_cache, feedback_option_set, window=None):
+        """
+        Write the data for a chunk of submissions to CSV.
+
+        Args:
+            submission_uuids (list of unicode): The UUIDs of the submissions to write, in order.
+            rubric_points_cache (dict): in-memory cache of points possible by rubric ID.
+            feedback_option_set (set): The feedback options used so far;
+                updated with the options used by the feedback in this chunk.
+
+        Keyword Arguments:
+            window (tuple): If provided, the `(since, until)` time window;
+                only write the data created or modified in this window
+                (see `write_changes_to_csv()`).
+
+        Returns:
+            None
+
+        """
+        submission_query = Submission.objects.select_related('student_item').filter(uuid__in=submission_uuids)
+        score_query = (
+            Score.objects.select_related('submission')
+                .filter(submission__uuid__in=submission_uuids)
+                .order_by('-id')
+        )
+        # Django 1.4 doesn't follow reverse relations when using select_related,
+        # so we select AssessmentPart and follow the foreign key to the Assessment.
+        parts_query = (
+            AssessmentPart.objects.select_related('assessment', 'criterion', 'option')
+                .filter(assessment__submission_uuid__in=submission_uuids)
+                .order_by('assessment__pk')
+        )
+        feedback_query = (
+            AssessmentFeedback.objects
+                .filter(submission_uuid__in=submission_uuids)
+                .prefetch_related('options')
+        )
+
+        # Scores reset in the time window (by submission UUID), which apply
+        # to the submissions the student made before the reset.
+        latest_resets = dict()
+
+        if window is not None:
+            since, until = window
+            submission_query = submission_query.filter(created_at__gte=since, created_at__lt=until)
+            score_query = score_query.filter(created_at__gte=since, created_at__lt=until)
+            parts_query = parts_query.filter(assessment__scored_at__gte=since, assessment__scored_at__lt=until)
+            feedback_query = feedback_query.filter(modified__gte=since, modified__lt=until)
+
+            reset_query = (
+                Score.objects.filter(
+                    reset=True, created_at__gte=since, created_at__lt=until,
+                    student_item__submission__uuid__in=submission_uuids,
+                    student_item__submission__created_at__lte=F('created_at')
+                )
+                .order_by('id')
+                .values_list('student_item__submission__uuid', 'points_earned', 'points_possible', 'created_at')
+            )
+            for reset in self._use_read_replica(reset_query):
+                latest_resets[reset[0]] = reset
+
+        submissions = {
+            submission.uuid: submission
+            for submission in self._use_read_replica(submission_query)
+        }
+
+        # Keep the latest score for each submission
+        latest_scores = dict()
+        for score in self._use_read_replica(score_query):
+            latest_scores.setdefault(score.submission.uuid, score)
+
+        parts_by_submission = defaultdict(list)
+        for part in self._use_read_replica(parts_query):
+            parts_by_submission[part.assessment.submission_uuid].append(part)
+
+        feedback_by_submission = defaultdict(list)
+        for assessment_feedback in self._use_read_replica(feedback_query):
+            feedback_by_submission[assessment_feedback.submission_uuid].append(assessment_feedback)
+
+        for submission_uuid in submission_uuids:
+            if submission_uuid in submissions:
+                self._write_submission_to_csv(submissions[submission_uuid])
+
+            score = latest_scores.get(submission_uuid)
+            reset = latest_resets.get(submission_uuid)
+            if reset is not None and (score is None or score.created_at < reset[3]):
+                self._write_unicode('score', list(reset))
+            elif score is not None and (window is not None or not score.is_hidden()):
+                # Incremental exports write hidden scores,
+                # so they replace the score written by an earlier export.
+                self._write_score_to_csv(score)
+
+            self._write_assessment_to_csv(parts_by_submission[submission_uuid], rubric_points_cache)
+
+            for assessment_feedback in feedback_by_submission[submission_uuid]:
                 self._write_assessment_feedback_to_csv(assessment_feedback)
                 feedback_option_set.update(set(
                     option for option in assessment_feedback.options.all()
@@ -133,46 +429,64 @@ class CsvWriter(object):
             if self._progress_callback is not None:
                 self._progress_callback()
 
-        # The set of available options should be relatively small,
-        # since they're not (currently) user-defined.
-        self._write_feedback_options_to_csv(feedback_option_set)
-
-    def _submission_uuids(self, course_id):
+    def _submission_uuid_chunks(self, course_id, after_submission_uuid=None, last_submission_uuid=None):
         """
-        Iterate over submission uuids.
+        Iterate over submission uuids, a chunk at a time.
         Makes database calls every N submissions to avoid loading
         all submission uuids into memory at once.
 
+        Workflows are ordered by creation time, then by primary key
+        to break ties.  Instead of using offsets, each query starts
+        after the last workflow of the previous chunk, so we never skip
+        or repeat workflows, and the database doesn't have to scan
+        the workflows we've already seen.
+
         Args:
             course_id (unicode): The ID of the course to retrieve submissions from.
 
+        Keyword Arguments:
+            after_submission_uuid (unicode): If provided, start after
+                the workflow for this submission.
+            last_submission_uuid (unicode): If provided, stop after
+                the workflow for this submission.
+
         Yields:
-            submission_uuid (unicode)
+            list of submission uuids (unicode)
+
+        Raises:
+            AssessmentWorkflow.DoesNotExist
 
         """
-        num_results = 0
-        start = 0
-        total_results = self._use_read_replica(
+        workflows = self._use_read_replica(
             AssessmentWorkflow.objects.filter(course_id=course_id)
-        ).count()
-
-        while num_results < total_results:
-            # Load a subset of the submission UUIDs
-            # We're assuming that peer workflows are immutable,
-            # so if we counted N at the start of the loop,
-            # there should be >= N for us to process.
-            end = start + self.QUERY_INTERVAL
-            query = self._use_read_replica(
-                AssessmentWorkflow.objects
-                    .filter(course_id=course_id)
-                    .order_by('created')
-            ).values('submission_uuid')[start:end]
-
-            for workflow_dict in query:
-                num_results += 1
-                yield workflow_dict['submission_uuid']
-
-            start += self.QUERY_INTERVAL
+        ).order_by('created', 'id')
+
+        last_key = None
+        if after_submission_uuid is not None:
+            last_workflow = workflows.get(submission_uuid=after_submission_uuid)
+            last_key = (last_workflow.created, last_workflow.id)
+
+        if last_submission_uuid is not None:
+            end_workflow = workflows.get(submission_uuid=last_submission_uuid)
+            workflows = workflows.filter(
+                Q(created__lt=end_workflow.created) |
+                Q(created=end_workflow.created, id__lte=end_workflow.id)
+            )
+
+        while True:
+            query = workflows
+            if last_key is not None:
+                created, workflow_id = last_key
+                query = query.filter(
+                    Q(created__gt=created) | Q(created=created, id__gt=workflow_id)
+                )
+            workflow_dicts = list(query.values('id', 'created', 'submission_uuid')[:self.QUERY_INTERVAL])
+            if not workflow_dicts:
+                break
+
+            yield [workflow_dict['submission_uuid'] for workflow_dict in workflow_dicts]
+
+            last_key = (workflow_dicts[-1]['created'], workflow_dicts[-1]['id'])
 
     def _write_csv_headers(self):
         """
@@ -181,35 +495,47 @@ class CsvWriter(object):
         for name, writer in self.writers.iteritems():
             writer.writerow(self.HEADERS[name])
 
-    def _write_submission_to_csv(self, submission_uuid):
+    def _write_submission_to_csv(self, submission):
         """
         Write submission data to CSV.
 
         Args:
-            submission_uuid (unicode): The UUID of the submission to write.
+            submission (Submission): The submission to write,
+                with its student item already loaded.
 
         Returns:
             None
 
         """
-        submission = sub_api.get_submission_and_student(submission_uuid, read_replica=True)
+        # Decode and re-encode the answer, so the output matches
+        # the answer as serialized by the submissions API.
         self._write_unicode('submission', [
-            submission['uuid'],
-            submission['student_item']['student_id'],
-            submission['student_item']['item_id'],
-            submission['submitted_at'],
-            submission['created_at'],
-            json.dumps(submission['answer'])
+            submission.uuid,
+            submission.student_item.student_id,
+            submission.student_item.item_id,
+            submission.submitted_at,
+            submission.created_at,
+            json.dumps(json.loads(submission.raw_answer))
         ])
 
-        score = sub_api.get_latest_score_for_submission(submission_uuid, read_replica=True)
-        if score is not None:
-            self._write_unicode('score', [
-                score['submission_uuid'],
-                score['points_earned'],
-                score['points_possible'],
-                score['created_at']
-            ])
+    def _write_score_to_csv(self, score):
+        """
+        Write score data to CSV.
+
+        Args:
+            score (Score): The score to write,
+                with its submission already loaded.
+
+        Returns:
+            None
+
+        """
+        self._write_unicode('score', [
+            score.submission.uuid,
+            score.points_earned,
+            score.points_possible,
+            score.created_at
+        ])
 
     def _write_assessment_to_csv(self, assessment_parts, rubric_points_cache):
         """
@@ -287,6 +613,9 @@ class CsvWriter(object):
         """
         Write feedback on assessment options to CSV.
 
+        The options are written in order of their IDs, so the output
+        doesn't depend on the order in which we found them.
+
         Args:
             feedback_options (iterable of AssessmentFeedbackOption)
 
@@ -294,7 +623,7 @@ class CsvWriter(object):
             None
 
         """
-        for option in feedback_options:
+        for option in sorted(feedback_options, key=lambda option: option.id):
             self._write_unicode(
                 'assessment_feedback_option',
                 [option.id, option.text]
@@ -0,0 +1,117 @@
+"""
+Backfill the denormalized peer assessment queue counters.
+
+The counters for peer workflows created before they were introduced are
+calculated by a data migration.  This command recalculates the counters
+from the peer workflow items (for example, if they have drifted), optionally
+restricted to a single course or a single problem in a course.
+
+It is safe to run the command more than once, and to run it while
+students are actively assessing (though counts for workflows updated
+during the run may need a second pass).
+
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max
+from openassessment.assessment.models import PeerWorkflow, PeerWorkflowItem
+
+
+class Command(BaseCommand):
+    """
+    Recalculate the peer queue counters for existing peer workflows.
+    """
+
+    help = (
+        u"Recalculate the denormalized peer assessment queue counters "
+        u"(assessed_count, open_count, last_leased_at) on peer workflows."
+    )
+
+    args = '[<COURSE_ID> [<ITEM_ID>]]'
+
+    # Number of peer workflows to update per transaction
+    CHUNK_SIZE = 500
+
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self._num_updated = 0
+
+    @property
+    def num_updated(self):
+        """
+        Return the number of peer workflows whose counters were updated,
+        which is useful for testing.
+
+        Returns:
+            int
+
+        """
+        return self._num_updated
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            course_id (unicode): If provided, backfill only workflows in this course.
+            item_id (unicode): If provided, backfill only workflows for this problem.
+
+        Raises:
+            CommandError
+
+        """
+        if len(args) > 2:
+            raise CommandError(u"Usage: backfill_peer_workflow_counters {}".format(self.args))
+
+        workflows = PeerWorkflow.objects.all()
+        if len(args) > 0:
+            workflows = workflows.filter(course_id=args[0].decode('utf-8'))
+        if len(args) > 1:
+            workflows = workflows.filter(item_id=args[1].decode('utf-8'))
+
+        # Iterate by primary key so we never hold the whole table in memory
+        workflow_ids = workflows.order_by('id').values_list('id', flat=True)
+        last_id = 0
+        while True:
+            chunk = list(workflow_ids.filter(id__gt=last_id)[:self.CHUNK_SIZE])
+            if not chunk:
+                break
+            self._backfill_chunk(chunk)
+            last_id = chunk[-1]
+            print u"Updated counters for {} peer workflows".format(self._num_updated)
+
+    @transaction.commit_on_success
+    def _backfill_chunk(self, workflow_ids):
+        """
+        Recalculate the counters for a chunk of peer workflows.
+
+        Args:
+            workflow_ids (list of int): The primary keys of the workflows to update.
+
+        Returns:
+            None
+
+        """
+        # Clear the default ordering so it does not leak into the GROUP BY
+        items = PeerWorkflowItem.objects.filter(author__in=workflow_ids).order_by()
+        assessed_counts = {
+            row['author']: row['num_items']
+            for row in items.filter(assessment__isnull=False).values('author').annotate(
+                num_items=Count('id')
+            )
+        }
+        open_counts = {
+            row['author']: (row['num_items'], row['last_started_at'])
+            for row in items.filter(assessment__isnull=True).values('author').annotate(
+                num_items=Count('id'), last_started_at=Max('started_at')
+            )
+        }
+
+        for workflow_id in workflow_ids:
+            open_count, last_leased_at = open_counts.get(workflow_id, (0, None))
+            PeerWorkflow.objects.filter(pk=workflow_id).update(
+                assessed_count=assessed_counts.get(workflow_id, 0),
+                open_count=open_count,
+                last_leased_at=last_leased_at
+            )
+            self._num_updated += 1
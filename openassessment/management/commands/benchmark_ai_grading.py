@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the AI training and grading pipeline locally.
+
+The command generates a rubric with NUM_CRITERIA criteria and NUM_ESSAYS
+synthetic essays, trains classifiers using the specified algorithm,
+then grades each essay.  The Celery tasks are executed eagerly
+(in this process), using the configured database and classifier storage,
+so we can measure the pipeline without deploying workers.
+
+The results are written as JSON, so they can be compared between releases:
+
+    * training: duration (seconds) and number of database queries of the training task.
+    * grading: essays graded per second, the 50th/99th percentile task latency (seconds),
+      and the mean/maximum number of database queries per grading task.
+    * peak_rss_kb: the peak resident set size of the process (kilobytes).
+
+Since the command creates submissions and workflows, it should NOT
+be run against a production database.
+
+"""
+from optparse import make_option
+import json
+import math
+import random
+import resource
+import sys
+import time
+from uuid import uuid4
+from celery import current_app
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from submissions import api as sub_api
+from openassessment.assessment.models import AITrainingWorkflow, AIGradingWorkflow
+from openassessment.assessment.serializers import deserialize_training_examples
+from openassessment.assessment.worker.algorithm import AIAlgorithm, UnknownAlgorithm, AlgorithmLoadError
+from openassessment.assessment.worker.training import train_classifiers
+from openassessment.assessment.worker.grading import grade_essay
+
+
+class Command(BaseCommand):
+    """
+    Benchmark AI training and grading with synthetic essays.
+    """
+
+    help = u"Measure the throughput of AI training and grading using synthetic essays."
+
+    args = '<ALGORITHM_ID> <NUM_ESSAYS> <NUM_CRITERIA>'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--examples', dest='num_examples', type='int', default=30,
+            help=u"Number of training examples (default 30)"
+        ),
+        make_option(
+            '--seed', dest='seed', type='int', default=0,
+            help=u"Seed for generating the synthetic essays (default 0)"
+        ),
+        make_option(
+            '--output', dest='output',
+            help=u"Write the results to this file instead of stdout"
+        ),
+    )
+
+    COURSE_ID = u"benchmark_course"
+
+    # Words used to generate the synthetic essays
+    VOCABULARY = (
+        u"the food agriculture world day every year investment sector economy developing country "
+        u"theme action focus founding organization nations celebrated honor important driving force "
+        u"many frequently starved vital because only around different common highlight areas needed"
+    ).split()
+
+    # Each criterion has one option for each of these point values
+    OPTION_POINTS = [0, 1, 2]
+
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self._results = None
+
+    @property
+    def results(self):
+        """
+        Return the results of the benchmark, which is useful for testing.
+
+        Returns:
+            dict
+
+        """
+        return self._results
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            algorithm_id (unicode): The ID of the ML algorithm to use ("fake" or "ease").
+            num_essays (int): The number of essays to grade.
+            num_criteria (int): The number of criteria in the rubric.
+
+        Kwargs:
+            num_examples (int): The number of training examples.
+            seed (int): Seed for generating the synthetic essays.
+            output (unicode): Path of the file to write the results to.
+
+        Raises:
+            CommandError
+
+        """
+        if len(args) != 3:
+            raise CommandError(u"Usage: benchmark_ai_grading {}".format(self.args))
+
+        algorithm_id = args[0].decode('utf-8')
+        try:
+            num_essays = int(args[1])
+            num_criteria = int(args[2])
+        except ValueError:
+            raise CommandError(u"NUM_ESSAYS and NUM_CRITERIA must be integers")
+        if num_essays < 1 or num_criteria < 1:
+            raise CommandError(u"NUM_ESSAYS and NUM_CRITERIA must be positive")
+
+        num_examples = options.get('num_examples', 30)
+        if num_examples < len(self.OPTION_POINTS):
+            raise CommandError(
+                u"At least {} training examples are required".format(len(self.OPTION_POINTS))
+            )
+
+        try:
+            AIAlgorithm.algorithm_for_id(algorithm_id)
+        except (UnknownAlgorithm, AlgorithmLoadError) as ex:
+            raise CommandError(u"Could not load the algorithm {}: {}".format(algorithm_id, ex))
+
+        # Use a new item for each run, so we never use classifiers from an earlier run
+        item_id = u"benchmark_{}".format(uuid4().hex)
+        rand = random.Random(options.get('seed', 0))
+        rubric = self._rubric(num_criteria)
+
+        # Execute the tasks in this process, counting database queries
+        always_eager = current_app.conf.CELERY_ALWAYS_EAGER
+        use_debug_cursor = connection.use_debug_cursor
+        current_app.conf.CELERY_ALWAYS_EAGER = True
+        connection.use_debug_cursor = True
+        try:
+            training = self._benchmark_training(
+                rubric, num_examples, rand, algorithm_id, item_id
+            )
+            grading = self._benchmark_grading(
+                rubric, num_essays, rand, algorithm_id, item_id
+            )
+        finally:
+            current_app.conf.CELERY_ALWAYS_EAGER = always_eager
+            connection.use_debug_cursor = use_debug_cursor
+
+        self._results = {
+            'algorithm_id': algorithm_id,
+            'num_essays': num_essays,
+            'num_criteria': num_criteria,
+            'num_examples': num_examples,
+            'training': training,
+            'grading': grading,
+            'peak_rss_kb': self._peak_rss_kb(),
+        }
+
+        output = json.dumps(self._results, indent=4, sort_keys=True)
+        if options.get('output'):
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            print output
+
+    def _benchmark_training(self, rubric, num_examples, rand, algorithm_id, item_id):
+        """
+        Train classifiers for the rubric using synthetic examples.
+
+        Args:
+            rubric (dict): The serialized rubric.
+            num_examples (int): The number of training examples.
+            rand (random.Random): Used to generate the essays.
+            algorithm_id (unicode): The ID of the ML algorithm.
+            item_id (unicode): The item the classifiers are trained for.
+
+        Returns:
+            dict with keys `seconds` and `queries`
+
+        Raises:
+            CommandError
+
+        """
+        examples = []
+        for num in range(num_examples):
+            # Cycle through the scores, so every score has examples
+            points = self.OPTION_POINTS[num % len(self.OPTION_POINTS)]
+            examples.append({
+                'answer': self._essay(rand),
+                'options_selected': {
+                    criterion['name']: self._option_name(points)
+                    for criterion in rubric['criteria']
+                }
+            })
+        workflow = AITrainingWorkflow.start_workflow(
+            deserialize_training_examples(examples, rubric),
+            self.COURSE_ID, item_id, algorithm_id
+        )
+
+        sys.stderr.write(u"Training classifiers using {}...\n".format(algorithm_id))
+        seconds, queries = self._run_task(train_classifiers, workflow.uuid)
+
+        if not AITrainingWorkflow.objects.get(uuid=workflow.uuid).is_complete:
+            raise CommandError(u"Training did not complete successfully")
+        return {'seconds': seconds, 'queries': queries}
+
+    def _benchmark_grading(self, rubric, num_essays, rand, algorithm_id, item_id):
+        """
+        Grade synthetic essays using the most recently trained classifiers.
+
+        Args:
+            rubric (dict): The serialized rubric.
+            num_essays (int): The number of essays to grade.
+            rand (random.Random): Used to generate the essays.
+            algorithm_id (unicode): The ID of the ML algorithm.
+            item_id (unicode): The item the essays are submitted to.
+
+        Returns:
+            dict
+
+        Raises:
+            CommandError
+
+        """
+        # Create the submissions and workflows before we start timing
+        workflow_uuids = []
+        for num in range(num_essays):
+            student_item = {
+                'course_id': self.COURSE_ID,
+                'item_id': item_id,
+                'item_type': 'openassessment',
+                'student_id': u"benchmark_student_{}".format(num)
+            }
+            submission = sub_api.create_submission(student_item, {'answer': self._essay(rand)})
+            workflow = AIGradingWorkflow.start_workflow(submission['uuid'], rubric, algorithm_id)
+            workflow_uuids.append(workflow.uuid)
+
+        sys.stderr.write(u"Grading {} essays...\n".format(num_essays))
+        latencies = []
+        query_counts = []
+        for workflow_uuid in workflow_uuids:
+            seconds, queries = self._run_task(grade_essay, workflow_uuid)
+            latencies.append(seconds)
+            query_counts.append(queries)
+
+        num_incomplete = AIGradingWorkflow.objects.filter(
+            uuid__in=workflow_uuids, completed_at__isnull=True
+        ).count()
+        if num_incomplete > 0:
+            raise CommandError(u"{} essays were not graded successfully".format(num_incomplete))
+
+        total_seconds = sum(latencies)
+        return {
+            'seconds': total_seconds,
+            'essays_per_second': (num_essays / total_seconds) if total_seconds > 0 else None,
+            'latency_p50': self._percentile(latencies, 50),
+            'latency_p99': self._percentile(latencies, 99),
+            'queries_per_task_mean': float(sum(query_counts)) / len(query_counts),
+            'queries_per_task_max': max(query_counts),
+        }
+
+    def _run_task(self, task, workflow_uuid):
+        """
+        Execute a Celery task eagerly, measuring its duration and database queries.
+
+        Args:
+            task (celery.Task): The task to execute.
+            workflow_uuid (unicode): The task's argument.
+
+        Returns:
+            tuple of (seconds, number of queries)
+
+        """
+        reset_queries()
+        start = time.time()
+        task.apply_async(args=[workflow_uuid], throw=True)
+        return time.time() - start, len(connection.queries)
+
+    def _rubric(self, num_criteria):
+        """
+        Construct a rubric with the specified number of criteria.
+
+        Args:
+            num_criteria (int): The number of criteria.
+
+        Returns:
+            dict
+
+        """
+        options = [
+            {
+                "order_num": order_num,
+                "name": self._option_name(points),
+                "explanation": u"{} points".format(points),
+                "points": points,
+            }
+            for order_num, points in enumerate(self.OPTION_POINTS)
+        ]
+        return {
+            'prompt': u"Benchmark prompt",
+            'criteria': [
+                {
+                    "order_num": num,
+                    "name": u"criterion_{}".format(num),
+                    "prompt": u"Criterion {}".format(num),
+                    "options": options
+                }
+                for num in range(num_criteria)
+            ]
+        }
+
+    def _option_name(self, points):
+        """
+        Return the name of the option worth the specified number of points.
+
+        Args:
+            points (int): The points for the option.
+
+        Returns:
+            unicode
+
+        """
+        return u"option_{}".format(points)
+
+    def _essay(self, rand):
+        """
+        Generate a synthetic essay.
+        Essays are (almost certainly) distinct, so duplicate essays don't skew the results.
+
+        Args:
+            rand (random.Random): Used to choose the words of the essay.
+
+        Returns:
+            unicode
+
+        """
+        num_words = rand.randint(50, 300)
+        return u" ".join(rand.choice(self.VOCABULARY) for _ in range(num_words))
+
+    def _percentile(self, values, percent):
+        """
+        Calculate a percentile using the nearest-rank method.
+
+        Args:
+            values (list of float): The values.
+            percent (int): The percentile to calculate, from 0 to 100.
+
+        Returns:
+            float
+
+        """
+        ordered = sorted(values)
+        index = max(int(math.ceil(percent / 100.0 * len(ordered))) - 1, 0)
+        return ordered[index]
+
+    def _peak_rss_kb(self):
+        """
+        Return the peak resident set size of this process in kilobytes.
+
+        Returns:
+            int
+
+        """
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # Mac OS X reports the size in bytes; Linux reports kilobytes
+        if sys.platform == 'darwin':
+            peak_rss /= 1024
+        return peak_rss
@@ -0,0 +1,107 @@
+"""
+Re-encode stored AI classifiers in the binary classifier data format.
+
+Classifiers stored before we introduced the binary format are JSON-encoded.
+We can still read these, but they are larger and slower to load.
+This command downloads each classifier stored in the older format
+and uploads it again in the binary format.  The pickled EASE classifiers
+in the older format are base64-encoded; these are stored as pickled bytes.
+
+The new data is uploaded to a new file, so workers can keep reading
+the old file while the command runs.  The old files are not deleted.
+It is safe to run the command more than once.
+
+"""
+from django.core.management.base import BaseCommand, CommandError
+from openassessment.assessment.models import (
+    AIClassifier, ClassifierSerializeError, ClassifierUploadError,
+    decode_classifier_data, is_legacy_classifier_data
+)
+from openassessment.assessment.worker.algorithm import EaseAIAlgorithm
+
+
+class Command(BaseCommand):
+    """
+    Re-encode stored AI classifiers in the binary format.
+    """
+
+    help = u"Re-encode AI classifiers stored in the older JSON format using the binary format."
+
+    args = '[<COURSE_ID> [<ITEM_ID>]]'
+
+    # Number of classifiers to retrieve per query
+    CHUNK_SIZE = 100
+
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self._num_reencoded = 0
+
+    @property
+    def num_reencoded(self):
+        """
+        Return the number of classifiers that were re-encoded,
+        which is useful for testing.
+
+        Returns:
+            int
+
+        """
+        return self._num_reencoded
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+
+        Args:
+            course_id (unicode): If provided, re-encode only classifiers in this course.
+            item_id (unicode): If provided, re-encode only classifiers for this problem.
+
+        Raises:
+            CommandError
+
+        """
+        if len(args) > 2:
+            raise CommandError(u"Usage: reencode_ai_classifiers {}".format(self.args))
+
+        classifiers = AIClassifier.objects.all()
+        if len(args) > 0:
+            classifiers = classifiers.filter(classifier_set__course_id=args[0].decode('utf-8'))
+        if len(args) > 1:
+            classifiers = classifiers.filter(classifier_set__item_id=args[1].decode('utf-8'))
+
+        # Iterate by primary key so we never hold the whole table in memory
+        classifiers = classifiers.order_by('id')
+        last_id = 0
+        while True:
+            chunk = list(classifiers.filter(id__gt=last_id)[:self.CHUNK_SIZE])
+            if not chunk:
+                break
+            for classifier in chunk:
+                self._reencode(classifier)
+            last_id = chunk[-1].id
+            print u"Re-encoded {} classifiers".format(self._num_reencoded)
+
+    def _reencode(self, classifier):
+        """
+        Re-encode a single classifier if it uses the older format.
+
+        Args:
+            classifier (AIClassifier): The classifier to re-encode.
+
+        Returns:
+            None
+
+        Raises:
+            CommandError
+
+        """
+        try:
+            raw_data = classifier.read_raw_classifier_data()
+            if not is_legacy_classifier_data(raw_data):
+                return
+            classifier_data = EaseAIAlgorithm.binary_classifier_data(decode_classifier_data(raw_data))
+            classifier.upload_classifier_data(classifier_data)
+        except (IOError, ValueError, ClassifierSerializeError, ClassifierUploadError) as ex:
+            msg = u"Could not re-encode the classifier with ID {id}: {ex}".format(id=classifier.id, ex=ex)
+            raise CommandError(msg)
+        self._num_reencoded += 1
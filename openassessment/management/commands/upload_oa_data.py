@@ -1,18 +1,58 @@
 """
 Generate CSV files for submission and assessment data, then upload to S3.
+
+By default, the export is streamed: the CSV data is buffered in memory
+(compressed, and moved to a temporary file if it grows too large),
+then written to a gzipped tar archive that is uploaded to S3
+in parts as it is generated.  We never store the uncompressed CSV files
+or the archive on disk.  (A tar archive records the size of each file before
+its contents, so we can't archive the CSV files until they're complete.)
+Instead of uploading to S3, you can save the archive in a local directory
+(`--output-dir`).
+
+If you provide a checkpoint directory (`--checkpoint-dir`), the CSV files
+are generated there instead, and the command records its progress
+after each chunk of submissions.  If the command is interrupted,
+running it again with the same checkpoint directory resumes the export
+where it left off, instead of starting over.
+
+For nightly exports, you can export only the data created or modified
+since the previous export (`--watermark-file`).  The watermark file records
+the end of the time window exported by the last successful run; the next run
+exports the data from there until (shortly before) the current time.
+The CSV files have the same columns as a full export, so they can be appended
+to the files from earlier exports (see `CsvWriter.write_changes_to_csv()`).
+If the watermark file doesn't exist, the first run exports all the data.
+Only that first run writes the CSV headers, so concatenating the files
+from successive exports (in order) produces files with a single header row.
+
+For large courses, you can split the export into shards (`--workers`).
+Each shard is a contiguous range of the course's workflows, written
+by a separate process, and the CSV files for the shards are then
+concatenated, so the output matches the output of a single process.
 """
+from optparse import make_option
+import csv
+import multiprocessing
 import sys
 import os
 import os.path
 import datetime
+import json
 import shutil
 import tempfile
 import tarfile
+import time
+import zlib
+from cStringIO import StringIO
 import boto
 from boto.s3.key import Key
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import close_connection
+from django.utils.timezone import now, utc
 from openassessment.data import CsvWriter
+from openassessment.workflow.models import AssessmentWorkflow
 
 
 class Command(BaseCommand):
@@ -21,7 +61,32 @@ class Command(BaseCommand):
     """
 
     help = 'Create and upload CSV files for submission and assessment data.'
-    args = '<COURSE_ID> <S3_BUCKET_NAME>'
+    args = '<COURSE_ID> [<S3_BUCKET_NAME>]'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--checkpoint-dir', dest='checkpoint_dir',
+            help=(
+                u"Generate the CSV files in this directory, recording progress "
+                u"so that an interrupted export can be resumed."
+            )
+        ),
+        make_option(
+            '--workers', dest='num_workers', type='int', default=1,
+            help=u"Split the export into shards, written by this many processes in parallel (default 1)"
+        ),
+        make_option(
+            '--output-dir', dest='output_dir',
+            help=u"Save the archive in this directory instead of uploading it to S3"
+        ),
+        make_option(
+            '--watermark-file', dest='watermark_file',
+            help=(
+                u"Export only the data created or modified since the watermark "
+                u"recorded in this file, then record the new watermark."
+            )
+        ),
+    )
 
     OUTPUT_CSV_PATHS = {
         output_name: "{}.csv".format(output_name)
@@ -30,6 +95,29 @@ class Command(BaseCommand):
 
     URL_EXPIRATION_HOURS = 24
     PROGRESS_INTERVAL = 10
+    CHECKPOINT_FILE_NAME = "checkpoint.json"
+
+    # Maximum time to wait for the worker processes to write the shards.
+    # We need a timeout, otherwise the worker pool ignores keyboard interrupts.
+    SHARD_TIMEOUT_SECONDS = 24 * 60 * 60
+
+    # Maximum size (in bytes) of the compressed data for each CSV file
+    # that we keep in memory before moving it to a temporary file.
+    SPOOL_MAX_MEMORY = 1024 * 1024
+
+    # Size (in bytes) of the parts of the archive uploaded to S3.
+    # S3 requires every part except the last to be at least 5 MB.
+    UPLOAD_PART_SIZE = 5 * 1024 * 1024
+
+    # The end of the time window for incremental exports lags behind
+    # the current time, so that we don't miss data from transactions that haven't
+    # been committed yet, or that haven't yet reached the read replica.
+    WATERMARK_DELAY = datetime.timedelta(minutes=5)
+    WATERMARK_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+    # Start of the time window for the first incremental export
+    # (before any data could have been created).
+    INITIAL_WATERMARK = datetime.datetime(1970, 1, 1, tzinfo=utc)
 
     def __init__(self, *args, **kwargs):
         super(Command, self).__init__(*args, **kwargs)
@@ -54,32 +142,192 @@ class Command(BaseCommand):
         Args:
             course_id (unicode): The ID of the course to use.
             s3_bucket_name (unicode): The name of the S3 bucket to upload to.
+                Required unless `output_dir` is provided.
+
+        Keyword Arguments:
+            checkpoint_dir (unicode): If provided, the directory in which to
+                generate the CSV files and record progress.
+            num_workers (int): The number of processes to use to write the CSV files.
+            output_dir (unicode): If provided, save the archive in this directory
+                instead of uploading it to S3.
+            watermark_file (unicode): If provided, export only the data created or modified
+                since the watermark in this file, then record the new watermark.
 
         Raises:
             CommandError
 
         """
-        if len(args) < 2:
+        output_dir = options.get('output_dir')
+        if len(args) < 1 or (len(args) < 2 and output_dir is None):
             raise CommandError(u'Usage: upload_oa_data {}'.format(self.args))
 
-        course_id, s3_bucket = args[0].decode('utf-8'), args[1].decode('utf-8')
-        csv_dir = tempfile.mkdtemp()
+        course_id = args[0].decode('utf-8')
+        s3_bucket = args[1].decode('utf-8') if len(args) > 1 else None
+        checkpoint_dir = options.get('checkpoint_dir')
+        num_workers = options.get('num_workers', 1)
+        if num_workers < 1:
+            raise CommandError(u"The number of workers must be positive")
+        if num_workers > 1 and checkpoint_dir is not None:
+            raise CommandError(u"Exports that use multiple workers cannot be resumed from a checkpoint")
+
+        watermark_file = options.get('watermark_file')
+        window = None
+        if watermark_file is not None:
+            if num_workers > 1 or checkpoint_dir is not None:
+                raise CommandError(
+                    u"Incremental exports cannot use multiple workers or be resumed from a checkpoint"
+                )
+            window = (self._load_watermark(watermark_file, course_id), now() - self.WATERMARK_DELAY)
+
+        # Incremental exports are appended to the first one, which writes the headers
+        write_headers = window is None or window[0] == self.INITIAL_WATERMARK
 
+        archive_name = u"{}.tar.gz".format(
+            datetime.datetime.utcnow().strftime("%Y-%m-%dT%H_%M")
+        )
+
+        # Sharded and resumable exports need the CSV files on disk,
+        # so we generate them in a directory and archive the files.
+        csv_dir = None
+        if checkpoint_dir is not None:
+            csv_dir = checkpoint_dir
+        elif num_workers > 1:
+            csv_dir = tempfile.mkdtemp()
+
+        members = dict()
         try:
             print u"Generating CSV files for course '{}'".format(course_id)
-            self._dump_to_csv(course_id, csv_dir)
-            print u"Creating archive of CSV files in {}".format(csv_dir)
-            archive_path = self._create_archive(csv_dir)
-            print u"Uploading {} to {}/{}".format(archive_path, s3_bucket, course_id)
-            url = self._upload(course_id, archive_path, s3_bucket)
-            print "== Upload successful =="
-            print u"Download URL (expires in {} hours):\n{}".format(self.URL_EXPIRATION_HOURS, url)
+            if window is not None:
+                print u"Exporting the data created or modified from {} until {}".format(*window)
+            if csv_dir is None:
+                members = self._dump_to_spools(course_id, window=window, write_headers=write_headers)
+            else:
+                if num_workers > 1:
+                    self._dump_shards_to_csv(course_id, csv_dir, num_workers)
+                else:
+                    self._dump_to_csv(course_id, csv_dir, resumable=True)
+                members = {
+                    rel_path: open(os.path.join(csv_dir, rel_path), 'rb')
+                    for rel_path in self.OUTPUT_CSV_PATHS.values()
+                }
+
+            if output_dir is not None:
+                archive_path = os.path.join(output_dir, archive_name)
+                print u"Saving archive of CSV files to {}".format(archive_path)
+                self._save_archive(members, archive_path)
+                print "== Export successful =="
+            else:
+                print u"Uploading archive of CSV files to {}/{}".format(s3_bucket, course_id)
+                url = self._upload_archive(course_id, members, archive_name, s3_bucket)
+                print "== Upload successful =="
+                print u"Download URL (expires in {} hours):\n{}".format(self.URL_EXPIRATION_HOURS, url)
+
+            # The export is complete, so the next run should start over
+            if checkpoint_dir is not None:
+                os.remove(os.path.join(checkpoint_dir, self.CHECKPOINT_FILE_NAME))
+
+            # The next incremental export should start where this one ended
+            if window is not None:
+                self._save_watermark(watermark_file, course_id, window[1])
         finally:
-            # Assume that the archive was created in the directory,
-            # so to clean up we just need to delete the directory.
-            shutil.rmtree(csv_dir)
+            for member in members.values():
+                member.close()
+
+            # We keep the checkpoint directory, so we can resume if the export failed.
+            if csv_dir is not None and checkpoint_dir is None:
+                shutil.rmtree(csv_dir)
+
+    def _dump_to_spools(self, course_id, window=None, write_headers=True):
+        """
+        Generate the CSV data for submission/assessment data in compressed buffers.
+
+        Args:
+            course_id (unicode): The ID of the course to dump data from.
+
+        Keyword Arguments:
+            window (tuple): If provided, the `(since, until)` time window;
+                only dump the data created or modified in this window.
+            write_headers (bool): If False, don't write the CSV headers
+                (only supported when dumping a time window).
+
+        Returns:
+            dict mapping CSV file names to `CompressedSpool`s containing the data
+
+        """
+        spools = {
+            name: CompressedSpool(self.SPOOL_MAX_MEMORY)
+            for name in self.OUTPUT_CSV_PATHS
+        }
+        try:
+            csv_writer = CsvWriter(spools, self._progress_callback)
+            if window is None:
+                csv_writer.write_to_csv(course_id)
+            else:
+                csv_writer.write_changes_to_csv(course_id, *window, write_headers=write_headers)
+        except:
+            for spool in spools.values():
+                spool.close()
+            raise
+
+        return {
+            self.OUTPUT_CSV_PATHS[name]: spool
+            for name, spool in spools.iteritems()
+        }
+
+    def _load_watermark(self, watermark_path, course_id):
+        """
+        Load the end of the time window exported by the last incremental export.
+
+        Args:
+            watermark_path (unicode): The path to the watermark file.
+            course_id (unicode): The ID of the course being exported.
+
+        Returns:
+            datetime: The watermark, or `INITIAL_WATERMARK` if the file doesn't exist.
+
+        Raises:
+            CommandError
+
+        """
+        if not os.path.exists(watermark_path):
+            return self.INITIAL_WATERMARK
+
+        with open(watermark_path) as watermark_file:
+            watermark = json.load(watermark_file)
+        if watermark['course_id'] != course_id:
+            raise CommandError(
+                u"The watermark in {path} is for the course '{watermark_course}', not '{course}'".format(
+                    path=watermark_path, watermark_course=watermark['course_id'], course=course_id
+                )
+            )
+        return datetime.datetime.strptime(
+            watermark['watermark'], self.WATERMARK_FORMAT
+        ).replace(tzinfo=utc)
+
+    def _save_watermark(self, watermark_path, course_id, watermark):
+        """
+        Record the end of the time window exported by an incremental export.
+
+        Args:
+            watermark_path (unicode): The path to the watermark file.
+            course_id (unicode): The ID of the course that was exported.
+            watermark (datetime): The end of the time window.
+
+        Returns:
+            None
 
-    def _dump_to_csv(self, course_id, csv_dir):
+        """
+        # Write the watermark to a temporary file, then rename it,
+        # so the watermark file is never left incomplete.
+        temp_path = u"{}.tmp".format(watermark_path)
+        with open(temp_path, 'w') as watermark_file:
+            json.dump({
+                'course_id': course_id,
+                'watermark': watermark.astimezone(utc).strftime(self.WATERMARK_FORMAT),
+            }, watermark_file)
+        os.rename(temp_path, watermark_path)
+
+    def _dump_to_csv(self, course_id, csv_dir, resumable=False):
         """
         Create CSV files for submission/assessment data in a directory.
 
@@ -87,43 +335,222 @@ class Command(BaseCommand):
             course_id (unicode): The ID of the course to dump data from.
             csv_dir (unicode): The absolute path to the directory in which to create CSV files.
 
+        Keyword Arguments:
+            resumable (bool): If True, record progress in a checkpoint file in the directory,
+                and resume from the checkpoint if the file already exists.
+
         Returns:
             None
+
+        Raises:
+            CommandError
+
         """
-        output_streams = {
-            name: open(os.path.join(csv_dir, rel_path), 'w')
-            for name, rel_path in self.OUTPUT_CSV_PATHS.iteritems()
-        }
-        csv_writer = CsvWriter(output_streams, self._progress_callback)
-        csv_writer.write_to_csv(course_id)
+        checkpoint_path = os.path.join(csv_dir, self.CHECKPOINT_FILE_NAME)
+        checkpoint = None
+        if resumable and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            if checkpoint['course_id'] != course_id:
+                raise CommandError(
+                    u"The checkpoint in {dir} is for the course '{checkpoint_course}', not '{course}'".format(
+                        dir=csv_dir, checkpoint_course=checkpoint['course_id'], course=course_id
+                    )
+                )
+
+        if checkpoint is None:
+            output_streams = {
+                name: open(os.path.join(csv_dir, rel_path), 'w')
+                for name, rel_path in self.OUTPUT_CSV_PATHS.iteritems()
+            }
+            cursor = None
+        else:
+            # Discard anything written after the checkpoint,
+            # since we'll write that data again.
+            print u"Resuming after submission {}".format(checkpoint['cursor']['submission_uuid'])
+            output_streams = dict()
+            for name, rel_path in self.OUTPUT_CSV_PATHS.iteritems():
+                output_streams[name] = open(os.path.join(csv_dir, rel_path), 'r+b')
+                output_streams[name].truncate(checkpoint['offsets'][name])
+                output_streams[name].seek(0, os.SEEK_END)
+            cursor = checkpoint['cursor']
+
+        def _save_checkpoint(cursor):
+            """
+            Record the cursor and the size of each CSV file
+            once the data for the cursor has been written to disk.
+            """
+            offsets = dict()
+            for name, output_stream in output_streams.iteritems():
+                output_stream.flush()
+                os.fsync(output_stream.fileno())
+                offsets[name] = output_stream.tell()
+
+            # Write the checkpoint to a temporary file, then rename it,
+            # so the checkpoint file is never left incomplete.
+            temp_path = u"{}.tmp".format(checkpoint_path)
+            with open(temp_path, 'w') as checkpoint_file:
+                json.dump({'course_id': course_id, 'cursor': cursor, 'offsets': offsets}, checkpoint_file)
+            os.rename(temp_path, checkpoint_path)
+
+        try:
+            csv_writer = CsvWriter(
+                output_streams, self._progress_callback,
+                checkpoint_callback=(_save_checkpoint if resumable else None)
+            )
+            csv_writer.write_to_csv(course_id, cursor=cursor)
+        except AssessmentWorkflow.DoesNotExist:
+            raise CommandError(
+                u"Could not find the submission in the checkpoint {}".format(checkpoint_path)
+            )
+        finally:
+            for output_stream in output_streams.values():
+                output_stream.close()
+
+    def _dump_shards_to_csv(self, course_id, csv_dir, num_workers):
+        """
+        Create CSV files for submission/assessment data in a directory,
+        writing shards of the course in parallel.
+
+        Each worker process writes its shard to a separate temporary directory
+        (using its own connection to the read replica).  We then concatenate
+        the CSV files for the shards in order.  Since the shards can use
+        the same feedback options, we remove the duplicate feedback options.
+
+        Args:
+            course_id (unicode): The ID of the course to dump data from.
+            csv_dir (unicode): The absolute path to the directory in which to create CSV files.
+            num_workers (int): The maximum number of worker processes.
 
-    def _create_archive(self, dir_path):
+        Returns:
+            None
+
+        Raises:
+            CommandError
+
+        """
+        shards = CsvWriter({}).submission_uuid_shards(course_id, num_workers)
+        shard_dirs = [tempfile.mkdtemp() for _ in shards]
+        jobs = [
+            (course_id, shard_dir, after_submission_uuid, last_submission_uuid)
+            for shard_dir, (after_submission_uuid, last_submission_uuid) in zip(shard_dirs, shards)
+        ]
+
+        try:
+            print u"Writing {} shards in parallel".format(len(jobs))
+
+            # The worker processes inherit our database connections when they're forked,
+            # so close them first; otherwise, the processes would share the connections.
+            close_connection()
+            pool = multiprocessing.Pool(processes=len(jobs))
+            try:
+                pool.map_async(_dump_shard_job, jobs).get(self.SHARD_TIMEOUT_SECONDS)
+                pool.close()
+            except Exception as ex:
+                pool.terminate()
+                raise CommandError(u"An error occurred while writing the shards: {}".format(ex))
+            finally:
+                pool.join()
+
+            self._merge_shards(shard_dirs, csv_dir)
+        finally:
+            for shard_dir in shard_dirs:
+                shutil.rmtree(shard_dir)
+
+    def _merge_shards(self, shard_dirs, csv_dir):
         """
-        Create an archive of a directory.
+        Concatenate the CSV files written for each shard.
+
+        Only the first shard contains the header rows.  Each shard
+        contains the feedback options used by that shard, so we write
+        each feedback option once, in order of ID (like `CsvWriter`).
 
         Args:
-            dir_path (unicode): The absolute path to the directory containing the CSV files.
+            shard_dirs (list of unicode): The directories containing the CSV files for each shard, in order.
+            csv_dir (unicode): The absolute path to the directory in which to create CSV files.
 
         Returns:
-            unicode: Absolute path to the archive.
+            None
 
         """
-        tarball_name = u"{}.tar.gz".format(
-            datetime.datetime.utcnow().strftime("%Y-%m-%dT%H_%M")
-        )
-        tarball_path = os.path.join(dir_path, tarball_name)
-        with tarfile.open(tarball_path, "w:gz") as tar:
-            for rel_path in self.OUTPUT_CSV_PATHS.values():
-                tar.add(os.path.join(dir_path, rel_path), arcname=rel_path)
-        return tarball_path
+        for name, rel_path in self.OUTPUT_CSV_PATHS.iteritems():
+            with open(os.path.join(csv_dir, rel_path), 'w') as output_file:
+                if name == 'assessment_feedback_option':
+                    rows_by_id = dict()
+                    for shard_num, shard_dir in enumerate(shard_dirs):
+                        with open(os.path.join(shard_dir, rel_path)) as shard_file:
+                            reader = csv.reader(shard_file)
+                            if shard_num == 0:
+                                reader.next()
+                            for row in reader:
+                                rows_by_id.setdefault(row[0], row)
+
+                    writer = csv.writer(output_file)
+                    writer.writerow(CsvWriter.HEADERS[name])
+                    for option_id in sorted(rows_by_id, key=int):
+                        writer.writerow(rows_by_id[option_id])
+                else:
+                    for shard_dir in shard_dirs:
+                        with open(os.path.join(shard_dir, rel_path), 'rb') as shard_file:
+                            shutil.copyfileobj(shard_file, output_file)
 
-    def _upload(self, course_id, file_path, s3_bucket):
+    def _write_archive(self, members, output_stream):
         """
-        Upload a file.
+        Write a gzipped tar archive of CSV files to a stream.
+
+        The archive is written in tarfile's streaming mode,
+        so the output stream only needs to support `write()`.
+
+        Args:
+            members (dict): Maps the names of the files in the archive
+                to `CompressedSpool`s or files (opened for reading) containing the data.
+            output_stream (file-like object): The stream to write the archive to.
+
+        Returns:
+            None
+
+        """
+        with tarfile.open(fileobj=output_stream, mode="w|gz") as tar:
+            for rel_path in sorted(members):
+                member = members[rel_path]
+                tar_info = tarfile.TarInfo(rel_path)
+                tar_info.mtime = time.time()
+                if isinstance(member, CompressedSpool):
+                    tar_info.size = member.size
+                    tar.addfile(tar_info, member.reader())
+                else:
+                    tar_info.size = os.fstat(member.fileno()).st_size
+                    tar.addfile(tar_info, member)
+
+    def _save_archive(self, members, archive_path):
+        """
+        Save an archive of CSV files to the local filesystem.
+
+        Args:
+            members (dict): Maps the names of the files in the archive to their data
+                (see `_write_archive()`).
+            archive_path (unicode): The path of the archive to create.
+
+        Returns:
+            None
+
+        """
+        with open(archive_path, 'wb') as archive_file:
+            self._write_archive(members, archive_file)
+
+        # Store the path in the history
+        self._history.append({'key': archive_path, 'url': u"file://{}".format(os.path.abspath(archive_path))})
+
+    def _upload_archive(self, course_id, members, archive_name, s3_bucket):
+        """
+        Upload an archive of CSV files, using a multipart upload
+        so we can send the archive as we generate it.
 
         Args:
             course_id (unicode): The ID of the course.
-            file_path (unicode): Absolute path to the file to upload.
+            members (dict): Maps the names of the files in the archive to their data
+                (see `_write_archive()`).
+            archive_name (unicode): The name of the archive.
             s3_bucket (unicode): Name of the S3 bucket where the file will be uploaded.
 
         Returns:
@@ -141,9 +568,17 @@ class Command(BaseCommand):
         )
 
         bucket = conn.get_bucket(s3_bucket)
-        key_name = os.path.join(course_id, os.path.split(file_path)[1])
+        key_name = os.path.join(course_id, archive_name)
+        upload_stream = S3MultipartStream(bucket, key_name, self.UPLOAD_PART_SIZE)
+        try:
+            self._write_archive(members, upload_stream)
+            upload_stream.complete()
+        except:
+            # Don't leave the parts we uploaded in the bucket
+            upload_stream.cancel()
+            raise
+
         key = Key(bucket=bucket, name=key_name)
-        key.set_contents_from_filename(file_path)
         url = key.generate_url(self.URL_EXPIRATION_HOURS * 3600)
 
         # Store the key and url in the history
@@ -159,3 +594,191 @@ class Command(BaseCommand):
         if self._submission_counter > 0 and self._submission_counter % self.PROGRESS_INTERVAL == 0:
             sys.stdout.write('.')
             sys.stdout.flush()
+
+
+class CompressedSpool(object):
+    """
+    Write-once buffer for CSV data, compressed using zlib.
+
+    The compressed data is kept in memory until it exceeds a maximum size,
+    then moved to a temporary file.  Once we've finished writing,
+    `reader()` returns a file-like object that decompresses the data
+    as it is read, so we never hold the uncompressed data in memory.
+    """
+
+    def __init__(self, max_memory):
+        """
+        Create an empty buffer.
+
+        Args:
+            max_memory (int): The maximum size (in bytes) of the compressed data
+                to keep in memory.
+
+        """
+        self._compressed = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self._compressor = zlib.compressobj()
+        self.size = 0
+
+    def write(self, data):
+        """
+        Compress data and add it to the buffer.
+
+        Args:
+            data (str): The data to write.
+
+        Returns:
+            None
+
+        """
+        self.size += len(data)
+        self._compressed.write(self._compressor.compress(data))
+
+    def reader(self):
+        """
+        Finish writing, and read the data from the beginning.
+        This should be called only once.
+
+        Returns:
+            file-like object that supports `read()`
+
+        """
+        self._compressed.write(self._compressor.flush())
+        self._compressed.seek(0)
+        return _DecompressingReader(self._compressed)
+
+    def close(self):
+        """
+        Discard the buffered data.
+        """
+        self._compressed.close()
+
+
+class _DecompressingReader(object):
+    """
+    Read zlib-compressed data from a file, decompressing it a little at a time.
+    """
+
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, compressed_file):
+        self._compressed_file = compressed_file
+        self._decompressor = zlib.decompressobj()
+        self._buffer = ""
+
+    def read(self, size):
+        """
+        Read up to `size` bytes of decompressed data.
+        Fewer bytes are returned only at the end of the data.
+
+        Args:
+            size (int): The number of bytes to read.
+
+        Returns:
+            str
+
+        """
+        while len(self._buffer) < size:
+            # Limit the size of the decompressed data, so we don't expand
+            # highly-compressed data all at once.
+            compressed = self._decompressor.unconsumed_tail or self._compressed_file.read(self.READ_SIZE)
+            if not compressed:
+                self._buffer += self._decompressor.flush()
+                break
+            self._buffer += self._decompressor.decompress(compressed, size - len(self._buffer))
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class S3MultipartStream(object):
+    """
+    Write-only stream that uploads data to an S3 key in parts,
+    so we can upload data without knowing its size in advance
+    or storing all of it.
+    """
+
+    def __init__(self, bucket, key_name, part_size):
+        """
+        Start a multipart upload.
+
+        Args:
+            bucket (boto.s3.bucket.Bucket): The bucket to upload to.
+            key_name (unicode): The name of the key to upload.
+            part_size (int): The number of bytes to buffer before uploading a part.
+
+        """
+        self._upload = bucket.initiate_multipart_upload(key_name)
+        self._part_size = part_size
+        self._buffer = StringIO()
+        self._num_parts = 0
+
+    def write(self, data):
+        """
+        Buffer data, uploading a part once we've buffered enough.
+
+        Args:
+            data (str): The data to write.
+
+        Returns:
+            None
+
+        """
+        self._buffer.write(data)
+        if self._buffer.tell() >= self._part_size:
+            self._upload_part()
+
+    def complete(self):
+        """
+        Upload the remaining data and complete the upload.
+        """
+        if self._buffer.tell() > 0 or self._num_parts == 0:
+            self._upload_part()
+        self._upload.complete_upload()
+
+    def cancel(self):
+        """
+        Cancel the upload, deleting the parts we've uploaded.
+        """
+        self._upload.cancel_upload()
+
+    def _upload_part(self):
+        """
+        Upload the buffered data as the next part.
+        """
+        self._num_parts += 1
+        self._buffer.seek(0)
+        self._upload.upload_part_from_file(self._buffer, self._num_parts)
+        self._buffer = StringIO()
+
+
+def _dump_shard_job(job):
+    """
+    Write one shard of a course's data to CSV files in a worker process.
+
+    Args:
+        job (tuple): The course ID, the directory in which to create the CSV files,
+            and the submission UUIDs bounding the shard (see `CsvWriter.submission_uuid_shards()`).
+
+    Returns:
+        None
+
+    """
+    course_id, shard_dir, after_submission_uuid, last_submission_uuid = job
+
+    # Only the first shard writes the headers
+    cursor = None
+    if after_submission_uuid is not None:
+        cursor = {'submission_uuid': after_submission_uuid, 'feedback_option_ids': []}
+
+    output_streams = {
+        name: open(os.path.join(shard_dir, rel_path), 'w')
+        for name, rel_path in Command.OUTPUT_CSV_PATHS.iteritems()
+    }
+    try:
+        CsvWriter(output_streams).write_to_csv(
+            course_id, cursor=cursor, last_submission_uuid=last_submission_uuid
+        )
+    finally:
+        for output_stream in output_streams.values():
+            output_stream.close()
+        close_connection()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the management command that backfills the peer queue counters.
+"""
+from openassessment.test_utils import CacheResetTest
+from openassessment.assessment.api import peer as peer_api
+from openassessment.assessment.models import PeerWorkflow
+from openassessment.management.commands import backfill_peer_workflow_counters
+from submissions import api as sub_api
+
+
+class BackfillPeerWorkflowCountersTest(CacheResetTest):
+    """
+    Test the backfill of the denormalized peer workflow counters.
+    """
+
+    COURSE_ID = u"test_course"
+    ITEM_ID = u"test_item"
+
+    RUBRIC = {
+        'criteria': [
+            {
+                "name": u"vocabulary",
+                "prompt": u"Vocabulary",
+                "options": [
+                    {"name": u"poor", "points": 0, "explanation": u""},
+                    {"name": u"good", "points": 1, "explanation": u""},
+                ]
+            },
+        ]
+    }
+
+    def test_backfill(self):
+        # Three students submit; two of them assess Alice,
+        # and a third lease on Alice's submission stays open.
+        alice_sub = self._create_submission(u"alice")
+        bob_sub = self._create_submission(u"bob")
+        carol_sub = self._create_submission(u"carol")
+        dave_sub = self._create_submission(u"dave")
+
+        for scorer_sub, scorer_id in [(bob_sub, u"bob"), (carol_sub, u"carol")]:
+            peer_api.create_peer_workflow_item(scorer_sub['uuid'], alice_sub['uuid'])
+            peer_api.create_assessment(
+                scorer_sub['uuid'], scorer_id,
+                {u"vocabulary": u"good"}, {}, u"", self.RUBRIC, 3
+            )
+        peer_api.create_peer_workflow_item(dave_sub['uuid'], alice_sub['uuid'])
+
+        expected = PeerWorkflow.objects.get(submission_uuid=alice_sub['uuid'])
+        self.assertEqual(expected.assessed_count, 2)
+        self.assertEqual(expected.open_count, 1)
+        self.assertIsNotNone(expected.last_leased_at)
+
+        # Simulate workflows created before the counters existed
+        PeerWorkflow.objects.update(assessed_count=0, open_count=0, last_leased_at=None)
+
+        cmd = backfill_peer_workflow_counters.Command()
+        cmd.handle(self.COURSE_ID.encode('utf-8'), self.ITEM_ID.encode('utf-8'))
+        self.assertEqual(cmd.num_updated, 4)
+
+        workflow = PeerWorkflow.objects.get(submission_uuid=alice_sub['uuid'])
+        self.assertEqual(workflow.assessed_count, expected.assessed_count)
+        self.assertEqual(workflow.open_count, expected.open_count)
+        self.assertEqual(workflow.last_leased_at, expected.last_leased_at)
+
+        for sub in [bob_sub, carol_sub, dave_sub]:
+            workflow = PeerWorkflow.objects.get(submission_uuid=sub['uuid'])
+            self.assertEqual(workflow.assessed_count, 0)
+            self.assertEqual(workflow.open_count, 0)
+            self.assertIs(workflow.last_leased_at, None)
+
+    def test_backfill_other_course(self):
+        self._create_submission(u"alice")
+        cmd = backfill_peer_workflow_counters.Command()
+        cmd.handle("other_course")
+        self.assertEqual(cmd.num_updated, 0)
+
+    def _create_submission(self, student_id):
+        """
+        Create a submission and peer workflow for a student.
+        """
+        student_item = {
+            'student_id': student_id,
+            'course_id': self.COURSE_ID,
+            'item_id': self.ITEM_ID,
+            'item_type': 'openassessment',
+        }
+        submission = sub_api.create_submission(student_item, u"test answer")
+        peer_api.on_start(submission['uuid'])
+        return submission
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the AI grading benchmark management command.
+"""
+import json
+import os.path
+import shutil
+import tempfile
+from django.core.management.base import CommandError
+from django.test.utils import override_settings
+from openassessment.test_utils import CacheResetTest
+from openassessment.management.commands import benchmark_ai_grading
+from openassessment.assessment.models import AIGradingWorkflow
+
+
+class BenchmarkAIGradingTest(CacheResetTest):
+    """
+    Tests for the AI grading benchmark management command.
+    """
+
+    NUM_ESSAYS = 5
+    NUM_CRITERIA = 2
+
+    AI_ALGORITHMS = {
+        "fake": "openassessment.assessment.worker.algorithm.FakeAIAlgorithm"
+    }
+
+    def setUp(self):
+        super(BenchmarkAIGradingTest, self).setUp()
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    @override_settings(ORA2_AI_ALGORITHMS=AI_ALGORITHMS)
+    def test_benchmark(self):
+        output_path = os.path.join(self.output_dir, "results.json")
+        cmd = benchmark_ai_grading.Command()
+        cmd.handle("fake", self.NUM_ESSAYS, self.NUM_CRITERIA, output=output_path, num_examples=6)
+
+        # Every essay should have been graded
+        self.assertEqual(
+            AIGradingWorkflow.objects.filter(completed_at__isnull=False).count(),
+            self.NUM_ESSAYS
+        )
+
+        # The results should be written to the output file
+        with open(output_path) as output_file:
+            results = json.load(output_file)
+        self.assertEqual(results, cmd.results)
+
+        self.assertEqual(results['algorithm_id'], u"fake")
+        self.assertEqual(results['num_essays'], self.NUM_ESSAYS)
+        self.assertEqual(results['num_criteria'], self.NUM_CRITERIA)
+        self.assertGreater(results['training']['queries'], 0)
+        self.assertGreater(results['grading']['queries_per_task_max'], 0)
+        self.assertLessEqual(results['grading']['latency_p50'], results['grading']['latency_p99'])
+        self.assertGreater(results['peak_rss_kb'], 0)
+
+    def test_unknown_algorithm(self):
+        cmd = benchmark_ai_grading.Command()
+        with self.assertRaises(CommandError):
+            cmd.handle("no such algorithm", self.NUM_ESSAYS, self.NUM_CRITERIA)
+
+    def test_invalid_args(self):
+        cmd = benchmark_ai_grading.Command()
+        with self.assertRaises(CommandError):
+            cmd.handle("fake", "not a number", self.NUM_CRITERIA)
+        with self.assertRaises(CommandError):
+            cmd.handle("fake", self.NUM_ESSAYS)
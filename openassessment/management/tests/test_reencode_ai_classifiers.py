@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the management command that re-encodes stored AI classifiers.
+"""
+import base64
+import json
+import pickle
+from django.core.files.base import ContentFile
+from openassessment.test_utils import CacheResetTest
+from openassessment.assessment.models import AIClassifier, AIClassifierSet, is_legacy_classifier_data
+from openassessment.assessment.serializers import rubric_from_dict
+from openassessment.assessment.test.constants import RUBRIC
+from openassessment.assessment.worker.algorithm import PICKLE_PROTOCOL
+from openassessment.management.commands import reencode_ai_classifiers
+
+
+class ReencodeAIClassifiersTest(CacheResetTest):
+    """
+    Test the re-encoding of classifiers stored in the older JSON format.
+    """
+
+    CLASSIFIERS = {
+        u"vøȼȺƀᵾłȺɍɏ": {u"scores": [0, 1, 2]},
+        u"ﻭɼค๓๓คɼ": {u"scores": [0, 2]},
+    }
+
+    def setUp(self):
+        super(ReencodeAIClassifiersTest, self).setUp()
+        classifier_set = AIClassifierSet.create_classifier_set(
+            self.CLASSIFIERS, rubric_from_dict(RUBRIC), u"test_algorithm", u"test_course", u"test_item"
+        )
+
+        # Store one of the classifiers in the older JSON format
+        self.legacy_classifier = classifier_set.classifiers.get(criterion__name=u"vøȼȺƀᵾłȺɍɏ")
+        self.legacy_classifier.classifier_data.save(
+            u"legacy", ContentFile(json.dumps(self.CLASSIFIERS[u"vøȼȺƀᵾłȺɍɏ"]))
+        )
+
+    def test_reencode(self):
+        cmd = reencode_ai_classifiers.Command()
+        cmd.handle()
+
+        # Only the legacy classifier needs to be re-encoded
+        self.assertEqual(cmd.num_reencoded, 1)
+        for classifier in AIClassifier.objects.all():
+            self.assertFalse(is_legacy_classifier_data(classifier.read_raw_classifier_data()))
+            self.assertEqual(
+                classifier.download_classifier_data(),
+                self.CLASSIFIERS[classifier.criterion.name]
+            )
+
+        # Running the command again should have no effect
+        cmd = reencode_ai_classifiers.Command()
+        cmd.handle()
+        self.assertEqual(cmd.num_reencoded, 0)
+
+    def test_reencode_other_course(self):
+        cmd = reencode_ai_classifiers.Command()
+        cmd.handle(u"other_course")
+        self.assertEqual(cmd.num_reencoded, 0)
+
+        legacy_classifier = AIClassifier.objects.get(pk=self.legacy_classifier.pk)
+        self.assertTrue(is_legacy_classifier_data(legacy_classifier.read_raw_classifier_data()))
+
+    def test_reencode_ease_classifier(self):
+        # EASE classifiers in the older format have base64-encoded pickles
+        feature_extractor = pickle.dumps({u"ƒɇȺŧᵾɍɇs": [1, 2, 3]}, PICKLE_PROTOCOL)
+        score_classifier = pickle.dumps([0.5, 0.25], PICKLE_PROTOCOL)
+        self.legacy_classifier.classifier_data.save(
+            u"legacy_ease", ContentFile(json.dumps({
+                u"feature_extractor": base64.b64encode(feature_extractor),
+                u"score_classifier": base64.b64encode(score_classifier),
+            }))
+        )
+
+        cmd = reencode_ai_classifiers.Command()
+        cmd.handle()
+        self.assertEqual(cmd.num_reencoded, 1)
+
+        # The re-encoded classifier stores the pickled bytes, not base64
+        classifier = AIClassifier.objects.get(pk=self.legacy_classifier.pk)
+        self.assertEqual(classifier.download_classifier_data(), {
+            u"feature_extractor": feature_extractor,
+            u"score_classifier": score_classifier,
+        })
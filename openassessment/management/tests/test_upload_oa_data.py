@@ -3,10 +3,18 @@
 Tests for management command that uploads submission/assessment data.
 """
 from StringIO import StringIO
+import csv
+import datetime
+import os.path
+import shutil
 import tarfile
+import tempfile
 import boto
+import mock
 import moto
-from openassessment.test_utils import CacheResetTest
+from openassessment.test_utils import CacheResetTest, TransactionCacheResetTest
+from openassessment.data import CsvWriter
+from openassessment.assessment.models import AssessmentFeedback
 from openassessment.management.commands import upload_oa_data
 from openassessment.workflow import api as workflow_api
 from submissions import api as sub_api
@@ -70,3 +78,275 @@ class UploadDataTest(CacheResetTest):
         # Expect that we generated a URL for the bucket
         url = cmd.history[0]['url']
         self.assertIn("https://{}".format(self.BUCKET_NAME), url)
+
+
+class UploadDataResumeTest(TransactionCacheResetTest):
+    """
+    Test resuming an interrupted export from a checkpoint.
+    We use a transaction test case so the data is visible
+    to the read replica used by the CSV writer.
+    """
+
+    COURSE_ID = u"TɘꙅT ↄoUᴙꙅɘ"
+
+    @mock.patch.object(CsvWriter, 'QUERY_INTERVAL', 2)
+    def test_resume_from_checkpoint(self):
+        checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, checkpoint_dir)
+
+        submission_uuids = []
+        for index in range(5):
+            student_item = {
+                'student_id': "test_user_{}".format(index),
+                'course_id': self.COURSE_ID,
+                'item_id': 'test_item',
+                'item_type': 'openassessment',
+            }
+            submission = sub_api.create_submission(student_item, "test submission {}".format(index))
+            workflow_api.create_workflow(submission['uuid'], ['peer', 'self'])
+            submission_uuids.append(submission['uuid'])
+
+        # Simulate an interruption while writing the third chunk of submissions,
+        # after some of its data has been written.
+        write_chunk = CsvWriter._write_chunk_to_csv
+
+        def _interrupted_write_chunk(writer, chunk_uuids, *args):
+            """Write a chunk, but fail partway through the third one."""
+            if chunk_uuids[0] == submission_uuids[4]:
+                writer._write_unicode('submission', [u"partial row"])
+                raise KeyboardInterrupt
+            return write_chunk(writer, chunk_uuids, *args)
+
+        cmd = upload_oa_data.Command()
+        with mock.patch.object(CsvWriter, '_write_chunk_to_csv', _interrupted_write_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                cmd._dump_to_csv(self.COURSE_ID, checkpoint_dir, resumable=True)
+
+        # Resume the export
+        cmd = upload_oa_data.Command()
+        cmd._dump_to_csv(self.COURSE_ID, checkpoint_dir, resumable=True)
+
+        # Every submission should be written exactly once, without the partial row
+        with open(os.path.join(checkpoint_dir, "submission.csv")) as submission_csv:
+            rows = list(csv.reader(submission_csv))
+        self.assertEqual([row[0] for row in rows[1:]], submission_uuids)
+
+
+
+class UploadDataShardsTest(TransactionCacheResetTest):
+    """
+    Test writing the CSV files using multiple worker processes.
+    We use a transaction test case so the data is visible
+    to the read replica used by the worker processes.
+    """
+
+    COURSE_ID = u"TɘꙅT ↄoUᴙꙅɘ"
+
+    @mock.patch.object(CsvWriter, 'QUERY_INTERVAL', 2)
+    def test_shards_match_single_process(self):
+        for index in range(7):
+            student_item = {
+                'student_id': "test_user_{}".format(index),
+                'course_id': self.COURSE_ID,
+                'item_id': 'test_item',
+                'item_type': 'openassessment',
+            }
+            submission = sub_api.create_submission(student_item, "test submission {}".format(index))
+            workflow_api.create_workflow(submission['uuid'], ['peer', 'self'])
+            sub_api.set_score(submission['uuid'], index, 10)
+
+            # Every shard uses the same feedback option
+            feedback = AssessmentFeedback.objects.create(
+                submission_uuid=submission['uuid'], feedback_text=u"feedback {}".format(index)
+            )
+            feedback.add_options([u"ﻭɼค๓๓คɼ", u"option {}".format(index % 2)])
+
+        single_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, single_dir)
+        upload_oa_data.Command()._dump_to_csv(self.COURSE_ID, single_dir)
+
+        sharded_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, sharded_dir)
+        upload_oa_data.Command()._dump_shards_to_csv(self.COURSE_ID, sharded_dir, 3)
+
+        for rel_path in upload_oa_data.Command.OUTPUT_CSV_PATHS.values():
+            with open(os.path.join(single_dir, rel_path)) as single_file:
+                with open(os.path.join(sharded_dir, rel_path)) as sharded_file:
+                    self.assertEqual(sharded_file.read(), single_file.read(), msg=rel_path)
+
+        # Each feedback option should be written once
+        with open(os.path.join(sharded_dir, "assessment_feedback_option.csv")) as option_file:
+            self.assertEqual(len(list(csv.reader(option_file))), 4)
+
+    def test_workers_with_checkpoint(self):
+        cmd = upload_oa_data.Command()
+        with self.assertRaises(upload_oa_data.CommandError):
+            cmd.handle(self.COURSE_ID.encode('utf-8'), "bucket", num_workers=2, checkpoint_dir="/tmp")
+
+
+class UploadDataStreamTest(TransactionCacheResetTest):
+    """
+    Test streaming the archive of CSV files to the local filesystem and S3.
+    We use a transaction test case so the data is visible
+    to the read replica used by the CSV writer.
+    """
+
+    COURSE_ID = u"TɘꙅT ↄoUᴙꙅɘ"
+
+    def setUp(self):
+        super(UploadDataStreamTest, self).setUp()
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    @mock.patch.object(upload_oa_data.Command, 'SPOOL_MAX_MEMORY', 16)
+    def test_save_to_output_dir(self):
+        self._create_submissions(5)
+
+        # No S3 bucket is needed when saving the archive locally
+        cmd = upload_oa_data.Command()
+        cmd.handle(self.COURSE_ID.encode('utf-8'), output_dir=self.output_dir)
+        self.assertEqual(len(cmd.history), 1)
+        archive_path = cmd.history[0]['key']
+        self.assertEqual(os.listdir(self.output_dir), [os.path.basename(archive_path)])
+
+        # The archive should contain the same data as the CSV writer generates
+        output_streams = {name: StringIO() for name in CsvWriter.MODELS}
+        CsvWriter(output_streams).write_to_csv(self.COURSE_ID)
+        with tarfile.open(archive_path, mode="r:gz") as tar:
+            for name, output_stream in output_streams.iteritems():
+                csv_file = tar.extractfile("{}.csv".format(name))
+                self.assertEqual(csv_file.read(), output_stream.getvalue())
+
+    @mock.patch.object(upload_oa_data.Command, 'WATERMARK_DELAY', datetime.timedelta(0))
+    def test_incremental_export(self):
+        watermark_path = os.path.join(self.output_dir, "watermark.json")
+        first_uuids = self._create_submissions(2)
+
+        # Without a watermark, the first export includes all the data, with headers
+        first_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, first_dir)
+        cmd = upload_oa_data.Command()
+        cmd.handle(self.COURSE_ID.encode('utf-8'), output_dir=first_dir, watermark_file=watermark_path)
+        self.assertEqual(self._submission_csv_column_in_archive(cmd.history[0]['key']), ['uuid'] + first_uuids)
+
+        # The next export includes only the new data, without headers,
+        # so it can be appended to the first export
+        second_uuids = self._create_submissions(1)
+        second_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, second_dir)
+        cmd = upload_oa_data.Command()
+        cmd.handle(self.COURSE_ID.encode('utf-8'), output_dir=second_dir, watermark_file=watermark_path)
+        self.assertEqual(self._submission_csv_column_in_archive(cmd.history[0]['key']), second_uuids)
+
+        # The watermark is specific to the course
+        with self.assertRaises(upload_oa_data.CommandError):
+            upload_oa_data.Command().handle("other_course", output_dir=second_dir, watermark_file=watermark_path)
+
+    def test_write_archive_to_memory(self):
+        spool = upload_oa_data.CompressedSpool(1024)
+        spool.write("id,text\r\n")
+        members = {
+            "spooled.csv": spool,
+            "empty.csv": upload_oa_data.CompressedSpool(1024),
+        }
+        archive = StringIO()
+        upload_oa_data.Command()._write_archive(members, archive)
+
+        archive.seek(0)
+        with tarfile.open(fileobj=archive, mode="r:gz") as tar:
+            self.assertEqual(tar.getnames(), ["empty.csv", "spooled.csv"])
+            self.assertEqual(tar.extractfile("spooled.csv").read(), "id,text\r\n")
+            self.assertEqual(tar.extractfile("empty.csv").read(), "")
+
+    def test_compressed_spool(self):
+        data = "".join("row {},ẗëṡẗ\r\n".format(num) for num in range(10000))
+
+        # Use a small memory limit, so the spool moves to a temporary file
+        spool = upload_oa_data.CompressedSpool(128)
+        self.addCleanup(spool.close)
+        for start in range(0, len(data), 1000):
+            spool.write(data[start:start + 1000])
+        self.assertEqual(spool.size, len(data))
+
+        reader = spool.reader()
+        chunks = []
+        while True:
+            chunk = reader.read(777)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        self.assertEqual("".join(chunks), data)
+
+        # Every read except the last should return the number of bytes requested
+        self.assertTrue(all(len(chunk) == 777 for chunk in chunks[:-1]))
+
+    def test_multipart_stream(self):
+        bucket = mock.MagicMock()
+        uploaded_parts = []
+
+        def _upload_part(part_file, part_num):
+            """Record the contents of each part."""
+            uploaded_parts.append((part_num, part_file.read()))
+        bucket.initiate_multipart_upload.return_value.upload_part_from_file.side_effect = _upload_part
+
+        stream = upload_oa_data.S3MultipartStream(bucket, u"test_key", 10)
+        stream.write("a" * 6)
+        stream.write("b" * 6)
+        stream.write("c" * 3)
+        stream.complete()
+
+        bucket.initiate_multipart_upload.assert_called_once_with(u"test_key")
+        self.assertEqual(uploaded_parts, [(1, "aaaaaabbbbbb"), (2, "ccc")])
+        bucket.initiate_multipart_upload.return_value.complete_upload.assert_called_once_with()
+
+    @mock.patch('openassessment.management.commands.upload_oa_data.boto')
+    def test_upload_cancelled_on_error(self, mock_boto):
+        mock_upload = mock_boto.connect_s3.return_value.get_bucket.return_value.initiate_multipart_upload.return_value
+        cmd = upload_oa_data.Command()
+        with mock.patch.object(cmd, '_write_archive') as mock_write_archive:
+            mock_write_archive.side_effect = IOError
+            with self.assertRaises(IOError):
+                cmd.handle(self.COURSE_ID.encode('utf-8'), "test_bucket")
+
+        mock_upload.cancel_upload.assert_called_once_with()
+        self.assertFalse(mock_upload.complete_upload.called)
+
+    def _create_submissions(self, num_submissions):
+        """
+        Create submissions and workflows in the test course.
+
+        Args:
+            num_submissions (int): The number of submissions to create.
+
+        Returns:
+            list of submission UUIDs, in the order created
+
+        """
+        submission_uuids = []
+        for index in range(num_submissions):
+            student_item = {
+                'student_id': "test_user_{}".format(index),
+                'course_id': self.COURSE_ID,
+                'item_id': 'test_item',
+                'item_type': 'openassessment',
+            }
+            submission = sub_api.create_submission(student_item, "test submission {}".format(index))
+            workflow_api.create_workflow(submission['uuid'], ['peer', 'self'])
+            submission_uuids.append(submission['uuid'])
+        return submission_uuids
+
+    def _submission_csv_column_in_archive(self, archive_path):
+        """
+        Parse the first column (the submission UUIDs, and the header if written)
+        from the submission CSV in an archive.
+
+        Args:
+            archive_path (unicode): The path to the archive.
+
+        Returns:
+            list of the values in the first column, in the order written
+
+        """
+        with tarfile.open(archive_path, mode="r:gz") as tar:
+            rows = list(csv.reader(tar.extractfile("submission.csv")))
+        return [row[0] for row in rows]
@@ -6,6 +6,8 @@ from django.test import TestCase, TransactionTestCase
 from openassessment.assessment.models.ai import (
     CLASSIFIERS_CACHE_IN_MEM, CLASSIFIERS_CACHE_IN_FILE
 )
+from openassessment.assessment.worker.classifier_cache import LOADED_CLASSIFIERS
+from openassessment.assessment.worker import essay_score_cache
 
 
 def _clear_all_caches():
@@ -13,6 +15,8 @@ def _clear_all_caches():
     cache.clear()
     CLASSIFIERS_CACHE_IN_MEM.clear()
     CLASSIFIERS_CACHE_IN_FILE.clear()
+    LOADED_CLASSIFIERS.clear()
+    essay_score_cache._cache().clear()  # pylint:disable=W0212
 
 
 class CacheResetTest(TestCase):
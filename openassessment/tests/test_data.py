@@ -6,11 +6,19 @@ Tests for openassessment data aggregation.
 import os.path
 from StringIO import StringIO
 import csv
+import json
+from datetime import timedelta
 from django.core.management import call_command
+from django.utils.timezone import now
 import ddt
+import mock
 from submissions import api as sub_api
+from submissions.models import Submission, Score
+from openassessment.assessment.api import peer as peer_api
+from openassessment.assessment.models import AssessmentFeedback, AssessmentFeedbackOption
 from openassessment.test_utils import TransactionCacheResetTest
 from openassessment.workflow import api as workflow_api
+from openassessment.workflow.models import AssessmentWorkflow
 from openassessment.data import CsvWriter
 
 
@@ -116,6 +124,271 @@ class CsvWriterTest(TransactionCacheResetTest):
             rows = content.split('\n')
             self.assertGreater(len(rows), 2)
 
+    @mock.patch.object(CsvWriter, 'QUERY_INTERVAL', 5)
+    def test_queries_per_chunk(self):
+        # Create two chunks of scored submissions
+        for index in range(10):
+            student_item = {
+                'student_id': "test_user_{}".format(index),
+                'course_id': 'test_course',
+                'item_id': 'test_item',
+                'item_type': 'openassessment',
+            }
+            submission = sub_api.create_submission(student_item, "test submission {}".format(index))
+            workflow_api.create_workflow(submission['uuid'], ['peer', 'self'])
+            sub_api.set_score(submission['uuid'], index, 10)
+
+        # For each chunk, we should query the submission UUIDs, submissions,
+        # scores, assessment parts, and feedback, then query once more to find
+        # that there are no more submission UUIDs.
+        # (The writer uses the read replica, which the test settings define.)
+        output_streams = self._output_streams(CsvWriter.MODELS)
+        with self.assertNumQueries(11, using='read_replica'):
+            CsvWriter(output_streams).write_to_csv('test_course')
+
+        # Every submission and score should have been written (plus the header rows)
+        self.assertEqual(len(output_streams['submission'].getvalue().split('\n')), 12)
+        self.assertEqual(len(output_streams['score'].getvalue().split('\n')), 12)
+
+    @mock.patch.object(CsvWriter, 'QUERY_INTERVAL', 3)
+    def test_same_created_timestamp(self):
+        submission_uuids = self._create_submissions(10)
+
+        # Give every workflow the same creation time,
+        # so we need the primary key to order them.
+        AssessmentWorkflow.objects.update(created=AssessmentWorkflow.objects.all()[0].created)
+
+        output_streams = self._output_streams(['submission'])
+        CsvWriter(output_streams).write_to_csv('test_course')
+        self.assertEqual(self._submission_uuids_in_csv(output_streams), submission_uuids)
+
+    @mock.patch.object(CsvWriter, 'QUERY_INTERVAL', 3)
+    def test_resume_from_cursor(self):
+        submission_uuids = self._create_submissions(10)
+
+        # Export the data, remembering the cursor after the second chunk
+        cursors = []
+        output_streams = self._output_streams(['submission'])
+        CsvWriter(output_streams, checkpoint_callback=cursors.append).write_to_csv('test_course')
+        self.assertEqual(len(cursors), 4)
+        self.assertEqual(cursors[1]['submission_uuid'], submission_uuids[5])
+
+        # The cursor should survive a round-trip through JSON
+        cursor = json.loads(json.dumps(cursors[1]))
+
+        # Resume the export after the second chunk
+        resumed_streams = self._output_streams(['submission'])
+        CsvWriter(resumed_streams).write_to_csv('test_course', cursor=cursor)
+        resumed_rows = resumed_streams['submission'].getvalue().split('\n')[:-1]
+        self.assertEqual([row.split(',')[0] for row in resumed_rows], submission_uuids[6:])
+
+    @mock.patch.object(CsvWriter, 'QUERY_INTERVAL', 2)
+    def test_shards(self):
+        submission_uuids = self._create_submissions(10)
+        writer = CsvWriter(dict())
+        shards = writer.submission_uuid_shards('test_course', 3)
+        self.assertEqual(len(shards), 3)
+        self.assertEqual(shards[0][0], None)
+        self.assertEqual(shards[-1][1], None)
+
+        # Writing each shard (without headers after the first)
+        # should produce the same output as writing the whole course
+        output_streams = self._output_streams(['submission'])
+        CsvWriter(output_streams).write_to_csv('test_course')
+
+        shard_output = u""
+        for after_submission_uuid, last_submission_uuid in shards:
+            cursor = None
+            if after_submission_uuid is not None:
+                cursor = {'submission_uuid': after_submission_uuid, 'feedback_option_ids': []}
+            shard_streams = self._output_streams(['submission'])
+            CsvWriter(shard_streams).write_to_csv(
+                'test_course', cursor=cursor, last_submission_uuid=last_submission_uuid
+            )
+            shard_output += shard_streams['submission'].getvalue()
+
+        self.assertEqual(shard_output, output_streams['submission'].getvalue())
+        self.assertEqual(self._submission_uuids_in_csv(output_streams), submission_uuids)
+
+    def test_shards_few_submissions(self):
+        writer = CsvWriter(dict())
+        self.assertEqual(writer.submission_uuid_shards('test_course', 3), [(None, None)])
+
+        submission_uuids = self._create_submissions(2)
+        self.assertEqual(
+            writer.submission_uuid_shards('test_course', 3),
+            [(None, submission_uuids[0]), (submission_uuids[0], None)]
+        )
+
+    @mock.patch.object(CsvWriter, 'QUERY_INTERVAL', 2)
+    def test_write_changes(self):
+        # Create scored submissions, then move them back in time
+        old_uuids = self._create_submissions(3)
+        for submission_uuid in old_uuids:
+            sub_api.set_score(submission_uuid, 1, 10)
+        two_hours_ago = now() - timedelta(hours=2)
+        Submission.objects.update(created_at=two_hours_ago)
+        Score.objects.update(created_at=two_hours_ago)
+
+        # Create more submissions, rescore one of the older submissions,
+        # and provide feedback on another
+        new_uuids = self._create_submissions(2)
+        sub_api.set_score(old_uuids[1], 5, 10)
+        peer_api.set_assessment_feedback({
+            'submission_uuid': old_uuids[0],
+            'feedback_text': u"ḟëëḋḅäċḳ",
+            'options': [u"ȯṗẗïöṅ"],
+        })
+
+        one_hour_ago = now() - timedelta(hours=1)
+        until = now() + timedelta(minutes=1)
+        earlier_streams = self._output_streams(CsvWriter.MODELS)
+        CsvWriter(earlier_streams).write_changes_to_csv('test_course', two_hours_ago, one_hour_ago)
+        later_streams = self._output_streams(CsvWriter.MODELS)
+        CsvWriter(later_streams).write_changes_to_csv('test_course', one_hour_ago, until, write_headers=False)
+
+        # The earlier window contains the older submissions and scores
+        self.assertEqual(self._submission_uuids_in_csv(earlier_streams), old_uuids)
+        earlier_scores = list(csv.reader(StringIO(earlier_streams['score'].getvalue())))
+        self.assertEqual([row[0] for row in earlier_scores[1:]], old_uuids)
+
+        # The later window contains only the data that changed
+        later_rows = {
+            name: list(csv.reader(StringIO(output_stream.getvalue())))
+            for name, output_stream in later_streams.iteritems()
+        }
+        self.assertEqual([row[0] for row in later_rows['submission']], new_uuids)
+        self.assertEqual([row[:2] for row in later_rows['score']], [[old_uuids[1], '5']])
+        self.assertEqual([row[0] for row in later_rows['assessment_feedback']], [old_uuids[0]])
+        self.assertEqual([row[1] for row in later_rows['assessment_feedback_option']], [u"ȯṗẗïöṅ".encode('utf-8')])
+
+        # Appending the later window to the earlier window gives every submission
+        full_streams = self._output_streams(['submission'])
+        CsvWriter(full_streams).write_to_csv('test_course')
+        self.assertEqual(
+            earlier_streams['submission'].getvalue() + later_streams['submission'].getvalue(),
+            full_streams['submission'].getvalue()
+        )
+
+    def test_write_changes_reset_scores(self):
+        # Create scored submissions, then move them back in time
+        submission_uuids = self._create_submissions(3)
+        for submission_uuid in submission_uuids:
+            sub_api.set_score(submission_uuid, 1, 10)
+        one_hour_ago = now() - timedelta(hours=1)
+        Submission.objects.update(created_at=one_hour_ago - timedelta(hours=1))
+        Score.objects.update(created_at=one_hour_ago - timedelta(hours=1))
+
+        # Reset the first student's score, then the student submits again.
+        # Hide the second student's score.
+        sub_api.reset_score("test_user_0", 'test_course', 'test_item')
+        resubmission = sub_api.create_submission({
+            'student_id': "test_user_0",
+            'course_id': 'test_course',
+            'item_id': 'test_item',
+            'item_type': 'openassessment',
+        }, "test resubmission")
+        workflow_api.create_workflow(resubmission['uuid'], ['peer', 'self'])
+        sub_api.set_score(submission_uuids[1], 0, 0)
+
+        # The reset and hidden scores replace the earlier scores
+        output_streams = self._output_streams(CsvWriter.MODELS)
+        CsvWriter(output_streams).write_changes_to_csv(
+            'test_course', one_hour_ago, now() + timedelta(minutes=1), write_headers=False
+        )
+        score_rows = list(csv.reader(StringIO(output_streams['score'].getvalue())))
+        self.assertEqual(
+            [row[:3] for row in score_rows],
+            [[submission_uuids[0], '0', '0'], [submission_uuids[1], '0', '0']]
+        )
+
+    def test_write_changes_feedback_options_written_once(self):
+        submission_uuids = self._create_submissions(3)
+
+        # Provide feedback in the earlier window
+        peer_api.set_assessment_feedback({
+            'submission_uuid': submission_uuids[0],
+            'feedback_text': u"ḟëëḋḅäċḳ",
+            'options': [u"ȯṗẗïöṅ"],
+        })
+        two_hours_ago = now() - timedelta(hours=2)
+        one_hour_ago = now() - timedelta(hours=1)
+        AssessmentFeedback.objects.update(modified=two_hours_ago)
+        AssessmentFeedbackOption.objects.update(created_at=two_hours_ago)
+        output_streams = self._output_streams(['assessment_feedback_option'])
+        CsvWriter(output_streams).write_changes_to_csv('test_course', two_hours_ago, one_hour_ago)
+
+        # In the later window, change the earlier feedback and provide more feedback,
+        # selecting the option from the earlier window and a new option.
+        for submission_uuid in submission_uuids[:2]:
+            peer_api.set_assessment_feedback({
+                'submission_uuid': submission_uuid,
+                'feedback_text': u"ṁöṛë ḟëëḋḅäċḳ",
+                'options': [u"ȯṗẗïöṅ", u"ṅëẅ ȯṗẗïöṅ"],
+            })
+        CsvWriter(output_streams).write_changes_to_csv(
+            'test_course', one_hour_ago, now() + timedelta(minutes=1), write_headers=False
+        )
+
+        # Each option appears once in the appended output
+        option_rows = list(csv.reader(StringIO(output_streams['assessment_feedback_option'].getvalue())))
+        option_ids = [row[0] for row in option_rows[1:]]
+        self.assertEqual(len(option_ids), len(set(option_ids)))
+        self.assertItemsEqual(
+            [row[1] for row in option_rows[1:]],
+            [u"ȯṗẗïöṅ".encode('utf-8'), u"ṅëẅ ȯṗẗïöṅ".encode('utf-8')]
+        )
+
+    def test_write_changes_no_activity(self):
+        self._create_submissions(3)
+
+        # If nothing changed, we need only the queries to look for changes
+        output_streams = self._output_streams(CsvWriter.MODELS)
+        with self.assertNumQueries(4, using='read_replica'):
+            CsvWriter(output_streams).write_changes_to_csv(
+                'test_course', now() + timedelta(hours=1), now() + timedelta(hours=2)
+            )
+        self.assertEqual(len(output_streams['submission'].getvalue().split('\n')), 2)
+
+    def _create_submissions(self, num_submissions):
+        """
+        Create submissions and workflows in the test course.
+
+        Args:
+            num_submissions (int): The number of submissions to create.
+
+        Returns:
+            list of submission UUIDs, in the order created
+
+        """
+        submission_uuids = []
+        for index in range(num_submissions):
+            student_item = {
+                'student_id': "test_user_{}".format(index),
+                'course_id': 'test_course',
+                'item_id': 'test_item',
+                'item_type': 'openassessment',
+            }
+            submission = sub_api.create_submission(student_item, "test submission {}".format(index))
+            workflow_api.create_workflow(submission['uuid'], ['peer', 'self'])
+            submission_uuids.append(submission['uuid'])
+        return submission_uuids
+
+    def _submission_uuids_in_csv(self, output_streams):
+        """
+        Parse the submission UUIDs from the submission CSV.
+
+        Args:
+            output_streams (dict): The output streams passed to the writer.
+
+        Returns:
+            list of submission UUIDs, in the order written
+
+        """
+        output_streams['submission'].seek(0)
+        rows = list(csv.reader(output_streams['submission']))
+        return [row[0] for row in rows[1:]]
+
     def _output_streams(self, names):
         """
         Create in-memory buffers.
@@ -275,6 +275,140 @@ def update_from_assessments(submission_uuid, assessment_requirements):
         raise AssessmentWorkflowInternalError(err_msg)
 
 
+def update_from_assessments_if_dirty(submission_uuid, assessment_requirements):
+    """Update our workflow status, unless nothing could have changed it.
+
+    A workflow is clean if it was last updated with the same requirements,
+    and no assessments have been created for (or by) the submitter since.
+    Clean workflows are tracked only if the `ORA2_WORKFLOW_CLEAN_CACHE_TIMEOUT`
+    Django setting is set; otherwise this always updates the workflow.
+    This is intended for page loads, which need the workflow to be current
+    but usually find that nothing has changed.
+
+    Args:
+        submission_uuid (str): Identifier for the submission the
+            `AssessmentWorkflow` was created to track.
+        assessment_requirements (dict): Dictionary of requirements for each
+            assessment step.  See `update_from_assessments()` for details.
+
+    Returns:
+        bool: True if the workflow was updated, False if it was clean.
+
+    Raises:
+        AssessmentWorkflowRequestError: If the `submission_uuid` passed in is not
+            a string type.
+        AssessmentWorkflowNotFoundError: No assessment workflow matching the
+            requested UUID exists.
+        AssessmentWorkflowInternalError: Unexpected internal error.
+
+    """
+    if AssessmentWorkflow.is_clean(submission_uuid, assessment_requirements):
+        return False
+
+    workflow = _get_workflow_model(submission_uuid)
+
+    try:
+        workflow.update_from_assessments(assessment_requirements)
+        logger.info((
+            u"Updated workflow for submission UUID {uuid} "
+            u"with requirements {reqs}"
+        ).format(uuid=submission_uuid, reqs=assessment_requirements))
+        return True
+    except PeerAssessmentError as err:
+        err_msg = u"Could not update assessment workflow: {}".format(err)
+        logger.exception(err_msg)
+        raise AssessmentWorkflowInternalError(err_msg)
+
+
+def update_from_assessments_bulk(submission_uuids, assessment_requirements):
+    """Update the workflow status for many submissions at once.
+
+    This is equivalent to calling `update_from_assessments()` for each
+    submission, but the workflows, their steps, and the state of each
+    assessment step, the latest scores, and the notifications to the current
+    assessment step are handled for the whole batch at once, so the number
+    of database queries does not grow with the number of submissions
+    (except for workflows that change status or receive a score).
+    This is intended for staff tools and batch jobs that need to update
+    every workflow for a problem.
+
+    Args:
+        submission_uuids (list of str): Identifiers for the submissions the
+            `AssessmentWorkflow`s were created to track.
+        assessment_requirements (dict): Dictionary of requirements for each
+            assessment step.  See `update_from_assessments()` for details.
+
+    Returns:
+        list of dicts: Assessment workflow information for each submission,
+            in the same format as `update_from_assessments()`, in the order
+            of `submission_uuids`.  Submissions that do not have a workflow
+            are omitted.
+
+    Raises:
+        AssessmentWorkflowRequestError: If any of the submission UUIDs
+            passed in is not a string type.
+        AssessmentWorkflowInternalError: Unexpected internal error, such as the
+            submissions app not being available or a database configuation
+            problem.
+
+    Examples:
+        >>> update_from_assessments_bulk(
+        ...     ['222bdf3d-a88e-11e3-859e-040ccee02800'],
+        ...     {"peer": {"must_grade":5, "must_be_graded_by":3}}
+        ... )
+        ...
+        [
+            {
+                'uuid': u'53f27ecc-a88e-11e3-8543-040ccee02800',
+                'submission_uuid': u'222bdf3d-a88e-11e3-859e-040ccee02800',
+                'status': u'peer',
+                'created': datetime.datetime(2014, 3, 10, 19, 58, 19, 846684, tzinfo=<UTC>),
+                'modified': datetime.datetime(2014, 3, 10, 19, 58, 19, 846957, tzinfo=<UTC>),
+                'score': None,
+                'status_details': {
+                    'peer': {
+                        'complete': False,
+                        'graded': False
+                    }
+                }
+            }
+        ]
+
+    """
+    if not all(isinstance(submission_uuid, basestring) for submission_uuid in submission_uuids):
+        raise AssessmentWorkflowRequestError("submission_uuids must be string types")
+
+    try:
+        workflows = list(AssessmentWorkflow.objects.filter(submission_uuid__in=submission_uuids))
+        status_details = AssessmentWorkflow.update_from_assessments_bulk(workflows, assessment_requirements)
+        AssessmentWorkflow.load_latest_scores(workflows)
+        logger.info((
+            u"Updated {num} workflows with requirements {reqs}"
+        ).format(num=len(workflows), reqs=assessment_requirements))
+    except PeerAssessmentError as err:
+        err_msg = u"Could not update assessment workflows: {}".format(err)
+        logger.exception(err_msg)
+        raise AssessmentWorkflowInternalError(err_msg)
+    except DatabaseError:
+        err_msg = u"Could not update assessment workflows for submission UUIDs: {}".format(submission_uuids)
+        logger.exception(err_msg)
+        raise AssessmentWorkflowInternalError(err_msg)
+
+    workflows_by_uuid = {workflow.submission_uuid: workflow for workflow in workflows}
+    serialized_workflows = []
+    for submission_uuid in submission_uuids:
+        workflow = workflows_by_uuid.get(submission_uuid)
+        if workflow is None:
+            logger.warning(
+                u"No assessment workflow matching submission_uuid {}".format(submission_uuid)
+            )
+            continue
+        data_dict = AssessmentWorkflowSerializer(workflow).data
+        data_dict["status_details"] = status_details[submission_uuid]
+        serialized_workflows.append(data_dict)
+    return serialized_workflows
+
+
 def get_status_counts(course_id, item_id, steps):
     """
     Count how many workflows have each status, for a given item in a course.
@@ -301,14 +435,11 @@ def get_status_counts(course_id, item_id, steps):
     # the AI status, so we should never return it.
     statuses = steps + AssessmentWorkflow.STATUSES
     if 'ai' in statuses: statuses.remove('ai')
+    counts = AssessmentWorkflow.status_counts(course_id, item_id)
     return [
         {
             "status": status,
-            "count": AssessmentWorkflow.objects.filter(
-                status=status,
-                course_id=course_id,
-                item_id=item_id,
-            ).count()
+            "count": counts.get(status, 0)
         }
         for status in statuses
     ]
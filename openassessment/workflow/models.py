@@ -9,17 +9,24 @@ need to then generate a matching migration for it using:
     ./manage.py schemamigration openassessment.workflow --auto
 
 """
+import hashlib
 import logging
 import importlib
+import json
+from collections import defaultdict
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models, transaction, DatabaseError
+from django.db.models import Count
 from django.dispatch import receiver
 from django_extensions.db.fields import UUIDField
 from django.utils.timezone import now
 from model_utils import Choices
 from model_utils.models import StatusModel, TimeStampedModel
 from submissions import api as sub_api
-from openassessment.assessment.signals import assessment_complete_signal
+from submissions.models import Score
+from submissions.serializers import ScoreSerializer
+from openassessment.assessment.signals import assessment_complete_signal, assessment_created_signal
 from .errors import AssessmentApiLoadError
 
 
@@ -92,6 +99,10 @@ class AssessmentWorkflow(TimeStampedModel, StatusModel):
     course_id = models.CharField(max_length=255, blank=False, db_index=True)
     item_id = models.CharField(max_length=255, blank=False, db_index=True)
 
+    # Set when assessments may have changed the status of the workflow,
+    # so a background task should update it (see `mark_dirty()`).
+    needs_update = models.BooleanField(default=False, db_index=True)
+
     class Meta:
         ordering = ["-created"]
         # TODO: In migration, need a non-unique index on (course_id, item_id, status)
@@ -170,15 +181,226 @@ class AssessmentWorkflow(TimeStampedModel, StatusModel):
         # Return the newly created workflow
         return workflow
 
+    @classmethod
+    def status_counts(cls, course_id, item_id):
+        """
+        Count how many workflows have each status, for a given item in a course.
+
+        The counts are calculated with a single grouped query.  If the
+        `ORA2_STATUS_COUNTS_CACHE_TIMEOUT` Django setting is set, the counts
+        are cached for that many seconds, or until a workflow for the item
+        is saved (which is how its status changes).
+
+        Args:
+            course_id (unicode): The ID of the course.
+            item_id (unicode): The ID of the item in the course.
+
+        Returns:
+            dict mapping statuses to counts.  Statuses with no workflows
+            are omitted.
+
+        """
+        # We retrieve the setting in-line here so that
+        # @override_settings will work in the test suite.
+        cache_timeout = getattr(settings, 'ORA2_STATUS_COUNTS_CACHE_TIMEOUT', None)
+        cache_key = cls._status_counts_cache_key(course_id, item_id)
+        if cache_timeout:
+            counts = cache.get(cache_key)
+            if counts is not None:
+                return counts
+
+        counts = {
+            row['status']: row['count']
+            for row in cls.objects.filter(
+                course_id=course_id, item_id=item_id
+            ).order_by().values('status').annotate(count=Count('id'))
+        }
+
+        if cache_timeout:
+            cache.set(cache_key, counts, cache_timeout)
+        return counts
+
+    @staticmethod
+    def _status_counts_cache_key(course_id, item_id):
+        """
+        Return the cache key for the status counts of an item in a course.
+        Course and item IDs can contain characters that aren't valid in
+        cache keys, so we hash them.
+
+        Args:
+            course_id (unicode): The ID of the course.
+            item_id (unicode): The ID of the item in the course.
+
+        Returns:
+            str
+
+        """
+        item_hash = hashlib.sha1(
+            u"{}|{}".format(course_id, item_id).encode('utf-8')
+        ).hexdigest()
+        return "workflow.status_counts.{}".format(item_hash)
+
+    @classmethod
+    def mark_dirty(cls, submission_uuids):
+        """
+        Record that assessments may have changed the status of workflows.
+
+        The next page load will update these workflows even if they
+        were clean (see `is_clean()`).  If the `ORA2_WORKFLOW_ASYNC_UPDATES`
+        Django setting is enabled, we also flag the workflows and schedule
+        a background task to update them in batches.
+
+        Args:
+            submission_uuids (list of str): The submissions whose workflows may have changed.
+
+        Returns:
+            None
+
+        Raises:
+            DatabaseError
+
+        """
+        cache.delete_many([cls._clean_cache_key(uuid) for uuid in submission_uuids])
+
+        if getattr(settings, 'ORA2_WORKFLOW_ASYNC_UPDATES', False):
+            cls.objects.filter(submission_uuid__in=submission_uuids).update(needs_update=True)
+
+            # Import here to avoid a circular dependency (the tasks use this model)
+            from openassessment.workflow.tasks import schedule_workflow_updates
+            schedule_workflow_updates()
+
+    @classmethod
+    def is_clean(cls, submission_uuid, assessment_requirements):
+        """
+        Check whether a workflow was updated with the given requirements,
+        and no assessments have changed it since.
+
+        This is tracked only if the `ORA2_WORKFLOW_CLEAN_CACHE_TIMEOUT`
+        Django setting is set; otherwise, workflows are never clean.
+        An update that was still running when an assessment was created
+        can leave a workflow marked clean, so the marker expires after
+        that many seconds.
+
+        Args:
+            submission_uuid (str): The submission associated with the workflow.
+            assessment_requirements (dict): The current requirements for each assessment step.
+
+        Returns:
+            bool
+
+        """
+        if not getattr(settings, 'ORA2_WORKFLOW_CLEAN_CACHE_TIMEOUT', None):
+            return False
+        fingerprint = cache.get(cls._clean_cache_key(submission_uuid))
+        return (
+            fingerprint is not None and
+            fingerprint == cls._requirements_fingerprint(assessment_requirements)
+        )
+
+    def _mark_clean(self, assessment_requirements):
+        """
+        Remember that the workflow is up to date with the given requirements.
+        See `is_clean()`.
+
+        Args:
+            assessment_requirements (dict): The requirements used to update the workflow.
+
+        Returns:
+            None
+
+        """
+        cache_timeout = getattr(settings, 'ORA2_WORKFLOW_CLEAN_CACHE_TIMEOUT', None)
+        if cache_timeout and assessment_requirements is not None:
+            cache.set(
+                self._clean_cache_key(self.submission_uuid),
+                self._requirements_fingerprint(assessment_requirements),
+                cache_timeout
+            )
+
+    @staticmethod
+    def _clean_cache_key(submission_uuid):
+        """
+        Return the cache key for the clean marker of a workflow.
+
+        Args:
+            submission_uuid (str): The submission associated with the workflow.
+
+        Returns:
+            str
+
+        """
+        return "workflow.clean.{}".format(submission_uuid)
+
+    @staticmethod
+    def _requirements_fingerprint(assessment_requirements):
+        """
+        Summarize assessment requirements, so we can tell when
+        the author has changed them.
+
+        Args:
+            assessment_requirements (dict): The requirements for each assessment step.
+
+        Returns:
+            str
+
+        """
+        return hashlib.sha1(
+            json.dumps(assessment_requirements, sort_keys=True)
+        ).hexdigest()
+
+    def save(self, *args, **kwargs):
+        """
+        Save the workflow, and invalidate the cached status counts for its item.
+        """
+        super(AssessmentWorkflow, self).save(*args, **kwargs)
+        cache.delete(self._status_counts_cache_key(self.course_id, self.item_id))
+
     @property
     def score(self):
         """Latest score for the submission we're tracking.
 
         Note that while it is usually the case that we're setting the score,
         that may not always be the case. We may have some course staff override.
+
+        If the score was already retrieved for a batch of workflows
+        (see `load_latest_scores()`), the loaded value is used.
         """
+        if hasattr(self, '_latest_score'):
+            return self._latest_score
         return sub_api.get_latest_score_for_submission(self.submission_uuid)
 
+    @classmethod
+    def load_latest_scores(cls, workflows):
+        """
+        Retrieve the latest score for many workflows in a single query.
+
+        The result for each workflow is the same as `get_latest_score_for_submission()`
+        in the submissions API, and is stored on the workflow so that the `score`
+        property does not need to query again.
+
+        Args:
+            workflows (list of AssessmentWorkflow): The workflows to load scores for.
+
+        Returns:
+            None
+
+        """
+        latest_scores = dict()
+        if workflows:
+            scores = Score.objects.filter(
+                submission__uuid__in=[workflow.submission_uuid for workflow in workflows]
+            ).order_by('-id').select_related('submission')
+            for score in scores:
+                # Scores are ordered newest first, so keep the first one we see.
+                latest_scores.setdefault(score.submission.uuid, score)
+
+        for workflow in workflows:
+            score = latest_scores.get(workflow.submission_uuid)
+            if score is None or score.is_hidden():
+                workflow._latest_score = None
+            else:
+                workflow._latest_score = ScoreSerializer(score).data
+
     def status_details(self, assessment_requirements):
         status_dict = {}
         steps = self._get_steps()
@@ -242,26 +464,181 @@ class AssessmentWorkflow(TimeStampedModel, StatusModel):
         # If we're done, we're done -- it doesn't matter if requirements have
         # changed because we've already written a score.
         if self.status == self.STATUS.done:
+            self._mark_clean(assessment_requirements)
             return
 
         # Update our AssessmentWorkflowStep models with the latest from our APIs
         steps = self._get_steps()
-        step_for_name = {step.name:step for step in steps}
 
         # Go through each step and update its status.
         for step in steps:
             step.update(self.submission_uuid, assessment_requirements)
 
-        # Fetch name of the first step that the submitter hasn't yet completed.
-        new_status = next(
-            (step.name for step in steps if step.submitter_completed_at is None),
-            self.STATUS.waiting  # if nothing's left to complete, we're waiting
+        self._update_status(steps, assessment_requirements)
+        self._mark_clean(assessment_requirements)
+
+    @classmethod
+    def update_from_assessments_bulk(cls, workflows, assessment_requirements):
+        """
+        Query assessment APIs and change the status of many workflows at once.
+
+        This behaves like calling `update_from_assessments()` for each workflow,
+        but the steps are loaded in a single query, and each assessment API
+        is asked about all the submissions at once.  Assessment API modules
+        can define `submitter_is_finished_bulk` and `assessment_is_finished_bulk`
+        functions, which accept a list of submission UUIDs and return a dict
+        mapping each UUID to a bool.  For modules that do not define them,
+        we fall back to calling the single-submission functions.
+
+        Args:
+            workflows (list of AssessmentWorkflow): The workflows to update.
+            assessment_requirements (dict): Dictionary passed to the assessment API.
+                See `update_from_assessments()` for details.
+
+        Returns:
+            dict mapping submission UUIDs to status details
+            (in the same format as `status_details()`).
+
+        """
+        steps_by_uuid = cls._get_steps_bulk(workflows)
+
+        # Ask each assessment API about every submission with that step.
+        # We do this for completed workflows too, so that we can
+        # report status details for them.
+        uuids_by_step = defaultdict(list)
+        step_by_name = dict()
+        for submission_uuid, steps in steps_by_uuid.iteritems():
+            for step in steps:
+                uuids_by_step[step.name].append(submission_uuid)
+                step_by_name[step.name] = step
+
+        submitter_finished = dict()
+        assessment_finished = dict()
+        for step_name, submission_uuids in uuids_by_step.iteritems():
+            api = step_by_name[step_name].api()
+            if api is not None:
+                if assessment_requirements is None:
+                    step_reqs = None
+                else:
+                    step_reqs = assessment_requirements.get(step_name, {})
+                submitter_finished[step_name] = _call_bulk(
+                    api, 'submitter_is_finished', submission_uuids, step_reqs
+                )
+                assessment_finished[step_name] = _call_bulk(
+                    api, 'assessment_is_finished', submission_uuids, step_reqs
+                )
+
+        # Update the step models, then each workflow's status
+        completed_at = now()
+        submitter_completed_ids = []
+        assessment_completed_ids = []
+        for workflow in workflows:
+            if workflow.status == cls.STATUS.done:
+                continue
+
+            steps = steps_by_uuid[workflow.submission_uuid]
+            for step in steps:
+                if step.name not in submitter_finished:
+                    # No API configured, so the step is considered complete.
+                    is_submitter_finished = is_assessment_finished = True
+                else:
+                    is_submitter_finished = submitter_finished[step.name][workflow.submission_uuid]
+                    is_assessment_finished = assessment_finished[step.name][workflow.submission_uuid]
+
+                if not step.is_submitter_complete() and is_submitter_finished:
+                    step.submitter_completed_at = completed_at
+                    submitter_completed_ids.append(step.pk)
+                if not step.is_assessment_complete() and is_assessment_finished:
+                    step.assessment_completed_at = completed_at
+                    assessment_completed_ids.append(step.pk)
+
+        if submitter_completed_ids:
+            AssessmentWorkflowStep.objects.filter(pk__in=submitter_completed_ids).update(
+                submitter_completed_at=completed_at
+            )
+        if assessment_completed_ids:
+            AssessmentWorkflowStep.objects.filter(pk__in=assessment_completed_ids).update(
+                assessment_completed_at=completed_at
+            )
+
+        # Notify each assessment API of the submissions currently in its step,
+        # as `_update_status()` would, but once per step for the whole batch.
+        # Assessment API modules can define `on_start_bulk`, which accepts
+        # a list of submission UUIDs.
+        started_uuids_by_step = defaultdict(list)
+        for workflow in workflows:
+            if workflow.status != cls.STATUS.done:
+                current_step = cls._current_step(steps_by_uuid[workflow.submission_uuid])
+                if current_step is not None:
+                    started_uuids_by_step[current_step.name].append(workflow.submission_uuid)
+
+        for step_name, submission_uuids in started_uuids_by_step.iteritems():
+            api = step_by_name[step_name].api()
+            on_start_bulk_func = getattr(api, 'on_start_bulk', None)
+            if on_start_bulk_func is not None:
+                on_start_bulk_func(submission_uuids)
+            else:
+                on_start_func = getattr(api, 'on_start', None)
+                if on_start_func is not None:
+                    for submission_uuid in submission_uuids:
+                        on_start_func(submission_uuid)
+
+        for workflow in workflows:
+            if workflow.status != cls.STATUS.done:
+                workflow._update_status(
+                    steps_by_uuid[workflow.submission_uuid],
+                    assessment_requirements,
+                    notify_start=False
+                )
+
+        return {
+            submission_uuid: {
+                step.name: {
+                    "complete": submitter_finished[step.name][submission_uuid],
+                    "graded": assessment_finished[step.name][submission_uuid],
+                }
+                for step in steps if step.name in submitter_finished
+            }
+            for submission_uuid, steps in steps_by_uuid.iteritems()
+        }
+
+    @staticmethod
+    def _current_step(steps):
+        """
+        Return the first step that the submitter hasn't yet completed,
+        or None if the submitter has completed every step.
+        """
+        return next(
+            (step for step in steps if step.submitter_completed_at is None),
+            None
         )
 
+    def _update_status(self, steps, assessment_requirements, notify_start=True):
+        """
+        Change our status based on the (already updated) workflow steps.
+
+        Intended for internal use by update_from_assessments(). See
+        update_from_assessments() documentation for more details.
+
+        Args:
+            steps (list of AssessmentWorkflowStep): The steps in this workflow.
+            assessment_requirements (dict): Dictionary passed to the assessment API.
+
+        Kwargs:
+            notify_start (bool): If False, do not notify the assessment API
+                for the current step; the caller is responsible for doing so.
+
+        """
+        step_for_name = {step.name:step for step in steps}
+
+        # Fetch name of the first step that the submitter hasn't yet completed.
+        new_step = self._current_step(steps)
+        # if nothing's left to complete, we're waiting
+        new_status = new_step.name if new_step is not None else self.STATUS.waiting
+
         # If the submitter is beginning the next assessment, notify the
         # appropriate assessment API.
-        new_step = step_for_name.get(new_status)
-        if new_step is not None:
+        if new_step is not None and notify_start:
             on_start_func = getattr(new_step.api(), 'on_start', None)
             if on_start_func is not None:
                 on_start_func(self.submission_uuid)
@@ -324,6 +701,37 @@ class AssessmentWorkflow(TimeStampedModel, StatusModel):
             steps = list(self.steps.all())
         return steps
 
+    @classmethod
+    def _get_steps_bulk(cls, workflows):
+        """
+        Retrieve the steps for many workflows in a single query.
+
+        Args:
+            workflows (list of AssessmentWorkflow): The workflows to retrieve steps for.
+
+        Returns:
+            dict mapping submission UUIDs to lists of AssessmentWorkflowStep models.
+
+        """
+        steps_by_workflow_id = defaultdict(list)
+        if workflows:
+            steps = AssessmentWorkflowStep.objects.filter(
+                workflow__in=[workflow.pk for workflow in workflows],
+                name__in=AssessmentWorkflow.STEPS
+            )
+            for step in steps:
+                steps_by_workflow_id[step.workflow_id].append(step)
+
+        steps_by_uuid = dict()
+        for workflow in workflows:
+            steps = steps_by_workflow_id.get(workflow.pk)
+            if not steps:
+                # Fall back to the single-workflow method,
+                # which creates the default steps if necessary.
+                steps = workflow._get_steps()
+            steps_by_uuid[workflow.submission_uuid] = steps
+        return steps_by_uuid
+
     def set_score(self, score):
         """
         Set a score for the workflow.
@@ -343,6 +751,91 @@ class AssessmentWorkflow(TimeStampedModel, StatusModel):
         )
 
 
+class AssessmentApiRegistry(object):
+    """
+    Maps assessment step names to assessment API modules.
+
+    Resolving an API means reading the `ORA2_ASSESSMENTS` Django setting
+    and importing the module.  Workflow updates resolve the API for every
+    step (often more than once), so we resolve each module once and
+    remember it until the setting changes.
+
+    We retrieve the settings in-line (rather than using the top-level
+    constant), so that @override_settings will work in the test suite.
+    API functions are still looked up on the module when they are called,
+    so tests can patch them.
+
+    """
+    def __init__(self):
+        self._api_dict = None
+        self._apis = dict()
+
+    def get(self, name):
+        """
+        Retrieve the assessment API module for a step.
+
+        Args:
+            name (unicode): The name of the assessment step (e.g. "peer").
+
+        Returns:
+            module or None (if no API is configured for the step)
+
+        Raises:
+            AssessmentApiLoadError
+
+        """
+        api_dict = getattr(settings, 'ORA2_ASSESSMENTS', DEFAULT_ASSESSMENT_API_DICT)
+        if api_dict is not self._api_dict:
+            self._apis = dict()
+            self._api_dict = api_dict
+
+        if name not in self._apis:
+            self._apis[name] = self._load(name, api_dict.get(name))
+        return self._apis[name]
+
+    def clear(self):
+        """
+        Forget all resolved API modules.
+        """
+        self._api_dict = None
+        self._apis = dict()
+
+    @staticmethod
+    def _load(name, api_path):
+        """
+        Import the assessment API module for a step.
+
+        Args:
+            name (unicode): The name of the assessment step.
+            api_path (unicode or None): The Python module path configured for the step.
+
+        Returns:
+            module or None
+
+        Raises:
+            AssessmentApiLoadError
+
+        """
+        if api_path is not None:
+            try:
+                return importlib.import_module(api_path)
+            except (ImportError, ValueError):
+                raise AssessmentApiLoadError(name, api_path)
+        else:
+            # It's possible for the database to contain steps for APIs
+            # that are not configured -- for example, if a new assessment
+            # type is added, then the code is rolled back.
+            msg = (
+                u"No assessment configured for '{name}'.  "
+                u"Check the ORA2_ASSESSMENTS Django setting."
+            ).format(name=name)
+            logger.warning(msg)
+            return None
+
+
+_API_REGISTRY = AssessmentApiRegistry()
+
+
 class AssessmentWorkflowStep(models.Model):
     """An individual step in the overall workflow process.
 
@@ -377,27 +870,7 @@ class AssessmentWorkflowStep(models.Model):
         This relies on Django settings to map step names to
         the assessment API implementation.
         """
-        # We retrieve the settings in-line here (rather than using the
-        # top-level constant), so that @override_settings will work
-        # in the test suite.
-        api_path = getattr(
-            settings, 'ORA2_ASSESSMENTS', DEFAULT_ASSESSMENT_API_DICT
-        ).get(self.name)
-        if api_path is not None:
-            try:
-                return importlib.import_module(api_path)
-            except (ImportError, ValueError):
-                raise AssessmentApiLoadError(self.name, api_path)
-        else:
-            # It's possible for the database to contain steps for APIs
-            # that are not configured -- for example, if a new assessment
-            # type is added, then the code is rolled back.
-            msg = (
-                u"No assessment configured for '{name}'.  "
-                u"Check the ORA2_ASSESSMENTS Django setting."
-            ).format(name=self.name)
-            logger.warning(msg)
-            return None
+        return _API_REGISTRY.get(self.name)
 
     def update(self, submission_uuid, assessment_requirements):
         """
@@ -414,9 +887,10 @@ class AssessmentWorkflowStep(models.Model):
         else:
             step_reqs = assessment_requirements.get(self.name, {})
 
+        api = self.api()
         default_finished = lambda submission_uuid, step_reqs: True
-        submitter_finished = getattr(self.api(), 'submitter_is_finished', default_finished)
-        assessment_finished = getattr(self.api(), 'assessment_is_finished', default_finished)
+        submitter_finished = getattr(api, 'submitter_is_finished', default_finished)
+        assessment_finished = getattr(api, 'assessment_is_finished', default_finished)
 
         # Has the user completed their obligations for this step?
         if (not self.is_submitter_complete() and submitter_finished(submission_uuid, step_reqs)):
@@ -432,12 +906,46 @@ class AssessmentWorkflowStep(models.Model):
             self.save()
 
 
+def _call_bulk(api, func_name, submission_uuids, requirements):
+    """
+    Call an assessment API function for many submissions.
+
+    If the API module defines a bulk version of the function (`<func_name>_bulk`),
+    we use that; otherwise, we call the function once per submission.
+    If the API module does not define the function at all, we default to True,
+    as in `AssessmentWorkflowStep.update()`.
+
+    Args:
+        api (module): The assessment API module.
+        func_name (str): The name of the function, e.g. "submitter_is_finished".
+        submission_uuids (list of str): The submissions to check.
+        requirements (dict): The requirements for this assessment step.
+
+    Returns:
+        dict mapping submission UUIDs to the function's return value.
+
+    """
+    bulk_func = getattr(api, func_name + '_bulk', None)
+    if bulk_func is not None:
+        return bulk_func(submission_uuids, requirements)
+
+    func = getattr(api, func_name, lambda submission_uuid, reqs: True)
+    return {
+        submission_uuid: func(submission_uuid, requirements)
+        for submission_uuid in submission_uuids
+    }
+
+
 @receiver(assessment_complete_signal)
 def update_workflow_async(sender, **kwargs):
     """
     Register a receiver for the update workflow signal
     This allows asynchronous processes to update the workflow
 
+    If the `ORA2_WORKFLOW_ASYNC_UPDATES` Django setting is enabled,
+    the workflow is marked dirty and updated by a background task;
+    otherwise, it is updated immediately.
+
     Args:
         sender (object): Not used
 
@@ -455,6 +963,10 @@ def update_workflow_async(sender, **kwargs):
         return
 
     try:
+        AssessmentWorkflow.mark_dirty([submission_uuid])
+        if getattr(settings, 'ORA2_WORKFLOW_ASYNC_UPDATES', False):
+            return
+
         workflow = AssessmentWorkflow.objects.get(submission_uuid=submission_uuid)
         workflow.update_from_assessments(None)
     except AssessmentWorkflow.DoesNotExist:
@@ -472,3 +984,36 @@ def update_workflow_async(sender, **kwargs):
             u"for submission UUID {}"
         ).format(submission_uuid)
         logger.exception(msg)
+
+
+@receiver(assessment_created_signal)
+def mark_workflow_dirty(sender, **kwargs):
+    """
+    Register a receiver for the assessment created signal,
+    which marks the workflow dirty so it is updated on the next page load
+    (or by a background task, see `AssessmentWorkflow.mark_dirty()`).
+
+    Args:
+        sender (object): Not used
+
+    Keyword Arguments:
+        submission_uuid (str): The UUID of the submission associated
+            with the workflow that may have changed.
+
+    Returns:
+        None
+
+    """
+    submission_uuid = kwargs.get('submission_uuid')
+    if submission_uuid is None:
+        logger.error("Assessment created signal called without a submission UUID")
+        return
+
+    try:
+        AssessmentWorkflow.mark_dirty([submission_uuid])
+    except DatabaseError:
+        msg = (
+            u"Database error occurred while marking "
+            u"the workflow for submission UUID {} as dirty"
+        ).format(submission_uuid)
+        logger.exception(msg)
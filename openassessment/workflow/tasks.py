@@ -0,0 +1,94 @@
+"""
+Asynchronous tasks for updating assessment workflows.
+
+These are used only if the `ORA2_WORKFLOW_ASYNC_UPDATES` Django setting
+is enabled.  Receivers for the assessment signals then flag workflows
+that may have changed (see `AssessmentWorkflow.mark_dirty()`),
+and the task below updates the flagged workflows in batches.
+"""
+from celery import task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from openassessment.workflow.models import AssessmentWorkflow
+
+logger = get_task_logger(__name__)
+
+# If the Django settings define a low-priority queue, use that.
+# Otherwise, use the default queue.
+UPDATE_TASK_QUEUE = getattr(settings, 'LOW_PRIORITY_QUEUE', None)
+
+# Number of workflows to update at a time
+UPDATE_BATCH_SIZE = 100
+
+# While an update task is waiting in the queue, we don't schedule another one:
+# it will pick up every workflow flagged before it starts.
+# The marker expires in case the task is lost.
+SCHEDULED_CACHE_KEY = "workflow.updates_scheduled"
+SCHEDULED_CACHE_TIMEOUT = 60 * 5
+
+
+def schedule_workflow_updates():
+    """
+    Schedule a task to update flagged workflows, unless one is already waiting.
+
+    Returns:
+        None
+
+    """
+    if cache.add(SCHEDULED_CACHE_KEY, True, SCHEDULED_CACHE_TIMEOUT):
+        update_dirty_workflows.apply_async()
+
+
+@task(queue=UPDATE_TASK_QUEUE)  # pylint: disable=E1102
+def update_dirty_workflows():
+    """
+    Update every workflow flagged as needing an update, in batches.
+
+    We don't know the current problem requirements here, so
+    (as for other asynchronous updates) the assessment APIs are
+    passed `None` requirements.  The workflows are also marked dirty,
+    so the next page load updates them with the full requirements.
+
+    Returns:
+        None
+
+    """
+    # Clear the marker first, so that workflows flagged
+    # while we are running will schedule another task.
+    cache.delete(SCHEDULED_CACHE_KEY)
+
+    num_updated = 0
+    while True:
+        try:
+            workflows = list(
+                AssessmentWorkflow.objects.filter(needs_update=True).order_by('id')[:UPDATE_BATCH_SIZE]
+            )
+            if not workflows:
+                break
+
+            # Clear the flags before updating, so that assessments created
+            # during the update flag the workflows again.
+            AssessmentWorkflow.objects.filter(
+                pk__in=[workflow.pk for workflow in workflows]
+            ).update(needs_update=False)
+        except DatabaseError:
+            logger.exception(u"Could not retrieve workflows that need an update.")
+            raise
+
+        try:
+            AssessmentWorkflow.update_from_assessments_bulk(
+                [workflow for workflow in workflows if workflow.status != AssessmentWorkflow.STATUS.done],
+                None
+            )
+            num_updated += len(workflows)
+        except Exception:
+            # The flags are already cleared, so we don't retry these workflows here;
+            # they will be updated on the next page load instead.
+            msg = u"An error occurred while updating workflows for submissions {}".format(
+                [workflow.submission_uuid for workflow in workflows]
+            )
+            logger.exception(msg)
+
+    logger.info(u"Updated {} workflows flagged by assessments".format(num_updated))
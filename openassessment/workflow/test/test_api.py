@@ -336,6 +336,130 @@ class TestAssessmentWorkflowApi(CacheResetTest):
         )
         self.assertEqual(counts, updated_counts)
 
+    def test_get_status_counts_single_query(self):
+        self._create_workflow_with_status("user 1", "test/1/1", "peer-problem", "peer")
+        self._create_workflow_with_status("user 2", "test/1/1", "peer-problem", "done")
+
+        with self.assertNumQueries(1):
+            counts = workflow_api.get_status_counts("test/1/1", "peer-problem", ["peer", "self"])
+
+        self.assertEqual(counts, [
+            {"status": "peer", "count": 1},
+            {"status": "self", "count": 0},
+            {"status": "waiting", "count": 0},
+            {"status": "done", "count": 1},
+        ])
+
+    @override_settings(ORA2_STATUS_COUNTS_CACHE_TIMEOUT=60)
+    def test_get_status_counts_cached(self):
+        workflow, __ = self._create_workflow_with_status("user 1", "test/1/1", "peer-problem", "peer")
+        workflow_api.get_status_counts("test/1/1", "peer-problem", ["peer", "self"])
+
+        # The second call should use the cached counts
+        with self.assertNumQueries(0):
+            counts = workflow_api.get_status_counts("test/1/1", "peer-problem", ["peer", "self"])
+        self.assertEqual(counts[0], {"status": "peer", "count": 1})
+
+        # Changing the status of a workflow invalidates the cache
+        workflow_model = AssessmentWorkflow.objects.get(uuid=workflow['uuid'])
+        workflow_model.status = "self"
+        workflow_model.save()
+
+        counts = workflow_api.get_status_counts("test/1/1", "peer-problem", ["peer", "self"])
+        self.assertEqual(counts[0], {"status": "peer", "count": 0})
+        self.assertEqual(counts[1], {"status": "self", "count": 1})
+
+    def test_update_from_assessments_bulk(self):
+        requirements = {
+            "peer": {
+                "must_grade": 0,
+                "must_be_graded_by": 0
+            },
+            "self": {}
+        }
+
+        # Self-assessed, so the workflow should be done
+        __, self_assessed_sub = self._create_workflow_with_status(
+            "user 1", "test/1/1", "peer-problem", "self", steps=["self"]
+        )
+        self_api.create_assessment(
+            self_assessed_sub['uuid'], "user 1", {"secret": "yes"}, {}, "", RUBRIC_DICT
+        )
+
+        # Not self-assessed, so the workflow should stay in self
+        __, not_assessed_sub = self._create_workflow_with_status(
+            "user 2", "test/1/1", "peer-problem", "self", steps=["self"]
+        )
+
+        # No peer assessments required, so the workflow should move to self
+        __, peer_sub = self._create_workflow_with_status(
+            "user 3", "test/1/1", "peer-problem", "peer", steps=["peer", "self"]
+        )
+
+        submission_uuids = [
+            self_assessed_sub['uuid'], not_assessed_sub['uuid'], "no such submission", peer_sub['uuid']
+        ]
+        workflows = workflow_api.update_from_assessments_bulk(submission_uuids, requirements)
+
+        # Missing workflows are skipped, and the order is preserved
+        self.assertEqual(
+            [workflow['submission_uuid'] for workflow in workflows],
+            [self_assessed_sub['uuid'], not_assessed_sub['uuid'], peer_sub['uuid']]
+        )
+        self.assertEqual(
+            [workflow['status'] for workflow in workflows],
+            ["done", "self", "self"]
+        )
+        self.assertEqual(workflows[0]['score']['points_earned'], 1)
+        self.assertEqual(workflows[0]['score']['points_possible'], 1)
+
+        # Results should match updating each workflow individually
+        for workflow in workflows:
+            single_workflow = workflow_api.update_from_assessments(workflow['submission_uuid'], requirements)
+            self.assertEqual(workflow, single_workflow)
+
+    def test_update_from_assessments_bulk_starts_current_step(self):
+        requirements = {
+            "peer": {
+                "must_grade": 5,
+                "must_be_graded_by": 3
+            },
+            "self": {}
+        }
+        __, submission = self._create_workflow_with_status(
+            "user 1", "test/1/1", "peer-problem", "peer"
+        )
+
+        # Like `update_from_assessments()`, the bulk update notifies the API
+        # for the current step, even if the status hasn't changed.
+        with patch.object(peer_api, 'on_start_bulk') as mock_on_start:
+            workflows = workflow_api.update_from_assessments_bulk([submission['uuid']], requirements)
+        self.assertEqual(workflows[0]['status'], "peer")
+        mock_on_start.assert_called_once_with([submission['uuid']])
+
+    def test_update_from_assessments_bulk_num_queries(self):
+        requirements = {
+            "peer": {
+                "must_grade": 5,
+                "must_be_graded_by": 3
+            },
+            "self": {}
+        }
+
+        # The steps, the assessment API results, the latest scores,
+        # and the peer workflows for the current step are loaded
+        # in a fixed number of queries.
+        submission_uuids = []
+        for num_workflows in [2, 4]:
+            while len(submission_uuids) < num_workflows:
+                __, submission = self._create_workflow_with_status(
+                    "user {}".format(len(submission_uuids)), "test/1/1", "peer-problem", "peer"
+                )
+                submission_uuids.append(submission['uuid'])
+
+            with self.assertNumQueries(10):
+                workflow_api.update_from_assessments_bulk(submission_uuids, requirements)
+
     @override_settings(ORA2_ASSESSMENTS={'self': 'not.a.module'})
     def test_unable_to_load_api(self):
         submission = sub_api.create_submission({
@@ -351,6 +475,27 @@ class TestAssessmentWorkflowApi(CacheResetTest):
         with self.assertRaises(AssessmentWorkflowInternalError):
             workflow_api.update_from_assessments(submission['uuid'], {})
 
+    def test_assessment_api_resolved_once(self):
+        submission = sub_api.create_submission({
+            "student_id": "test student",
+            "course_id": "test course",
+            "item_id": "test item",
+            "item_type": "openassessment",
+        }, "test answer")
+        workflow_api.create_workflow(submission['uuid'], ['self'], ON_INIT_PARAMS)
+
+        # Once the API modules have been resolved, updating the workflow
+        # should not import them again.
+        with patch('openassessment.workflow.models.importlib') as mock_importlib:
+            workflow_api.update_from_assessments(submission['uuid'], {})
+            workflow_api.get_workflow_for_submission(submission['uuid'], {})
+            self.assertFalse(mock_importlib.import_module.called)
+
+        # Changing the setting should resolve the modules again
+        with override_settings(ORA2_ASSESSMENTS={'self': 'not.a.module'}):
+            with self.assertRaises(AssessmentWorkflowInternalError):
+                workflow_api.update_from_assessments(submission['uuid'], {})
+
     def _create_workflow_with_status(
         self, student_id, course_id, item_id,
         status, answer="answer", steps=None
@@ -3,12 +3,13 @@ Tests for Django signals and receivers defined by the workflow API.
 """
 import mock
 from django.db import DatabaseError
+from django.test.utils import override_settings
 import ddt
 from submissions import api as sub_api
 from openassessment.test_utils import CacheResetTest
 from openassessment.workflow import api as workflow_api
 from openassessment.workflow.models import AssessmentWorkflow
-from openassessment.assessment.signals import assessment_complete_signal
+from openassessment.assessment.signals import assessment_complete_signal, assessment_created_signal
 
 
 @ddt.ddt
@@ -62,3 +63,53 @@ class UpdateWorkflowSignalTest(CacheResetTest):
         # The receiver should catch and log the error
         mock_call.side_effect = error("OH NO!")
         assessment_complete_signal.send(sender=None, submission_uuid=self.submission_uuid)
+
+    @override_settings(ORA2_WORKFLOW_CLEAN_CACHE_TIMEOUT=600)
+    def test_skip_clean_workflow_update(self):
+        workflow_api.create_workflow(self.submission_uuid, ['self'])
+        requirements = {'self': {}}
+
+        # The first update marks the workflow clean
+        self.assertTrue(workflow_api.update_from_assessments_if_dirty(self.submission_uuid, requirements))
+        with self.assertNumQueries(0):
+            self.assertFalse(workflow_api.update_from_assessments_if_dirty(self.submission_uuid, requirements))
+
+        # Changing the requirements makes the workflow dirty
+        requirements = {'self': {}, 'peer': {'must_grade': 1, 'must_be_graded_by': 1}}
+        self.assertTrue(workflow_api.update_from_assessments_if_dirty(self.submission_uuid, requirements))
+        self.assertFalse(workflow_api.update_from_assessments_if_dirty(self.submission_uuid, requirements))
+
+        # So does creating an assessment
+        assessment_created_signal.send(sender=None, submission_uuid=self.submission_uuid)
+        self.assertTrue(workflow_api.update_from_assessments_if_dirty(self.submission_uuid, requirements))
+
+    def test_always_update_without_clean_tracking(self):
+        workflow_api.create_workflow(self.submission_uuid, ['self'])
+        self.assertTrue(workflow_api.update_from_assessments_if_dirty(self.submission_uuid, {}))
+        self.assertTrue(workflow_api.update_from_assessments_if_dirty(self.submission_uuid, {}))
+
+    @override_settings(ORA2_WORKFLOW_ASYNC_UPDATES=True)
+    def test_async_updates(self):
+        workflow_api.create_workflow(self.submission_uuid, ['self'])
+
+        # The signal should flag the workflow, then (since Celery runs tasks
+        # eagerly in the test suite) the task should update it in a batch.
+        with mock.patch.object(AssessmentWorkflow, 'update_from_assessments_bulk') as mock_update:
+            assessment_complete_signal.send(sender=None, submission_uuid=self.submission_uuid)
+            workflows, requirements = mock_update.call_args[0]
+            self.assertEqual([workflow.submission_uuid for workflow in workflows], [self.submission_uuid])
+            self.assertIs(requirements, None)
+
+        workflow = AssessmentWorkflow.objects.get(submission_uuid=self.submission_uuid)
+        self.assertFalse(workflow.needs_update)
+
+    @override_settings(ORA2_WORKFLOW_ASYNC_UPDATES=True)
+    def test_async_updates_change_status(self):
+        workflow_api.create_workflow(self.submission_uuid, ['self'])
+        with mock.patch('openassessment.assessment.api.self.submitter_is_finished_bulk') as mock_finished:
+            mock_finished.return_value = {self.submission_uuid: True}
+            assessment_created_signal.send(sender=None, submission_uuid=self.submission_uuid)
+
+        workflow = AssessmentWorkflow.objects.get(submission_uuid=self.submission_uuid)
+        self.assertEqual(workflow.status, 'waiting')
+        self.assertFalse(workflow.needs_update)
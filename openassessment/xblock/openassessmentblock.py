@@ -237,9 +237,10 @@ class OpenAssessmentBlock(
         # On page load, update the workflow status.
         # We need to do this here because peers may have graded us, in which
         # case we may have a score available.
+        # If no one has assessed us since the last update, there is nothing to do.
 
         try:
-            self.update_workflow_status()
+            self.update_workflow_status(only_if_dirty=True)
         except AssessmentWorkflowError:
             # Log the exception, but continue loading the page
             logger.exception('An error occurred while updating the workflow on page load.')
@@ -71,7 +71,7 @@ class TestOpenAssessment(XBlockHandlerTestCase):
         # No submission made, so don't update the workflow
         with patch('openassessment.xblock.workflow_mixin.workflow_api') as mock_api:
             self.runtime.render(xblock, "student_view")
-            self.assertEqual(mock_api.update_from_assessments.call_count, 0)
+            self.assertEqual(mock_api.update_from_assessments_if_dirty.call_count, 0)
 
         # Simulate one submission made (we have a submission ID)
         xblock.submission_uuid = 'test_submission'
@@ -82,7 +82,7 @@ class TestOpenAssessment(XBlockHandlerTestCase):
             expected_reqs = {
                 "peer": { "must_grade": 5, "must_be_graded_by": 3 }
             }
-            mock_api.update_from_assessments.assert_called_once_with('test_submission', expected_reqs)
+            mock_api.update_from_assessments_if_dirty.assert_called_once_with('test_submission', expected_reqs)
 
     @scenario('data/basic_scenario.xml')
     def test_student_view_workflow_error(self, xblock):
@@ -90,7 +90,7 @@ class TestOpenAssessment(XBlockHandlerTestCase):
         # Simulate an error from updating the workflow
         xblock.submission_uuid = 'test_submission'
         with patch('openassessment.xblock.workflow_mixin.workflow_api') as mock_api:
-            mock_api.update_from_assessments.side_effect = AssessmentWorkflowError
+            mock_api.update_from_assessments_if_dirty.side_effect = AssessmentWorkflowError
             xblock_fragment = self.runtime.render(xblock, "student_view")
 
         # Expect that the page renders even if the update fails
@@ -86,7 +86,7 @@ class WorkflowMixin(object):
 
         return requirements
 
-    def update_workflow_status(self, submission_uuid=None):
+    def update_workflow_status(self, submission_uuid=None, only_if_dirty=False):
         """
         Update the status of a workflow.  For example, change the status
         from peer-assessment to self-assessment.  Creates a score
@@ -95,6 +95,8 @@ class WorkflowMixin(object):
         Keyword Arguments:
             submission_uuid (str): The submission associated with the workflow to update.
                 Defaults to the submission created by the current student.
+            only_if_dirty (bool): If True, skip the update if no assessments
+                could have changed the workflow since it was last updated.
 
         Returns:
             None
@@ -107,7 +109,10 @@ class WorkflowMixin(object):
 
         if submission_uuid:
             requirements = self.workflow_requirements()
-            workflow_api.update_from_assessments(submission_uuid, requirements)
+            if only_if_dirty:
+                workflow_api.update_from_assessments_if_dirty(submission_uuid, requirements)
+            else:
+                workflow_api.update_from_assessments(submission_uuid, requirements)
 
     def get_workflow_info(self):
         """